@@ -1,44 +1,27 @@
 import cv2
 import customtkinter as ctk
-from ultralytics import YOLO
-import threading
-import time
+from PIL import Image
+import argparse
 import sys
-from Pathing import navigate_aisles
-try:
-    from Wheel_funcs import init_gpio, stop, cleanup
-    init_gpio()
-except Exception as e:
-    print(f"Error initializing GPIO: {e}")
+import time
+import metrics
+from mission import Mission
+from preprocess import preview_size
+from session_recorder import SessionReplay
 
 
 
 class SodaSelector(ctk.CTk):
-    def __init__(self):
+    """Window around a Mission: camera preview, cart buttons and popups."""
+
+    def __init__(self, record_dir=None, replay=None):
         super().__init__()
         self.title("Autonomous Soda Selector")
         self.geometry("1200x800")
         self.minsize(1000, 700)
         ctk.set_appearance_mode("light")
-        self.cart_lock = threading.Lock()
-        self.navigation_thread = None
-        self.navigation_active = False
-        self.found_items_locations = {}
-
-        self.model = YOLO("runs/detect/train/weights/best.pt")
-        self.cap = None
-        # Initialize camera with retry logic
-        for camera_index in range(2):  # Try both camera 0 and 1
-            try:
-                self.cap = cv2.VideoCapture(camera_index)
-                if self.cap.isOpened():
-                    print(f"Successfully connected to camera {camera_index}")
-                    break
-            except Exception as e:
-                print(f"Failed to open camera {camera_index}: {e}")
-                if self.cap:
-                    self.cap.release()
-                self.cap = None
+        self.mission = Mission(record_dir=record_dir, replay=replay)
+        self.preview_image = None
 
         self.class_colors = {
             'Coke': (0, 0, 255),
@@ -46,20 +29,38 @@ class SodaSelector(ctk.CTk):
             'Pepsi': (255, 0, 0),
             'Fanta': (0, 140, 255)
         }
-        self.confidence_threshold = 0.60
-        self.is_detecting = False
-        self.detection_thread = None
-        self.detection_stopped = threading.Event()
-        self.camera_reconnecting = False  # ADDED
-
-        self.cart = []
-        self.current_index = 0
-        self.current_aisle = 1
-        self.item_aisle_map = {}
 
         self.configure_layout()
+        # Mission events arrive on worker threads; Tk may only be touched from its own thread
+        self.mission.add_listener(lambda event, data: self.after(0, self._on_mission_event, event, data))
+        # Model loading and camera probing happen in the background so the window shows up
+        # right away; "Start Robot Vision" stays disabled until both have finished.
+        self.mission.load()
         self.update_camera_feed()
 
+    def _on_mission_event(self, event, data):
+        if event == "status":
+            self.label_text.set(data["message"])
+        elif event == "ready":
+            if data["error"] is not None:
+                self.label_text.set(f"Model failed to load: {data['error']}")
+                self.start_robot_button.configure(text="Model unavailable")
+            else:
+                self.start_robot_button.configure(state="normal", text="Start Robot Vision")
+        elif event == "cart":
+            self.update_cart_button()
+        elif event == "started":
+            self.start_robot_button.configure(text="Stop Robot Vision")
+        elif event == "item_found":
+            self.show_found_popup(data["item"])
+        elif event == "complete":
+            self.start_robot_button.configure(text="Start Robot Vision")
+            self.show_summary_popup()
+        elif event == "stopped":
+            self.start_robot_button.configure(text="Start Robot Vision")
+        elif event == "search_ended":
+            self.show_end_search_popup()
+
     def configure_layout(self):
         self.grid_columnconfigure(0, weight=1)
         self.grid_rowconfigure(0, weight=5)
@@ -89,8 +90,8 @@ class SodaSelector(ctk.CTk):
         for idx, (name, color) in enumerate(sodas):
             self.create_soda_button(self.button_frame, name, color, idx)
 
-        self.start_robot_button = ctk.CTkButton(self, text="Start Robot Vision", font=("Helvetica", 16),
-                                                command=self.toggle_detection)
+        self.start_robot_button = ctk.CTkButton(self, text="Loading model...", font=("Helvetica", 16),
+                                                command=self.toggle_detection, state="disabled")
         self.start_robot_button.grid(row=3, column=0, padx=20, pady=10, sticky="ew")
 
         self.cart_button = ctk.CTkButton(self, text="View Cart", font=("Helvetica", 14), command=self.view_cart_popup)
@@ -107,251 +108,108 @@ class SodaSelector(ctk.CTk):
         button.grid(row=0, column=column, padx=10, pady=10, sticky="nsew")
 
     def resize_frame(self, frame):
+        # Display only: must be called from the Tk thread since it reads the window size
         screen_width, screen_height = self.winfo_width(), self.winfo_height()
         target_width, target_height = int(screen_width * 0.9), int(screen_height * 0.5)
         h, w, _ = frame.shape
-        if w / h > target_width / target_height:
-            new_width = target_width
-            new_height = int(new_width * h / w)
-        else:
-            new_height = target_height
-            new_width = int(new_height * w / h)
+        new_width, new_height = preview_size(w, h, max(target_width, 1), max(target_height, 1))
         return cv2.resize(frame, (new_width, new_height))
 
+    def show_preview(self, frame, timestamp):
+        display = self.resize_frame(frame)
+        sx = display.shape[1] / frame.shape[1]
+        sy = display.shape[0] / frame.shape[0]
+        for label, conf, (x1, y1, x2, y2) in self.mission.tracked_detections(timestamp):
+            color = self.class_colors.get(label, (255, 255, 255))
+            p1, p2 = (int(x1 * sx), int(y1 * sy)), (int(x2 * sx), int(y2 * sy))
+            cv2.rectangle(display, p1, p2, color, 2)
+            cv2.putText(display, f"{label} {conf:.2f}", (p1[0], max(p1[1] - 5, 10)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+        rgb = cv2.cvtColor(display, cv2.COLOR_BGR2RGB)
+        self.preview_image = ctk.CTkImage(light_image=Image.fromarray(rgb),
+                                          size=(display.shape[1], display.shape[0]))
+        self.camera_frame.configure(image=self.preview_image)
+
     def toggle_detection(self):
-        if self.is_detecting:
-            # Stopping detection
-            self.is_detecting = False
-            self.navigation_active = False  # Stop navigation
+        if self.mission.is_detecting:
             self.start_robot_button.configure(text="Start Robot Vision")
-            self.detection_stopped.set()
-            if self.detection_thread and self.detection_thread.is_alive():
-                self.detection_thread.join()
-            self.detection_thread = None
-            # Stop the motors when detection is stopped
-            stop()
+            self.mission.stop()
         else:
             try:
-                # Try to initialize camera if not already initialized
-                if not self.cap or not self.cap.isOpened():
-                    for camera_index in range(2):
-                        try:
-                            self.cap = cv2.VideoCapture(camera_index)
-                            if self.cap.isOpened():
-                                print(f"Connected to camera {camera_index}")
-                                break
-                        except Exception as e:
-                            print(f"Failed to open camera {camera_index}: {e}")
-                            if self.cap:
-                                self.cap.release()
-                            self.cap = None
-                            continue
-
-                if not self.cap or not self.cap.isOpened():
-                    raise IOError("Could not initialize any camera")
-
-                # Test camera with a single frame read
-                ret, _ = self.cap.read()
-                if not ret:
-                    raise IOError("Camera initialized but cannot read frames")
-
-                # If we get here, camera is working
-                self.is_detecting = True
-                self.navigation_active = True
-                self.start_robot_button.configure(text="Stop Robot Vision")
-                self.detection_stopped.clear()
-
-                # Start threads
-                self.detection_thread = threading.Thread(target=self.detect_objects, daemon=True)
-                self.detection_thread.start()
-
-                self.navigation_thread = threading.Thread(target=lambda: navigate_aisles(self), daemon=True)
-                self.navigation_thread.start()
-
-
-            except Exception as e:
-                print(f"Error starting detection: {e}")
-                self.label_text.set(f"Error starting detection: {e}")
-                self.is_detecting = False
-                self.navigation_active = False
+                self.mission.start()
+            except Exception:
+                # Mission.start() already reported the error and stopped the motors
                 self.start_robot_button.configure(text="Start Robot Vision")
-                stop()  # Ensure motors are stopped if there's an error
-
-    def _run_navigation(self):
-        navigate_aisles()  # This will now return after 3 turns
-        # When navigation is done, stop everything
-        self.is_detecting = False
-        self.navigation_active = False
-        self.after(0, lambda: self.start_robot_button.configure(text="Start Robot Vision"))
-        self.after(0, lambda: self.label_text.set("Navigation complete - three turns made"))
-        stop()
-
-    def _attempt_camera_reconnect(self):
-        print("Attempting to reconnect to camera...")
-        self.camera_reconnecting = True
-
-        if self.detection_thread and self.detection_thread.is_alive():
-            self.detection_stopped.set()
-            self.detection_thread.join()
-            self.detection_stopped.clear()
-
-        if hasattr(self, 'cap') and self.cap is not None:
-            self.cap.release()
-            time.sleep(1)  # Give time for OS to release the camera resource
-
-        try:
-            self.cap = cv2.VideoCapture(0)
-            if not self.cap.isOpened():
-                print("Failed to reconnect to camera.")
-                return False
-            print("Camera reconnected successfully.")
-            return True
-        except Exception as e:
-            print(f"Error during camera reconnection: {e}")
-            self.label_text.set(f"Camera Reconnect Error: {e}")
-            return False
-        finally:
-            self.camera_reconnecting = False
 
     def update_camera_feed(self):
+        mission = self.mission
+        if not mission.camera_probed.is_set():
+            self.after(30, self.update_camera_feed)
+            return
         try:
-            if self.cap is None:
+            if mission.grabber is None:
                 print("Camera is not initialized.  Attempting to reinitialize.")
-                if not self._attempt_camera_reconnect():
+                if not mission.reconnect_camera():
                     self.label_text.set("Camera initialization failed.")
                     self.after(5000, self.update_camera_feed)
                     return
 
-            ret, frame = self.cap.read()
-            if not ret:
+            # Never touch the device from the Tk thread; just look at the newest grabbed frame
+            if not mission.grabber.healthy:
                 print("Error: Couldn't read frame in update_camera_feed.")
-                if not self._attempt_camera_reconnect():
+                if not mission.reconnect_camera():
                     self.label_text.set("Camera read failed.")
                     self.after(5000, self.update_camera_feed)
                     return
+
+            grabbed = mission.grabber.read("preview", timeout=0)
+            if grabbed is not None:
+                started = time.perf_counter()
+                self.show_preview(grabbed.image, grabbed.timestamp)
+                metrics.GUI_UPDATE_SECONDS.observe(time.perf_counter() - started)
         except cv2.error as e:
             print(f"OpenCV error in update_camera_feed: {e}")
             self.label_text.set(f"OpenCV Error: {e}")
-            if not self._attempt_camera_reconnect():
+            if not mission.reconnect_camera():
                 self.after(5000, self.update_camera_feed)
                 return
         except Exception as e:
             print(f"An unexpected error in update_camera_feed: {e}")
             self.label_text.set(f"Update Camera Feed Error: {e}")
-            if not self._attempt_camera_reconnect():
+            if not mission.reconnect_camera():
                 self.after(5000, self.update_camera_feed)
                 return
         finally:
             self.after(30, self.update_camera_feed)
 
-    def detect_objects(self):
-        while self.is_detecting and not self.detection_stopped.is_set():  # Add continuous detection loop
-            try:
-                # Check if cart is empty - if it is, stop everything
-                if not self.cart:
-                    print("Cart is empty - all items found!")
-                    self.is_detecting = False
-                    self.navigation_active = False
-                    self.start_robot_button.configure(text="Start Robot Vision")
-                    stop()  # Stop motors
-                    cleanup()
-                    self.label_text.set(f"All items found! Mission complete!\n{self.found_items_locations}")
-                    self.after(0, self.show_summary_popup)
-                    return
-
-                ret, frame = self.cap.read()
-                if not ret:
-                    self.is_detecting = False
-                    self.label_text.set("Error: Camera feed lost in detection.")
-                    return
-
-                resized_frame = self.resize_frame(frame)
-
-                try:
-                    results = self.model(resized_frame, verbose=False)[0]
-                except Exception as e:
-                    print(f"Model error during detection: {e}")
-                    self.label_text.set(f"Model error during detection: {e}")
-                    self.is_detecting = False
-                    return
-
-                detected_in_frame = set()
-                for box in results.boxes:
-                    conf = box.conf[0]
-                    cls = int(box.cls[0])
-                    label = self.model.names[cls]
-
-                    if conf > self.confidence_threshold:
-                        if label in self.cart and label not in detected_in_frame and not self.camera_reconnecting:
-                            print(f"Detected: {label}, Cart before removal: {self.cart}")
-                            print(f"Removing {label} from cart.")
-                            self.found_items_locations[label] = f"Aisle {self.current_aisle}"
-                            self.after(0, lambda l=label: self.show_found_popup(l))
-                            try:
-                                self.cart.remove(label)
-                                detected_in_frame.add(label)
-                            except ValueError as e:
-                                print(f"Error removing {label} from cart: {e}, Current cart: {self.cart}")
-                                self.label_text.set(f"Error removing item: {e}")
-                            self.update_cart_button()
-                        elif label in detected_in_frame:
-                            print(f"Already processed {label} in this frame.")
-                        elif label not in self.cart:
-                            print(f"{label} not in cart.")
-
-                time.sleep(0.03)  # Small delay to prevent CPU overuse
-
-            except Exception as e:
-                print(f"Camera error: {e}")
-                self.is_detecting = False
-                self.label_text.set("Error during detection process")
-                return
-
-        print("Detection loop ended")
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
-
     def add_to_cart(self, item):
-        with self.cart_lock:
-            if item not in self.cart:
-                self.cart.append(item)
-                self.label_text.set(f"{item} added to cart.")
-            else:
-                self.label_text.set(f"{item} already in cart.")
-        self.update_cart_button()
+        self.mission.add_item(item)
 
     def update_cart_button(self):
-        self.cart_button.configure(text=f"View Cart ({len(self.cart)})")
+        self.cart_button.configure(text=f"View Cart ({len(self.mission.cart)})")
 
     def view_cart_popup(self):
         popup = ctk.CTkToplevel(self)
         popup.title("Your Cart")
         popup.geometry("300x300")
 
-        if not self.cart:
+        if not self.mission.cart:
             ctk.CTkLabel(popup, text="Cart is empty.", font=("Helvetica", 14)).pack(pady=20)
             return
 
         ctk.CTkLabel(popup, text="Tap to remove:", font=("Helvetica", 14)).pack(pady=10)
-        for item in self.cart:
+        for item in list(self.mission.cart):
             ctk.CTkButton(popup, text=f"{item}", command=lambda i=item, p=popup: self.remove_item(i, p)).pack(pady=5)
 
     def remove_item(self, item, popup):
-        print(f"Removing {item} from cart via GUI. Current cart: {self.cart}")
-        if item in self.cart:
-            self.cart.remove(item)
-            self.update_cart_button()
-            popup.destroy()
-            self.view_cart_popup()
+        print(f"Removing {item} from cart via GUI. Current cart: {self.mission.cart}")
+        if not self.mission.remove_item(item):
+            return
+        popup.destroy()
+        self.view_cart_popup()
 
     def on_closing(self):
-        self.is_detecting = False
-        self.detection_stopped.set()
-        if self.detection_thread and self.detection_thread.is_alive():
-            self.detection_thread.join()
-        if hasattr(self, 'cap') and self.cap is not None:
-            self.cap.release()
-        cleanup()
+        self.mission.close()
         self.destroy()
 
     def show_found_popup(self, label):
@@ -389,7 +247,7 @@ class SodaSelector(ctk.CTk):
                      font=("Helvetica", 14, "bold")).grid(row=0, column=1, padx=10, pady=5)
 
         # Add items
-        for row, (item, location) in enumerate(self.found_items_locations.items(), 1):
+        for row, (item, location) in enumerate(self.mission.found_items_locations.items(), 1):
             ctk.CTkLabel(summary_frame, text=item,
                          font=("Helvetica", 12)).grid(row=row, column=0, padx=10, pady=5)
             ctk.CTkLabel(summary_frame, text=location,
@@ -399,11 +257,6 @@ class SodaSelector(ctk.CTk):
         ctk.CTkButton(popup, text="Close",
                       command=popup.destroy).pack(pady=10)
 
-    def update_aisle(self):
-        self.current_aisle += 1
-        print(f"Now in Aisle {self.current_aisle}")
-
-
     def show_end_search_popup(self):
         popup = ctk.CTkToplevel(self)
         popup.title("Search Complete")
@@ -415,9 +268,9 @@ class SodaSelector(ctk.CTk):
                      font=("Helvetica", 24, "bold")).pack(pady=20)
 
         # Message
-        remaining_items = len(self.cart)
+        remaining_items = len(self.mission.cart)
         if remaining_items > 0:
-            items_text = ', '.join(self.cart)
+            items_text = ', '.join(self.mission.cart)
             message = f"Unable to find {remaining_items} item{'s' if remaining_items > 1 else ''}:\n{items_text}"
         else:
             message = "All items have been found!"
@@ -434,7 +287,14 @@ class SodaSelector(ctk.CTk):
 
 
 if __name__ == "__main__":
-    app = SodaSelector()
+    parser = argparse.ArgumentParser(description="Autonomous Soda Selector")
+    parser.add_argument("--record", metavar="DIR", help="record each mission (frames, sensor lines, motor commands)")
+    parser.add_argument("--replay", metavar="DIR", help="replay a recorded mission instead of using the hardware")
+    parser.add_argument("--fast", action="store_true", help="replay as fast as possible instead of in real time")
+    args = parser.parse_args()
+
+    replay = SessionReplay(args.replay, realtime=not args.fast) if args.replay else None
+    app = SodaSelector(record_dir=args.record, replay=replay)
     app.protocol("WM_DELETE_WINDOW", app.on_closing)
     try:
         app.mainloop()
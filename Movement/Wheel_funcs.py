@@ -1,6 +1,13 @@
-import RPi.GPIO as GPIO
+import os
+import sys
 import time
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root, for hal
+import hal
+
+# Real RPi.GPIO on the Pi, FakeGPIO in simulation
+GPIO = hal.gpio()
+
 # Pin setup
 # Right motor driver
 RPWM_R = 23
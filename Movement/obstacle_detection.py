@@ -1,67 +1,55 @@
 # obstacle_detection_file.py
 
-import RPi.GPIO as GPIO
+import os
+import sys
 import time
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root, for hal
+import hal
+from range_sampler import RangeSampler
+
 # === GPIO Pin Setup (CHANGE THESE BASED ON WIRING) ===
 TRIG_PIN = 20  # GPIO pin connected to TRIG of ultrasonic sensor (Adjust if wired differently)
 ECHO_PIN = 21  # GPIO pin connected to ECHO of ultrasonic sensor (Adjust if wired differently)
 
-# === GPIO Setup ===
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(TRIG_PIN, GPIO.OUT)
-GPIO.setup(ECHO_PIN, GPIO.IN)
-
-
-def get_distance():
-    """Measure distance using ultrasonic sensor."""
-
-    # Send a short pulse to trigger the ultrasonic sensor
-    GPIO.output(TRIG_PIN, True)
-    time.sleep(0.00001)  # 10 microseconds pulse (DO NOT change unless sensor manual specifies different)
-    GPIO.output(TRIG_PIN, False)
+# Readings older than this count as no reading (e.g. the sampler thread has died)
+MAX_READING_AGE = 0.5  # seconds
 
-    start_time = time.time()
-    stop_time = time.time()
+# === Sensor Setup ===
+# Real HC-SR04 on the Pi, simulated wall distance otherwise (see hal.py).
+# The sampler measures at a fixed rate on its own thread and keeps a filtered value.
+sensor = hal.create_range_sensor(TRIG_PIN, ECHO_PIN)
+sampler = RangeSampler(sensor).start()
 
-    # Wait for echo start
-    while GPIO.input(ECHO_PIN) == 0:
-        start_time = time.time()
 
-    # Wait for echo end
-    while GPIO.input(ECHO_PIN) == 1:
-        stop_time = time.time()
-
-    # Calculate time difference
-    time_elapsed = stop_time - start_time
-    # Calculate distance (Speed of sound = 34300 cm/s)
-    distance = (time_elapsed * 34300) / 2  # Formula: (time x speed of sound) / 2
-
-    return distance  # Return distance in centimeters
+def get_distance():
+    """Latest filtered distance in centimeters, or None if there's no recent echo."""
+    return sampler.distance_cm(max_age=MAX_READING_AGE)
 
 
 def is_wall_close(threshold=20):
     """
     Returns True if a wall is closer than the threshold distance.
 
+    Doesn't wait for a measurement: it checks the sampler's latest filtered value.
+
     Arguments:
     - threshold: Distance in centimeters to consider "close" (default 20cm)
 
     === CHANGE threshold value during real testing ===
     Example: you may want to adjust to 15 cm or 25 cm based on arena setup
     """
-    try:
-        distance = get_distance()
-        print(f"Measured Distance = {distance:.2f} cm")  # For debugging / optional remove later
-        return distance < threshold
-    except Exception as e:
-        print(f"Ultrasonic sensor error: {e}")
+    distance = get_distance()
+    if distance is None:
         return False
+    return distance < threshold
 
 
 def cleanup():
     """Cleanup GPIO pins."""
-    GPIO.cleanup()
+    sampler.stop()
+    sensor.close()
+    hal.gpio().cleanup()
 
 
 # === Optional: Manual Testing ===
@@ -69,6 +57,7 @@ def cleanup():
 if __name__ == "__main__":
     try:
         while True:
+            print(f"Measured Distance = {get_distance()} cm, {sampler.stats()}")
             if is_wall_close():
                 print("Wall close detected!")
             else:
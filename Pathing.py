@@ -1,37 +1,79 @@
-import time
-import sys
 from Wheel_funcs import forward, turn_left, turn_right, stop, cleanup  # Motor control functions
-import serial
-import customtkinter as ctk
+import clock
+import hal
+import session_recorder
+from config import APPROACH_DISTANCE_CM, RANGE_PERIOD_MS, WALL_DISTANCE_CM
+from range_link import RangeReader
 
-# Initialize Arduino serial connection
-try:
-    arduino = serial.Serial(port="/dev/ttyACM0", baudrate=9600, timeout=1)
-except serial.SerialException as e:
-    print(f"Serial connection failed: {e}")
-    sys.exit(1)
+# Arduino serial connection (a simulated one when running without the robot).
+# None if the port could not be opened; navigate_aisles refuses to run in that case.
+arduino = hal.open_serial()
+# Background reader parsing the Arduino's range frames, started on first use
+_range = None
+
+
+def set_serial(port):
+    """Swap the Arduino connection, e.g. for a replayed session."""
+    global arduino, _range
+    if _range is not None and _range is not arduino:
+        _range.stop()
+    arduino = port
+    _range = None
+
+
+def range_source():
+    """Something with next_reading(timeout): a RangeReader on the port, or the port itself (replay)."""
+    global _range
+    if _range is None and arduino is not None:
+        _range = arduino if hasattr(arduino, "next_reading") else RangeReader(arduino).start()
+    return _range
 
 
 def get_sensor_data():
+    """Newest range reading, or None if the Arduino sent nothing for a few frame periods."""
     try:
-        return arduino.readline().decode().strip()
-    except:
+        reading = range_source().next_reading(timeout=3 * RANGE_PERIOD_MS / 1000.0)
+    except EOFError:
+        raise  # End of a replayed session
+    except Exception as e:
+        print(f"Error reading range sensor: {e}")
         return None
+    # Recorded as the distance in mm, or "" for no reading / no echo
+    has_distance = reading is not None and reading.distance_mm is not None
+    session_recorder.record_sensor_line(str(reading.distance_mm) if has_distance else "")
+    return reading
+
+
+def within(reading, distance_cm):
+    return reading is not None and reading.distance_mm is not None \
+        and reading.distance_mm <= distance_cm * 10
+
+
+def is_wall(reading):
+    return within(reading, WALL_DISTANCE_CM)
+
+
+def is_approaching_wall(reading):
+    """Close enough to the wall to slow down for it."""
+    return within(reading, APPROACH_DISTANCE_CM)
 
 
-def navigate_aisles(app):  # Add app parameter
+# Blocking polling version of the serpentine; Mission runs navigation.NavigationController instead
+def navigate_aisles(app):  # app is the Mission (mission.py) driving this run
     turn_count = 0  # Initialize turn counter
+    if arduino is None:
+        print("No Arduino connection - navigation disabled.")
+        return
     try:
         while True:
             print("Driving forward...")
             forward()
 
             while True:
-                arduino.reset_input_buffer()
-                time.sleep(0.1)
+                # Blocks only until the next range frame, which is at most RANGE_PERIOD_MS old
                 sensor_data = get_sensor_data()
 
-                if sensor_data == "1":
+                if is_wall(sensor_data):
                     print("Wall detected! Performing 180-degree turn...")
                     stop()
                     
@@ -43,33 +85,33 @@ def navigate_aisles(app):  # Add app parameter
                         print("Even aisle — turning LEFT.")
                         # Turn left (180° turn via left)
                         turn_left()
-                        time.sleep(0.5)
+                        clock.sleep(0.5)
                         forward()
-                        time.sleep(2)
+                        clock.sleep(2)
                         turn_left()
-                        time.sleep(0.5)
+                        clock.sleep(0.5)
                     else:
                         print("Odd aisle — turning RIGHT.")
                         # Turn right (180° turn via right)
                         turn_right()
-                        time.sleep(0.5)
+                        clock.sleep(0.5)
                         forward()
-                        time.sleep(1.5)
+                        clock.sleep(1.5)
                         turn_right()
-                        time.sleep(0.5)
+                        clock.sleep(0.5)
 ##############
                     stop()
-                    time.sleep(0.5)
+                    clock.sleep(0.5)
 
                     
-                    # Update aisle number in main application
-                    app.after(0, app.update_aisle)
+                    # Update aisle number in the mission
+                    app.update_aisle()
                     
                     if turn_count >= 3:
                         print("Three turns completed. Stopping navigation.")
                         stop()
-                        # Show end search popup
-                        app.after(0, app.show_end_search_popup)
+                        # Let the mission (and its UI, if any) know the sweep is over
+                        app.end_search()
                         return  # Exit the function
                         
                     break  # Go to next aisle (start the loop again)
@@ -2,18 +2,45 @@
 const int trigPin = 9;
 const int echoPin = 10;
 
+// One frame every 50 ms, whether or not anything is close (see range_link.py):
+//   0xA5 0x5A | seq (uint8) | distance in mm (uint16, little endian) | flags (uint8) | CRC-8
+// The CRC covers seq, distance and flags. Flag bit 0 means no echo came back in time.
+const byte SYNC1 = 0xA5;
+const byte SYNC2 = 0x5A;
+const byte FLAG_NO_ECHO = 0x01;
+const unsigned long PERIOD_MS = 50;
+const unsigned long ECHO_TIMEOUT_US = 25000;  // about 4.3 m, past the sensor's range
+
+byte seq = 0;
+unsigned long nextSend = 0;
+
+byte crc8(const byte *data, byte len) {
+  // CRC-8, polynomial 0x07
+  byte crc = 0;
+  for (byte i = 0; i < len; i++) {
+    crc ^= data[i];
+    for (byte bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
+    }
+  }
+  return crc;
+}
+
 void setup() {
-  // Start the serial monitor at 9600 baud
-  Serial.begin(9600);
-  
+  // 115200 baud: a 7 byte frame takes under 1 ms on the wire
+  Serial.begin(115200);
+
   // Set up the pin modes
   pinMode(trigPin, OUTPUT);
   pinMode(echoPin, INPUT);
 }
 
 void loop() {
-  long duration;
-  float distance;
+  unsigned long now = millis();
+  if ((long)(now - nextSend) < 0) {
+    return;
+  }
+  nextSend = now + PERIOD_MS;
 
   // Clear the trigger pin
   digitalWrite(trigPin, LOW);
@@ -24,16 +51,25 @@ void loop() {
   delayMicroseconds(10);
   digitalWrite(trigPin, LOW);
 
-  // Read the echo pin (returns the time in microseconds)
-  duration = pulseIn(echoPin, HIGH);
-
-  // Convert the duration to distance in cm
-  distance = duration * 0.0343 / 2;
+  // Read the echo pin (returns the time in microseconds, 0 on timeout)
+  unsigned long duration = pulseIn(echoPin, HIGH, ECHO_TIMEOUT_US);
 
-  // Only print if object is within 30 cm
-  if (distance <= 80.0) {
-    Serial.print(1);
+  byte flags = 0;
+  unsigned int distanceMm = 0xFFFF;
+  if (duration == 0) {
+    flags |= FLAG_NO_ECHO;
+  } else {
+    // Speed of sound = 0.343 mm/us, halved for the round trip
+    distanceMm = (unsigned int)(duration * 0.343 / 2);
   }
 
-  delay(100); // Small delay to reduce serial spam
+  byte frame[7];
+  frame[0] = SYNC1;
+  frame[1] = SYNC2;
+  frame[2] = seq++;
+  frame[3] = distanceMm & 0xFF;
+  frame[4] = distanceMm >> 8;
+  frame[5] = flags;
+  frame[6] = crc8(frame + 2, 4);
+  Serial.write(frame, sizeof(frame));
 }
@@ -1,5 +1,8 @@
-import RPi.GPIO as GPIO
 import time
+import hal
+from config import MOTION_PROFILES
+from motion_profile import get_profile, stopping_seconds, timed_move
+from motor_scheduler import MotorPreempted, MotorScheduler, MotorStep
 
 # Pin setup
 # Right motor driver
@@ -18,103 +21,140 @@ L_EN_L = 6
 frequency = 1000  # Hz
 speed = 40  # Duty cycle (0–100)
 
-def init_gpio():
-    GPIO.setmode(GPIO.BCM)
-    all_pins = [RPWM_R, LPWM_R, R_EN_R, L_EN_R,
-                RPWM_L, LPWM_L, R_EN_L, L_EN_L]
-    GPIO.setup(all_pins, GPIO.OUT)
+# Timings of the blocking commands below, at `speed`. With motion profiles the same
+# duty-seconds are covered with ramps, so turns still come out at the same angle.
+TURN_LEFT_SECONDS = 0.85
+TURN_RIGHT_SECONDS = 0.83
+STOP_SETTLE_SECONDS = 0.3
 
-    # PWM initialization
-    global pwm_r_r, pwm_l_r, pwm_r_l, pwm_l_l
-    pwm_r_r = GPIO.PWM(RPWM_R, frequency)
-    pwm_l_r = GPIO.PWM(LPWM_R, frequency)
-    pwm_r_l = GPIO.PWM(RPWM_L, frequency)
-    pwm_l_l = GPIO.PWM(LPWM_L, frequency)
+# Ramped commands (see motion_profile.py), and the profile each command uses by default
+use_profiles = MOTION_PROFILES is not None
+DEFAULT_PROFILES = {"forward": "cruise", "backward": "cruise", "stop": "cruise",
+                    "turn_left": "turn", "turn_right": "turn"}
 
-    pwm_r_r.start(0)
-    pwm_l_r.start(0)
-    pwm_r_l.start(0)
-    pwm_l_l.start(0)
+# Wheel directions (left, right) for each command
+DIRECTIONS = {"forward": (1, 1), "backward": (-1, -1), "stop": (0, 0),
+              "turn_left": (-1, 1),  # Right forward, left backward
+              "turn_right": (1, -1)}  # Right backward, left forward
 
+# Real GPIO on the Pi, FakeGPIO in simulation (see hal.py)
+motors = None
+# Every duty-cycle change goes through the scheduler's thread (see motor_scheduler.py)
+scheduler = None
 
+# What each command leaves the robot doing, for listeners such as the inference scheduler
+MOTION_STATES = {"stop": "stopped", "forward": "forward", "backward": "backward",
+                 "turn_left": "turning", "turn_right": "turning"}
+motion_state = "stopped"
+_motion_listeners = []
 
-# Movement functions
-def stop():
-    for pin in [R_EN_R, L_EN_R, R_EN_L, L_EN_L]:
-        GPIO.output(pin, GPIO.LOW)
-    for pwm in [pwm_r_r, pwm_l_r, pwm_r_l, pwm_l_l]:
-        pwm.ChangeDutyCycle(0)
 
-    time.sleep(0.3)
+def init_gpio():
+    global motors, scheduler
+    motors = hal.create_motors((RPWM_R, LPWM_R, R_EN_R, L_EN_R),
+                               (RPWM_L, LPWM_L, R_EN_L, L_EN_L), frequency)
+    scheduler = MotorScheduler(motors, on_step=lambda step: _set_motion(MOTION_STATES.get(step.name))).start()
+
+
+def add_motion_listener(listener):
+    """listener(state) is called whenever the motion state changes."""
+    _motion_listeners.append(listener)
+
+
+def remove_motion_listener(listener):
+    if listener in _motion_listeners:
+        _motion_listeners.remove(listener)
+
+
+def _set_motion(state):
+    global motion_state
+    if state is None or state == motion_state:
+        return
+    motion_state = state
+    for listener in list(_motion_listeners):
+        listener(state)
+
+
+def command_steps(name, wait=0.0, profile=None):
+    """
+    MotorSteps for one command below followed by `wait` seconds, for building sequences.
+
+    forward/backward with no wait hold until the next sequence. `profile` is a
+    MOTION_PROFILES name; None uses the command's default, or no ramps at all when
+    use_profiles is off.
+    """
+    if name not in DIRECTIONS:
+        raise ValueError(f"Unknown motor command {name!r}")
+    if use_profiles:
+        return _profiled_steps(name, wait, get_profile(profile or DEFAULT_PROFILES[name]))
+    left, right = DIRECTIONS[name]
+    if name in ("forward", "backward"):
+        return [MotorStep(name, left * speed, right * speed, wait or None)]
+    if name == "stop":
+        return [MotorStep("stop", 0, 0, STOP_SETTLE_SECONDS + wait)]
+    seconds = TURN_LEFT_SECONDS if name == "turn_left" else TURN_RIGHT_SECONDS
+    return [MotorStep(name, left * speed, right * speed, seconds),
+            MotorStep("stop", 0, 0, STOP_SETTLE_SECONDS + wait, quiet=True)]
+
+
+def _profiled_steps(name, wait, profile):
+    left, right = DIRECTIONS[name]
+    if name == "stop":
+        # Long enough to ramp down from the profile's top speed, then settle
+        return [MotorStep("stop", 0, 0, stopping_seconds(profile) + STOP_SETTLE_SECONDS + wait, profile=profile)]
+    if name in ("forward", "backward"):
+        if not wait:
+            return [MotorStep(name, left * profile.speed, right * profile.speed, None, profile=profile)]
+        # A timed move covers what `wait` seconds at `speed` did, and ends at rest
+        peak, seconds = timed_move(speed * wait, profile)
+        return [MotorStep(name, left * peak, right * peak, seconds, profile=profile),
+                MotorStep("stop", 0, 0, stopping_seconds(profile, peak), quiet=True, profile=profile)]
+    turn_seconds = TURN_LEFT_SECONDS if name == "turn_left" else TURN_RIGHT_SECONDS
+    peak, seconds = timed_move(speed * turn_seconds, profile)
+    return [MotorStep(name, left * peak, right * peak, seconds, profile=profile),
+            MotorStep("stop", 0, 0, stopping_seconds(profile, peak) + STOP_SETTLE_SECONDS + wait,
+                      quiet=True, profile=profile)]
+
+
+def _run(name):
+    try:
+        scheduler.run(command_steps(name))
+    except MotorPreempted:
+        pass  # Someone else stopped the robot on purpose
 
 
-def forward():
-    GPIO.output(R_EN_R, GPIO.HIGH)
-    GPIO.output(L_EN_R, GPIO.HIGH)
-    GPIO.output(R_EN_L, GPIO.HIGH)
-    GPIO.output(L_EN_L, GPIO.HIGH)
+# Movement functions. forward()/backward() return at once; the others block like they
+# always have, but another thread's stop() now cuts them short.
+def stop():
+    # Preempts whatever is running, which zeroes the motors at once, so there is nothing
+    # left to ramp down: just let the robot settle
+    scheduler.emergency_stop()
+    try:
+        scheduler.run([MotorStep("stop", 0, 0, STOP_SETTLE_SECONDS)])
+    except MotorPreempted:
+        pass
 
-    pwm_r_r.ChangeDutyCycle(speed)
-    pwm_l_r.ChangeDutyCycle(0)
 
-    # REVERSE LEFT MOTOR POLARITY
-    pwm_r_l.ChangeDutyCycle(0)
-    pwm_l_l.ChangeDutyCycle(speed)
+def forward():
+    return scheduler.submit(command_steps("forward"))
 
 
 def backward():
-    GPIO.output(R_EN_R, GPIO.HIGH)
-    GPIO.output(L_EN_R, GPIO.HIGH)
-    GPIO.output(R_EN_L, GPIO.HIGH)
-    GPIO.output(L_EN_L, GPIO.HIGH)
-
-    pwm_r_r.ChangeDutyCycle(0)
-    pwm_l_r.ChangeDutyCycle(speed)
-
-    # REVERSE LEFT MOTOR POLARITY
-    pwm_r_l.ChangeDutyCycle(speed)
-    pwm_l_l.ChangeDutyCycle(0)
+    return scheduler.submit(command_steps("backward"))
 
 
 def turn_left():
-    GPIO.output(R_EN_R, GPIO.HIGH)
-    GPIO.output(L_EN_R, GPIO.HIGH)
-    GPIO.output(R_EN_L, GPIO.HIGH)
-    GPIO.output(L_EN_L, GPIO.HIGH)
-
-    pwm_r_r.ChangeDutyCycle(speed)  # Right forward
-    pwm_l_r.ChangeDutyCycle(0)
-
-    pwm_r_l.ChangeDutyCycle(speed)  # Left backward (reversed)
-    pwm_l_l.ChangeDutyCycle(0)
-
-    time.sleep(0.85)
-    stop()
+    _run("turn_left")
 
 
 def turn_right():
-    GPIO.output(R_EN_R, GPIO.HIGH)
-    GPIO.output(L_EN_R, GPIO.HIGH)
-    GPIO.output(R_EN_L, GPIO.HIGH)
-    GPIO.output(L_EN_L, GPIO.HIGH)
-
-    pwm_r_r.ChangeDutyCycle(0)  # Right backward
-    pwm_l_r.ChangeDutyCycle(speed)
-
-    pwm_r_l.ChangeDutyCycle(0)  # Left forward (reversed)
-    pwm_l_l.ChangeDutyCycle(speed)
-
-    time.sleep(0.83)
-    stop()
+    _run("turn_right")
 
 
 def cleanup():
     stop()
-    pwm_r_r.stop()
-    pwm_l_r.stop()
-    pwm_r_l.stop()
-    pwm_l_l.stop()
-    GPIO.cleanup()
+    scheduler.shutdown()
+    motors.close()
 
 
 # Test routine
@@ -145,9 +185,4 @@ if __name__ == "__main__":
         pass
 
     finally:
-        stop()
-        pwm_r_r.stop()
-        pwm_l_r.stop()
-        pwm_r_l.stop()
-        pwm_l_l.stop()
-        GPIO.cleanup()
+        cleanup()
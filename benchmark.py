@@ -0,0 +1,231 @@
+"""
+Offline detection benchmark: no robot or camera needed.
+
+Replays a video file or an image directory through the mission's own detection
+stages (Mission._preprocess_frame, _run_inference and _handle_detections), so the
+tracker's frame skipping, the inference scheduler, the shelf ROI and the scene gate
+all behave as they do on the robot. Motors, camera and serial link are the simulated
+ones, so nothing moves. Reports the detector's runs per second (inference_fps) and
+the frames per second pushed through the stages (frame_fps, which counts frames the
+detector skipped), per-stage latency percentiles, peak RSS and CPU utilisation, and
+writes them to JSON.
+
+Frames are stamped as if they came from a camera running at --fps, so the
+scheduler and scene gate make the same decisions however fast the machine is.
+Optional stages can be switched off to measure the detector on its own:
+
+    python benchmark.py --source runs/detect/train
+    python benchmark.py --source aisle.mp4 --backend openvino --precision int8 --threads 4
+    python benchmark.py --source aisle.mp4 --every-frame --no-scheduler --no-scene-gate
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import time
+
+from config import (DETECT_EVERY_N_FRAMES, DETECTOR_BACKEND, DETECTOR_PRECISION, MODEL_IMGSZ, SCENE_GATE_MAX_AGE,
+                    SCENE_GATE_SIZE, SCENE_GATE_THRESHOLD, SHELF_ROI, SIM_CAMERA_FPS)
+
+STAGES = ("preprocess", "infer", "postprocess", "total")
+
+
+def set_cpu_threads(threads):
+    """Limit the inference libraries' thread pools. Must run before the detector is created."""
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def percentiles(samples_ms):
+    import numpy as np
+    if not samples_ms:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    values = np.asarray(samples_ms)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3),
+            "mean": round(float(values.mean()), 3)}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_benchmark(source, backend=DETECTOR_BACKEND, precision=DETECTOR_PRECISION, imgsz=MODEL_IMGSZ,
+                  threads=None, cart=None, confidence_threshold=0.60, max_frames=None, warmup=5, loop=False,
+                  roi=SHELF_ROI, scene_gate=SCENE_GATE_THRESHOLD, detect_every=DETECT_EVERY_N_FRAMES,
+                  motion="forward", fps=SIM_CAMERA_FPS, verbose=False):
+    """
+    scene_gate is the gate's threshold (None turns it off), detect_every the tracker's
+    detector cadence (1 for every frame), and motion the state the inference scheduler
+    assumes the robot is in (None runs it at every frame). roi is a fixed band; it is
+    not learned, so every run crops the same way.
+    """
+    if threads:
+        set_cpu_threads(threads)
+
+    # Imported after the thread limits are in place. Mission sets up the motors and the
+    # Arduino link when it is imported and constructed; the benchmark uses the simulated ones.
+    os.environ["SODA_HAL"] = "sim"
+    from detectors import create_detector
+    from frame_grabber import Frame, iter_file_frames
+    from item_index import ItemIndex
+    from mission import Mission
+    from postprocess import CartIndex
+    from preprocess import Letterbox
+    from roi import ShelfROI
+    from scene_gate import SceneChangeGate
+
+    detector = create_detector(backend, precision, imgsz=imgsz)
+    mission = Mission(confidence_threshold=confidence_threshold)
+    mission.detector = detector
+    mission.letterbox = Letterbox(imgsz)
+    mission.shelf_roi = ShelfROI(roi, learn=False)
+    mission.scene_gate = SceneChangeGate(scene_gate, SCENE_GATE_SIZE, SCENE_GATE_MAX_AGE)
+    mission.detect_every = max(1, detect_every)
+    mission.item_index = ItemIndex(None)  # Benchmark sightings stay out of the real index
+    if motion is None:
+        mission.scheduler.rates = {state: None for state in mission.scheduler.rates}
+    else:
+        mission.scheduler.set_motion(motion)
+    mission.cart_index = CartIndex(detector.names)
+    for label in cart or detector.names.values():
+        mission.add_item(label)
+
+    found = {}
+
+    def keep_cart(event, data):
+        # Put found items straight back, so every frame is searched for the whole cart
+        if event == "item_found":
+            found[data["item"]] = found.get(data["item"], 0) + 1
+            with mission.cart_lock:
+                mission.cart.append(data["item"])
+                mission.cart_index.add(data["item"])
+                # Without set_cart_size(), which would also restart the scheduler's cadence
+                mission.scheduler.cart_size = len(mission.cart)
+
+    mission.add_listener(keep_cart)
+    samples = {stage: [] for stage in STAGES}
+    frames = inferred = 0
+    wall_start = cpu_start = None
+    # The mission's own progress messages would bury the results
+    log = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    started = time.monotonic()
+
+    with log:
+        for index, image in enumerate(iter_file_frames(source, loop=loop)):
+            if max_frames is not None and frames >= max_frames:
+                break
+            if index == warmup:
+                wall_start = time.perf_counter()
+                cpu_start = os.times()
+
+            t0 = time.perf_counter()
+            item = mission._preprocess_frame(Frame(index, started + index / fps, image))
+            t1 = t2 = t3 = time.perf_counter()
+            if item is not None:
+                item = mission._run_inference(item)
+                t2 = t3 = time.perf_counter()
+                if item is not None:
+                    mission._handle_detections(item)
+                    t3 = time.perf_counter()
+
+            if index < warmup:
+                continue
+            frames += 1
+            samples["preprocess"].append((t1 - t0) * 1000)
+            samples["total"].append((t3 - t0) * 1000)
+            if t2 > t1:
+                inferred += 1
+                samples["infer"].append((t2 - t1) * 1000)
+                samples["postprocess"].append((t3 - t2) * 1000)
+
+    if not frames:
+        raise ValueError(f"{source} has no frames left after {warmup} warm-up frames")
+
+    wall = time.perf_counter() - wall_start
+    cpu_end = os.times()
+    cpu_seconds = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    cart_labels = sorted(mission.cart_index.names[class_id] for class_id in mission.cart_index.classes)
+    return {
+        "config": {"source": source, "backend": backend, "precision": precision, "imgsz": imgsz,
+                   "threads": threads, "warmup": warmup, "cart": cart_labels, "roi": roi,
+                   "scene_gate": scene_gate, "detect_every": mission.detect_every, "motion": motion,
+                   "fps": fps},
+        "frames": frames,
+        "inferred_frames": inferred,
+        "inference_fps": round(inferred / wall, 2),
+        "frame_fps": round(frames / wall, 2),
+        "latency_ms": {stage: percentiles(samples[stage]) for stage in STAGES},
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        # 100% means one core fully busy
+        "cpu_percent": round(100.0 * cpu_seconds / wall, 1),
+        "cpu_percent_of_machine": round(100.0 * cpu_seconds / wall / (os.cpu_count() or 1), 1),
+        "frames_with_cart_item": found,
+        "scheduler": mission.scheduler.stats(),
+        "scene_gate": mission.scene_gate.stats() if scene_gate is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark soda detection on recorded frames")
+    parser.add_argument("--source", default="runs/detect/train", help="video file or image directory")
+    parser.add_argument("--backend", default=DETECTOR_BACKEND)
+    parser.add_argument("--precision", default=DETECTOR_PRECISION)
+    parser.add_argument("--imgsz", type=int, default=MODEL_IMGSZ)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--cart", nargs="*", default=None, help="labels to look for (default: all classes)")
+    parser.add_argument("--conf", type=float, default=0.60)
+    parser.add_argument("--frames", type=int, default=None, help="stop after this many timed frames")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--loop", action="store_true", help="loop the source until --frames is reached")
+    parser.add_argument("--roi", type=float, nargs=4, default=SHELF_ROI, metavar=("X0", "Y0", "X1", "Y1"),
+                        help="only infer on this band of each frame, as fractions (default SHELF_ROI)")
+    parser.add_argument("--full-frame", action="store_true", help="infer on the whole frame")
+    parser.add_argument("--scene-gate", type=float, default=SCENE_GATE_THRESHOLD, metavar="THRESHOLD",
+                        help="skip inference on frames that changed less than this (mean abs diff, 0-255)")
+    parser.add_argument("--no-scene-gate", action="store_true")
+    parser.add_argument("--every-frame", action="store_true",
+                        help="run the detector on every frame instead of every DETECT_EVERY_N_FRAMES")
+    parser.add_argument("--motion", default="forward", help="motion state the inference scheduler assumes")
+    parser.add_argument("--no-scheduler", action="store_true", help="don't limit the inference rate")
+    parser.add_argument("--fps", type=float, default=SIM_CAMERA_FPS, help="camera rate the frames are stamped at")
+    parser.add_argument("--verbose", action="store_true", help="show the mission's own log")
+    parser.add_argument("--out", default=None, help="JSON output path")
+    args = parser.parse_args()
+    if args.loop and args.frames is None:
+        parser.error("--loop needs --frames")
+
+    result = run_benchmark(args.source, args.backend, args.precision, args.imgsz, args.threads, args.cart,
+                           args.conf, args.frames, args.warmup, args.loop,
+                           None if args.full_frame else args.roi,
+                           None if args.no_scene_gate else args.scene_gate,
+                           1 if args.every_frame else DETECT_EVERY_N_FRAMES,
+                           None if args.no_scheduler else args.motion, args.fps, args.verbose)
+
+    out = args.out or os.path.join(
+        "runs", "benchmark",
+        f"{args.backend}_{args.precision}_{args.imgsz}_t{args.threads or 'auto'}_{int(time.time())}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    latency = result["latency_ms"]
+    print(f"{result['inference_fps']} inferences/s ({result['inferred_frames']} of {result['frames']} frames inferred, "
+          f"{result['frame_fps']} frames/s through the stages), peak RSS {result['peak_rss_mb']} MB, "
+          f"CPU {result['cpu_percent']}%")
+    for stage in STAGES:
+        print(f"  {stage:<12} p50 {latency[stage]['p50']:8.2f} ms  p95 {latency[stage]['p95']:8.2f} ms  "
+              f"p99 {latency[stage]['p99']:8.2f} ms")
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import asyncio
+import threading
+import time
+
+# Time source for the navigation and motor code.
+# Normally this is just time.monotonic()/time.sleep(). Replay sets the scale to 0
+# so recorded missions can run as fast as possible; tests can use a fraction.
+_time_scale = 1.0
+_lock = threading.Lock()
+
+
+def set_time_scale(scale):
+    global _time_scale
+    with _lock:
+        _time_scale = max(0.0, float(scale))
+
+
+def time_scale():
+    return _time_scale
+
+
+def monotonic():
+    return time.monotonic()
+
+
+def sleep(seconds):
+    scaled = seconds * _time_scale
+    if scaled > 0:
+        time.sleep(scaled)
+
+
+async def async_sleep(seconds):
+    """sleep() for asyncio code: scaled the same way, and cancellable."""
+    await asyncio.sleep(seconds * _time_scale)
@@ -0,0 +1,102 @@
+# Shared settings for the vision side of the robot.
+# Change these here instead of hunting through Main.py.
+
+# Trained weights and the input size they were trained at (imgsz in runs/detect/train/args.yaml)
+MODEL_WEIGHTS = "runs/detect/train/weights/best.pt"
+MODEL_IMGSZ = 640
+
+# Grey used by YOLO for letterbox padding
+LETTERBOX_PAD_VALUE = 114
+
+# Inference backend: "torch", "onnx", "openvino" or "ncnn", and "fp32", "fp16" or "int8".
+# Anything other than torch/fp32 has to be produced first with export_model.py.
+DETECTOR_BACKEND = "torch"
+DETECTOR_PRECISION = "fp32"
+EXPORT_DIR = "runs/detect/train/weights"
+
+# Hardware: "auto" (Pi backend if RPi.GPIO imports, else simulation), "pi" or "sim".
+# The SODA_HAL environment variable overrides this.
+HAL_BACKEND = "auto"
+ARDUINO_PORT = "/dev/ttyACM0"
+ARDUINO_BAUDRATE = 115200  # Must match Serial.begin() in UltraSonicToRobot.cpp
+RANGE_PERIOD_MS = 50  # The Arduino sends one range frame this often (see range_link.py)
+WALL_DISTANCE_CM = 80  # Navigation treats anything this close as the end of the aisle
+APPROACH_DISTANCE_CM = 120  # and slows from the cruise to the approach profile this close
+
+# Store layout (see store_map.py): aisles, their lengths and how they connect. Navigation
+# plans the cheapest route through the aisles that may still hold cart items.
+STORE_MAP_FILE = "store_map.json"
+
+# Item-location index (see item_index.py): where products were seen on earlier missions, so a
+# mission goes straight to those aisles. Sightings count for their detection confidence, halved
+# every ITEM_INDEX_HALF_LIFE_DAYS, and are ignored once they decay below ITEM_INDEX_MIN_SCORE.
+ITEM_INDEX_FILE = "runs/item_locations.jsonl"
+ITEM_INDEX_HALF_LIFE_DAYS = 7.0
+ITEM_INDEX_MIN_SCORE = 0.2
+
+# Predictive braking (see wall_estimator.py): an alpha-beta filter tracks the distance to the
+# wall and the closing speed, and navigation starts ramping down early enough to come to rest
+# WALL_STANDOFF_CM from the wall, straight from cruise speed. With PREDICTIVE_BRAKING off it
+# slows to "approach" at APPROACH_DISTANCE_CM and brakes at WALL_DISTANCE_CM instead.
+PREDICTIVE_BRAKING = True
+WALL_STANDOFF_CM = 80
+WALL_ESTIMATOR_ALPHA = 0.5
+WALL_ESTIMATOR_BETA = 0.2
+
+# Motion profiles (see motion_profile.py): top speed as a duty cycle (0-100), and ramp rates in
+# duty per second. Wheel_funcs drives aisles with "cruise", slows to "approach" near the wall
+# and turns with "turn". None jumps straight to Wheel_funcs.speed like the old commands.
+MOTION_PROFILES = {
+    "cruise": {"speed": 70, "accel": 120, "decel": 160},
+    "approach": {"speed": 35, "accel": 120, "decel": 160},
+    "turn": {"speed": 40, "accel": 200, "decel": 200},
+}
+MOTION_TICK_HZ = 50  # duty-cycle updates per second while ramping
+
+# GPIO ultrasonic sensor (Movement/obstacle_detection.py), sampled by range_sampler.py
+ULTRASONIC_RATE_HZ = 20
+ULTRASONIC_TIMEOUT_S = 0.025  # no echo by then means nothing in range (about 4.3 m)
+ULTRASONIC_WINDOW = 5  # samples in the median filter's ring buffer
+ULTRASONIC_VALID_CM = (2, 400)  # the HC-SR04's range; anything outside it is a bad echo
+ULTRASONIC_OUTLIER_CM = 15  # samples this far from the window's median are left out
+
+# Simulated hardware (HAL_BACKEND = "sim")
+SIM_CAMERA_SOURCE = "runs/detect/train"  # video file or image directory played as the camera
+SIM_CAMERA_FPS = 30
+SIM_CAMERA_SIZE = (640, 480)
+SIM_AISLE_LENGTH_CM = 300
+
+# Multi-frame tracking: run the detector on every Nth frame and only count an item as found
+# once its track has been matched on TRACK_CONFIRM_HITS detector frames.
+DETECT_EVERY_N_FRAMES = 2
+TRACK_CONFIRM_HITS = 3
+TRACK_MAX_MISSES = 3  # detector frames without a match before a track is dropped
+TRACK_IOU_THRESHOLD = 0.3
+
+# Adaptive inference rate (detector runs per second) by motion state, see inference_scheduler.py.
+# 0 pauses inference; while an unconfirmed cart item is being tracked the rate is raised to
+# INFERENCE_BOOST_RATE (None = every frame the tracker cadence allows) for INFERENCE_BOOST_SECONDS.
+INFERENCE_RATES = {"forward": 8.0, "backward": 4.0, "stopped": 3.0, "turning": 0.0}
+INFERENCE_BOOST_RATE = None
+INFERENCE_BOOST_SECONDS = 1.0
+
+# Shelf region of interest: only this band of the frame is sent to the detector (see roi.py).
+# (x0, y0, x1, y1) as fractions of the frame, or None to start from the whole frame. With
+# SHELF_ROI_LEARN the band is fitted to where past detections were, and kept in SHELF_ROI_FILE.
+SHELF_ROI = None
+SHELF_ROI_LEARN = True
+SHELF_ROI_FILE = "runs/shelf_roi.json"
+SHELF_ROI_MARGIN = 0.05
+SHELF_ROI_FULL_FRAME_EVERY = 10  # every Nth inference still sees the whole frame
+
+# Scene-change gating (see scene_gate.py): skip inference while the mean absolute difference
+# (0-255) from the last inferred frame stays below SCENE_GATE_THRESHOLD. None disables it.
+SCENE_GATE_THRESHOLD = 4.0
+SCENE_GATE_SIZE = (64, 48)  # thumbnail (width, height) the comparison runs on
+SCENE_GATE_MAX_AGE = 1.0  # seconds; infer at least this often anyway
+
+# Metrics (see metrics.py): Prometheus text format on http://METRICS_HOST:METRICS_PORT/metrics,
+# and a summary in the log every METRICS_LOG_SECONDS while detecting. None turns either off.
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+METRICS_LOG_SECONDS = 30
@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import deque
+
+import metrics
+
+
+class LatestQueue:
+    """
+    Bounded queue with a "latest frame wins" policy.
+
+    put() never blocks: when the queue is full the oldest item is evicted and handed
+    to `on_drop` (so e.g. its buffer can be given back), and the drop is counted.
+    """
+
+    def __init__(self, maxsize=1, on_drop=None, name=None):
+        self.maxsize = maxsize
+        self.name = name  # Drops are also counted in metrics.QUEUE_DROPPED under this name
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        with self._cond:
+            while len(self._items) >= self.maxsize:
+                evicted = self._items.popleft()
+                self.dropped += 1
+                if self.name is not None:
+                    metrics.QUEUE_DROPPED.inc(queue=self.name)
+                if self.on_drop:
+                    self.on_drop(evicted)
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=0.5):
+        """Oldest queued item, or None on timeout / after close()."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            while self._items and self.on_drop:
+                self.on_drop(self._items.popleft())
+            self._items.clear()
+            self._cond.notify_all()
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.processed = 0
+        self.busy_time = 0.0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.processed += 1
+            self.busy_time += seconds
+        metrics.STAGE_SECONDS.observe(seconds, stage=self.name)
+
+    def fps(self):
+        elapsed = time.monotonic() - self.started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def mean_ms(self):
+        return 1000.0 * self.busy_time / self.processed if self.processed else 0.0
+
+    def as_dict(self):
+        return {"processed": self.processed, "fps": round(self.fps(), 2), "mean_ms": round(self.mean_ms(), 2)}
+
+
+class DetectionPipeline:
+    """
+    capture -> preprocess -> infer -> postprocess, each stage on its own worker thread.
+
+    Capture is the FrameGrabber thread; the other three stages are callables:
+      preprocess(frame) -> item, infer(item) -> item, postprocess(item) -> None.
+    A stage may return None to skip the frame. Stages are joined by LatestQueues, so
+    when inference falls behind old frames are dropped instead of queueing up latency.
+    `release` is called with any preprocessed item that is dropped before inference.
+    """
+
+    def __init__(self, grabber, preprocess, infer, postprocess, release=None, reader="detection", queue_size=1):
+        self.grabber = grabber
+        self.reader = reader
+        self.release = release
+        self._stage_funcs = [("preprocess", preprocess), ("infer", infer), ("postprocess", postprocess)]
+        self.queues = {
+            "infer": LatestQueue(queue_size, on_drop=release, name="infer"),
+            "postprocess": LatestQueue(queue_size, name="postprocess"),
+        }
+        self.stats = {name: StageStats(name) for name, _ in self._stage_funcs}
+        self.error = None  # (stage name, exception) of the first failure
+        self._running = False
+        self._threads = []
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self):
+        self._running = True
+        for stats in self.stats.values():
+            stats.started = time.monotonic()
+        for index, (name, func) in enumerate(self._stage_funcs):
+            thread = threading.Thread(target=self._worker, args=(index, name, func),
+                                      name=f"pipeline-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._running = False
+        for queue in self.queues.values():
+            queue.close()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=5.0)
+        self._threads = []
+
+    def step(self, timeout=0.5):
+        """
+        Push one frame through every stage on the calling thread, with no queues and no drops.
+
+        Used instead of start() for deterministic replay. Returns False when no frame arrived.
+        """
+        item = self.grabber.read(self.reader, timeout=timeout)
+        if item is None:
+            return False
+        for name, func in self._stage_funcs:
+            start = time.perf_counter()
+            try:
+                item = func(item)
+            except Exception as e:
+                print(f"Detection pipeline error in {name}: {e}")
+                if self.error is None:
+                    self.error = (name, e)
+                return True
+            self.stats[name].record(time.perf_counter() - start)
+            if item is None:
+                break
+        return True
+
+    def _next_input(self, name):
+        if name == "preprocess":
+            return self.grabber.read(self.reader, timeout=0.5)
+        return self.queues[name].get(timeout=0.5)
+
+    def _worker(self, index, name, func):
+        next_stage = self._stage_funcs[index + 1][0] if index + 1 < len(self._stage_funcs) else None
+        while self._running:
+            item = self._next_input(name)
+            if item is None:
+                continue
+            start = time.perf_counter()
+            try:
+                result = func(item)
+            except Exception as e:
+                print(f"Detection pipeline error in {name}: {e}")
+                if self.error is None:
+                    self.error = (name, e)
+                self._running = False
+                return
+            self.stats[name].record(time.perf_counter() - start)
+            if result is not None and next_stage:
+                if self._running:
+                    self.queues[next_stage].put(result)
+                elif self.release and next_stage == "infer":
+                    self.release(result)
+
+    def throughput(self):
+        stats = {name: s.as_dict() for name, s in self.stats.items()}
+        if self.grabber is not None:
+            grabber_stats = self.grabber.stats()
+            stats["capture"] = {
+                "captured": grabber_stats["captured"],
+                "dropped": grabber_stats["readers"].get(self.reader, {}).get("dropped", 0),
+            }
+        stats["queue_drops"] = {name: q.dropped for name, q in self.queues.items()}
+        return stats
+
+    def report(self):
+        stats = self.throughput()
+        stages = " | ".join(f"{name} {stats[name]['fps']:.1f} fps ({stats[name]['mean_ms']:.1f} ms)"
+                            for name, _ in self._stage_funcs)
+        capture = stats.get("capture", {})
+        print(f"Detection pipeline: {stages} | capture dropped {capture.get('dropped', 0)}"
+              f" | queue drops {stats['queue_drops']}")
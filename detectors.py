@@ -0,0 +1,85 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from config import DETECTOR_BACKEND, DETECTOR_PRECISION, EXPORT_DIR, LETTERBOX_PAD_VALUE, MODEL_IMGSZ, MODEL_WEIGHTS
+
+# What every backend returns for one image, in model-input pixel coordinates:
+# xyxy (N, 4) float32, conf (N,) float32, cls (N,) int
+Detections = namedtuple("Detections", ["xyxy", "conf", "cls"])
+
+BACKENDS = ("torch", "onnx", "openvino", "ncnn")
+PRECISIONS = ("fp32", "fp16", "int8")
+
+
+def artifact_path(backend, precision="fp32", weights=MODEL_WEIGHTS, export_dir=EXPORT_DIR):
+    """Where export_model.py puts (and create_detector looks for) a backend's model files."""
+    if backend == "torch":
+        return weights
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    if backend == "onnx":
+        return os.path.join(export_dir, f"{stem}_{precision}.onnx")
+    if backend in ("openvino", "ncnn"):
+        # Ultralytics recognises these formats by the directory suffix
+        return os.path.join(export_dir, f"{stem}_{precision}_{backend}_model")
+    raise ValueError(f"Unknown detector backend: {backend}")
+
+
+class Detector:
+    """
+    Common interface for all inference backends.
+
+    predict() takes a letterboxed BGR image of size imgsz x imgsz and an optional list
+    of class ids to keep (applied inside NMS) and returns Detections.
+    """
+
+    backend = None
+
+    def __init__(self, path, imgsz=MODEL_IMGSZ):
+        self.path = path
+        self.imgsz = imgsz
+        self.names = {}
+
+    def predict(self, image, classes=None):
+        raise NotImplementedError
+
+    def warmup(self):
+        """Run one dummy inference so graph setup isn't paid for by the first real frame."""
+        self.predict(np.full((self.imgsz, self.imgsz, 3), LETTERBOX_PAD_VALUE, dtype=np.uint8))
+
+
+class UltralyticsDetector(Detector):
+    """
+    Runs any format Ultralytics can load: a .pt through PyTorch, a .onnx through
+    ONNX Runtime, and *_openvino_model / *_ncnn_model directories through OpenVINO
+    and NCNN. NMS and class filtering are the same code for all of them.
+    """
+
+    def __init__(self, path, imgsz=MODEL_IMGSZ, backend="torch"):
+        super().__init__(path, imgsz)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No {backend} model at {path}; run export_model.py first")
+        # Imported here so the GUI can come up before ultralytics/torch finish importing
+        from ultralytics import YOLO
+        self.backend = backend
+        self.model = YOLO(path, task="detect")
+        self.names = dict(self.model.names)
+
+    def predict(self, image, classes=None):
+        results = self.model(image, imgsz=self.imgsz, classes=classes or None, verbose=False)[0]
+        boxes = results.boxes
+        return Detections(
+            boxes.xyxy.cpu().numpy().astype(np.float32),
+            boxes.conf.cpu().numpy().astype(np.float32),
+            boxes.cls.cpu().numpy().astype(int),
+        )
+
+
+def create_detector(backend=DETECTOR_BACKEND, precision=DETECTOR_PRECISION, imgsz=MODEL_IMGSZ,
+                    weights=MODEL_WEIGHTS):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend {backend!r}, expected one of {BACKENDS}")
+    path = artifact_path(backend, precision, weights)
+    print(f"Loading {backend} ({precision}) detector from {path}")
+    return UltralyticsDetector(path, imgsz=imgsz, backend=backend)
@@ -0,0 +1,92 @@
+"""
+Export the trained weights for the CPU inference backends in detectors.py.
+
+    python export_model.py                              # every backend/precision we can build
+    python export_model.py --backends onnx openvino --precisions fp32 int8
+    python export_model.py --data path/to/data.yaml     # calibration data for OpenVINO INT8
+
+Artifacts are written next to the weights with the names create_detector() expects.
+"""
+import argparse
+import os
+import shutil
+
+from config import EXPORT_DIR, MODEL_IMGSZ, MODEL_WEIGHTS
+from detectors import PRECISIONS, artifact_path
+
+EXPORT_BACKENDS = ("onnx", "openvino", "ncnn")
+
+# (backend, precision) pairs Ultralytics cannot produce directly; ONNX ones are converted below
+UNSUPPORTED = {("ncnn", "int8")}
+
+
+def _move(src, dst):
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    elif os.path.exists(dst):
+        os.remove(dst)
+    shutil.move(src, dst)
+    return dst
+
+
+def export_onnx(model, precision, imgsz, weights):
+    fp32_path = artifact_path("onnx", "fp32", weights)
+    if precision == "fp32" or not os.path.exists(fp32_path):
+        exported = model.export(format="onnx", imgsz=imgsz, dynamic=False, simplify=True)
+        _move(exported, fp32_path)
+    if precision == "fp32":
+        return fp32_path
+
+    target = artifact_path("onnx", precision, weights)
+    if precision == "fp16":
+        # Ultralytics only exports FP16 ONNX on a GPU, so convert the FP32 graph instead
+        import onnx
+        from onnxconverter_common import float16
+        model_fp16 = float16.convert_float_to_float16(onnx.load(fp32_path), keep_io_types=True)
+        onnx.save(model_fp16, target)
+    else:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, target, weight_type=QuantType.QUInt8)
+    return target
+
+
+def export_backend(model, backend, precision, imgsz, weights, data=None):
+    if backend == "onnx":
+        return export_onnx(model, precision, imgsz, weights)
+    kwargs = {"format": backend, "imgsz": imgsz, "half": precision == "fp16", "int8": precision == "int8"}
+    if precision == "int8" and data:
+        kwargs["data"] = data
+    exported = model.export(**kwargs)
+    return _move(exported, artifact_path(backend, precision, weights))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export YOLO weights for CPU inference backends")
+    parser.add_argument("--weights", default=MODEL_WEIGHTS)
+    parser.add_argument("--imgsz", type=int, default=MODEL_IMGSZ)
+    parser.add_argument("--backends", nargs="+", choices=EXPORT_BACKENDS, default=list(EXPORT_BACKENDS))
+    parser.add_argument("--precisions", nargs="+", choices=PRECISIONS, default=list(PRECISIONS))
+    parser.add_argument("--data", default=None, help="dataset yaml used to calibrate INT8 exports")
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+
+    for backend in args.backends:
+        for precision in args.precisions:
+            if (backend, precision) in UNSUPPORTED:
+                print(f"Skipping {backend} {precision}: not supported by this exporter")
+                continue
+            # A fresh model per export; Ultralytics mutates it while exporting
+            model = YOLO(args.weights, task="detect")
+            try:
+                path = export_backend(model, backend, precision, args.imgsz, args.weights, args.data)
+                print(f"Exported {backend} {precision}: {path}")
+            except ImportError as e:
+                print(f"Skipping {backend} {precision}: missing dependency ({e})")
+            except Exception as e:
+                print(f"Export of {backend} {precision} failed: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+"""
+Several robots searching one store.
+
+FleetCoordinator listens on a local TCP socket. Robots connect and talk to it in JSON
+lines, one message per line:
+
+    robot -> coordinator
+        {"type": "hello", "robot": name}
+        {"type": "driving", "aisle": n}          started down an aisle
+        {"type": "searched", "aisle": n}         reached the wall at the end of it
+        {"type": "found", "item": label, "aisle": n}
+        {"type": "idle", "at": [aisle, end]}     nothing left in its assignment, can take more
+        {"type": "done"}                         stopped for good
+    coordinator -> robot
+        {"type": "assign", "aisles": [...], "cart": [...]}
+        {"type": "finish"}
+
+Once every expected robot has said hello, the aisles that may stock a cart item are split
+into contiguous blocks, one per robot, so that the longest planned route is as short
+as possible. After that the coordinator keeps the assignments current: an item found
+by one robot leaves everybody's cart, an aisle searched by anyone (even on the way
+somewhere else) leaves everybody's list, and a robot that runs out of work takes an
+aisle from the robot with the most left. The mission is over when the cart is empty
+or no robot has anything left to search.
+
+SimRobot drives the store map in simulated time against a known item layout, and
+FleetClient connects a real Mission. Running this file benchmarks completion time
+against the number of simulated robots, or with --serve coordinates real ones:
+
+    python fleet.py --cart Coke Pepsi Fanta Sprite --robots 1 2 3 4 --trials 5
+    python fleet.py --serve --port 8765 --robots 2 --cart Coke Sprite
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import socket
+import threading
+import time
+
+from store_map import StoreMap
+
+
+def _encode(message):
+    return (json.dumps(message) + "\n").encode()
+
+
+class _Robot:
+    def __init__(self, name, writer):
+        self.name = name
+        self.writer = writer
+        self.aisles = set()
+        self.sent = None  # (aisles, cart) last sent, to skip repeats
+        self.driving = None
+        self.at_wall = None
+        self.idle = False
+        self.done = False
+        self.searched = []
+        self.found = []
+
+
+class FleetCoordinator:
+    def __init__(self, store_map, cart, robots, host="127.0.0.1", port=0):
+        self.store_map = store_map
+        self.expected = robots
+        self.host = host
+        self.port = port
+        self.remaining = list(cart)
+        self.unsearched = set(store_map.aisles)
+        self.found = {}  # item -> {"aisle", "robot", "seconds"}
+        self.robots = {}
+        self.started = None
+        self.seconds = None
+        self._server = None
+        self._all_connected = None
+        self._done = None
+        self._handlers = set()
+        self._cost_cache = {}
+
+    async def start(self):
+        self._all_connected = asyncio.Event()
+        self._done = asyncio.Event()
+        self._server = await asyncio.start_server(self._client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def run(self, timeout=None):
+        """Wait for the robots, hand out the work and return results() once it is all done."""
+        if self._server is None:
+            await self.start()
+        await self._all_connected.wait()
+        self.started = time.monotonic()
+        self._assign_initial()
+        try:
+            await asyncio.wait_for(self._done.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Fleet: timed out after {timeout} s")
+        self.seconds = time.monotonic() - self.started
+        for robot in self.robots.values():
+            await self._send(robot, {"type": "finish"})
+            robot.writer.close()
+        self._server.close()
+        # Closing the connections ends their handlers
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self._server.wait_closed()
+        return self.results()
+
+    # --- planning -----------------------------------------------------------
+
+    def _needed(self):
+        """Aisles still worth searching for what is left in the cart."""
+        if not self.remaining:
+            return set()
+        return {aisle for aisle in self.unsearched if self.store_map.may_stock(aisle, self.remaining)}
+
+    def _route_cost(self, aisles, at_wall=None):
+        key = (tuple(sorted(aisles)), at_wall)
+        if key not in self._cost_cache:
+            route = self.store_map.plan(aisles, at_wall)
+            self._cost_cache[key] = float("inf") if route is None else sum(leg.cost_cm for leg in route)
+        return self._cost_cache[key]
+
+    def partition(self, aisles, robots):
+        """Split `aisles` into at most `robots` contiguous blocks with the shortest longest route."""
+        aisles = sorted(aisles)
+        count = min(robots, len(aisles))
+        if count == 0:
+            return [[] for _ in range(robots)]
+        best, best_cost = None, float("inf")
+        for cuts in itertools.combinations(range(1, len(aisles)), count - 1):
+            bounds = (0,) + cuts + (len(aisles),)
+            blocks = [aisles[a:b] for a, b in zip(bounds, bounds[1:])]
+            cost = max(self._route_cost(block) for block in blocks)
+            if cost < best_cost:
+                best, best_cost = blocks, cost
+        return best + [[] for _ in range(robots - count)]
+
+    def _assign_initial(self):
+        robots = list(self.robots.values())
+        blocks = self.partition(self._needed(), len(robots))
+        for robot, block in zip(robots, blocks):
+            robot.aisles = set(block)
+            print(f"Fleet: {robot.name} gets aisles {block}")
+        self._update()
+
+    def _update(self):
+        """Bring every robot's assignment up to date, rebalance, and notice when we're done."""
+        needed = self._needed()
+        for robot in self.robots.values():
+            robot.aisles &= needed
+        # Work nobody is assigned any more (e.g. a robot that stopped) goes to an idle robot
+        unassigned = needed - set().union(*(robot.aisles for robot in self.robots.values() if not robot.done))
+        for robot in self.robots.values():
+            if robot.idle and not robot.done and unassigned:
+                robot.aisles |= unassigned
+                robot.idle = False
+                unassigned = set()
+        for robot in self.robots.values():
+            if robot.idle and not robot.done and not robot.aisles:
+                self._steal_for(robot)
+        for robot in self.robots.values():
+            if not robot.done:
+                self._send_soon(robot, {"type": "assign", "aisles": sorted(robot.aisles), "cart": list(self.remaining)})
+        active = [robot for robot in self.robots.values() if not robot.done]
+        if not self.remaining or not needed or all(robot.idle and not robot.aisles for robot in active):
+            self._done.set()
+
+    def _steal_for(self, robot):
+        # Only from a robot with more than the aisle it may be driving right now
+        donors = [other for other in self.robots.values()
+                  if other is not robot and not other.done and len(other.aisles) >= 2]
+        if not donors:
+            return
+        donor = max(donors, key=lambda other: self._route_cost(other.aisles, other.at_wall))
+        candidates = donor.aisles - {donor.driving}
+        aisle = min(candidates, key=lambda candidate: self._route_cost({candidate}, robot.at_wall))
+        donor.aisles.discard(aisle)
+        robot.aisles.add(aisle)
+        robot.idle = False
+        print(f"Fleet: aisle {aisle} moves from {donor.name} to {robot.name}")
+
+    # --- connections --------------------------------------------------------
+
+    def _send_soon(self, robot, message):
+        if message["type"] == "assign":
+            key = (message["aisles"], message["cart"])
+            if key == robot.sent:
+                return
+            robot.sent = key
+        asyncio.ensure_future(self._send(robot, message))
+
+    async def _send(self, robot, message):
+        try:
+            robot.writer.write(_encode(message))
+            await robot.writer.drain()
+        except (ConnectionError, RuntimeError):
+            pass  # The robot went away; handled by _client
+
+    async def _client(self, reader, writer):
+        robot = None
+        self._handlers.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message["type"] == "hello":
+                    robot = _Robot(message["robot"], writer)
+                    self.robots[robot.name] = robot
+                    print(f"Fleet: {robot.name} connected ({len(self.robots)}/{self.expected})")
+                    if len(self.robots) >= self.expected:
+                        self._all_connected.set()
+                elif robot is not None:
+                    self._handle(robot, message)
+        except (ConnectionError, ValueError) as e:
+            print(f"Fleet: connection error from {robot.name if robot else 'a robot'}: {e}")
+        finally:
+            if robot is not None and not robot.done:
+                robot.done = True
+                if self.started is not None and not self._done.is_set():
+                    self._update()
+            writer.close()
+            self._handlers.discard(asyncio.current_task())
+
+    def _handle(self, robot, message):
+        kind = message["type"]
+        if kind == "driving":
+            robot.driving = message["aisle"]
+            robot.idle = False
+            return
+        if kind == "searched":
+            aisle = message["aisle"]
+            robot.searched.append(aisle)
+            robot.driving = None
+            self.unsearched.discard(aisle)
+        elif kind == "found":
+            item = message["item"]
+            if item in self.remaining:
+                self.remaining.remove(item)
+                self.found[item] = {"aisle": message["aisle"], "robot": robot.name,
+                                    "seconds": round(time.monotonic() - self.started, 3)}
+                robot.found.append(item)
+                print(f"Fleet: {robot.name} found {item} in aisle {message['aisle']}")
+        elif kind == "idle":
+            robot.idle = True
+            robot.driving = None
+            robot.at_wall = tuple(message["at"]) if message.get("at") else None
+        elif kind == "done":
+            robot.done = True
+        if self.started is not None:
+            self._update()
+
+    def results(self):
+        return {"seconds": None if self.seconds is None else round(self.seconds, 3),
+                "found": self.found, "remaining": list(self.remaining),
+                "unsearched": sorted(self.unsearched),
+                "robots": {robot.name: {"searched": robot.searched, "found": robot.found}
+                           for robot in self.robots.values()}}
+
+
+class SimRobot:
+    """
+    A robot that drives the store map in simulated time.
+
+    Each leg of its route takes cost_cm / speed_cm_s seconds, times time_scale, and
+    at the end of an aisle it finds whatever cart items `layout` (aisle -> items) puts there.
+    """
+
+    def __init__(self, name, store_map, layout, address, speed_cm_s=50.0, time_scale=1.0):
+        self.name = name
+        self.store_map = store_map
+        self.layout = layout
+        self.address = address
+        self.speed_cm_s = speed_cm_s
+        self.time_scale = time_scale
+        self.aisles = set()
+        self.cart = []
+        self.at_wall = None
+        self.finished = False
+        self._changed = None
+
+    async def run(self):
+        reader, writer = await asyncio.open_connection(*self.address)
+        self._changed = asyncio.Event()
+        inbox = asyncio.ensure_future(self._inbox(reader))
+        try:
+            writer.write(_encode({"type": "hello", "robot": self.name}))
+            await self._changed.wait()  # The first assignment
+            while not self.finished:
+                self._changed.clear()
+                route = self.store_map.plan(self.aisles, self.at_wall) if self.cart else []
+                if not route:
+                    writer.write(_encode({"type": "idle", "at": self.at_wall}))
+                    await self._changed.wait()
+                    continue
+                leg = route[0]
+                writer.write(_encode({"type": "driving", "aisle": leg.aisle}))
+                await asyncio.sleep(leg.cost_cm / self.speed_cm_s * self.time_scale)
+                self.at_wall = (leg.aisle, leg.end)
+                for item in self.layout.get(leg.aisle, ()):
+                    if item in self.cart:
+                        writer.write(_encode({"type": "found", "item": item, "aisle": leg.aisle}))
+                writer.write(_encode({"type": "searched", "aisle": leg.aisle}))
+                await writer.drain()
+        finally:
+            inbox.cancel()
+            writer.close()
+
+    async def _inbox(self, reader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                self.finished = True
+                self._changed.set()
+                return
+            message = json.loads(line)
+            if message["type"] == "assign":
+                self.aisles = set(message["aisles"])
+                self.cart = message["cart"]
+            elif message["type"] == "finish":
+                self.finished = True
+            self._changed.set()
+
+
+class FleetClient:
+    """
+    Connects a Mission to a FleetCoordinator.
+
+    Assignments restrict the aisles the mission's navigation plans for (they take effect
+    at the next wall), and items found by other robots leave its cart. The mission's own
+    events are reported back. When its aisles run out the mission reports "idle" and waits
+    for another assignment instead of ending; it only ends once the coordinator sends
+    "finish" or goes away.
+    """
+
+    def __init__(self, mission, address, name):
+        self.mission = mission
+        self.address = address
+        self.name = name
+        self.assigned = threading.Event()
+        self.finished = False  # The coordinator sent "finish" or went away
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._sock = socket.create_connection(self.address)
+        self._send({"type": "hello", "robot": self.name})
+        self.mission.wait_for_work = True
+        self.mission.add_listener(self._on_event)
+        threading.Thread(target=self._reader, name="fleet-client", daemon=True).start()
+        return self
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _send(self, message):
+        with self._lock:
+            if self._sock is None or self.finished:
+                return
+            try:
+                self._sock.sendall(_encode(message))
+            except OSError as e:
+                print(f"Fleet connection lost: {e}")
+                self._sock = None
+
+    def _on_event(self, event, data):
+        if event == "aisle":
+            self._send({"type": "driving", "aisle": data["aisle"]})
+        elif event == "aisle_searched":
+            self._send({"type": "searched", "aisle": data["aisle"]})
+        elif event == "item_found":
+            self._send({"type": "found", "item": data["item"], "aisle": data["aisle"]})
+        elif event == "idle":
+            self._send({"type": "idle", "at": data["at"]})
+        elif event in ("search_ended", "complete", "stopped"):
+            self._send({"type": "done"})
+
+    def _reader(self):
+        try:
+            for line in self._sock.makefile("r"):
+                message = json.loads(line)
+                if message["type"] == "assign":
+                    for item in list(self.mission.cart):
+                        if item not in message["cart"]:
+                            self.mission.remove_item(item)
+                    # After the cart, so a waiting mission plans for what is really left
+                    self.mission.assign_aisles(message["aisles"])
+                    self.assigned.set()
+                elif message["type"] == "finish":
+                    break
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Fleet connection closed: {e}")
+        # No more work is coming: let the mission end its search
+        self.finished = True
+        self.assigned.set()
+        self.mission.stop_waiting_for_work()
+
+
+def random_layout(store_map, cart, rng):
+    """Put each cart item in a random aisle that may stock it."""
+    layout = {}
+    for item in cart:
+        aisles = [aisle for aisle in store_map.aisles if store_map.may_stock(aisle, [item])]
+        layout.setdefault(rng.choice(aisles), []).append(item)
+    return layout
+
+
+async def simulate(store_map, cart, robots, layout, speed_cm_s=50.0, time_scale=0.01):
+    """One simulated mission; returns the coordinator's results, in simulated seconds."""
+    coordinator = await FleetCoordinator(store_map, cart, robots).start()
+    address = (coordinator.host, coordinator.port)
+    sims = [SimRobot(f"robot{i + 1}", store_map, layout, address, speed_cm_s, time_scale) for i in range(robots)]
+    tasks = [asyncio.ensure_future(sim.run()) for sim in sims]
+    results = await coordinator.run()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    results["seconds"] = round(results["seconds"] / time_scale, 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coordinate several robots searching one store")
+    parser.add_argument("--map", default=None, help="store map JSON (default STORE_MAP_FILE)")
+    parser.add_argument("--cart", nargs="+", required=True)
+    parser.add_argument("--robots", nargs="+", type=int, default=[1, 2, 3, 4])
+    parser.add_argument("--trials", type=int, default=5, help="random item layouts per robot count")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--speed", type=float, default=50.0, help="simulated speed, cm/s")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="wall seconds per simulated second")
+    parser.add_argument("--serve", action="store_true", help="coordinate real robots (FleetClient) instead")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=None)
+    args = parser.parse_args()
+    store_map = StoreMap.load(args.map) if args.map else StoreMap.load()
+
+    if args.serve:
+        async def serve():
+            coordinator = await FleetCoordinator(store_map, args.cart, args.robots[0], args.host, args.port).start()
+            print(f"Fleet coordinator on {args.host}:{coordinator.port}, waiting for {args.robots[0]} robots")
+            return await coordinator.run(args.timeout)
+        print(json.dumps(asyncio.run(serve()), indent=2))
+        return
+
+    rng = random.Random(args.seed)
+    layouts = [random_layout(store_map, args.cart, rng) for _ in range(args.trials)]
+    print(f"{'robots':>6}  {'mean s':>8}  {'max s':>8}  {'speedup':>7}")
+    baseline = None
+    for robots in args.robots:
+        times = []
+        for layout in layouts:
+            results = asyncio.run(simulate(store_map, args.cart, robots, layout, args.speed, args.time_scale))
+            times.append(results["seconds"])
+        mean = sum(times) / len(times)
+        baseline = baseline or mean
+        print(f"{robots:>6}  {mean:>8.1f}  {max(times):>8.1f}  {baseline / mean:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+import metrics
+
+# One captured frame. `image` is a view into the grabber's ring buffer, not a copy.
+Frame = namedtuple("Frame", ["seq", "timestamp", "image"])
+
+
+def open_camera(indices=(0, 1)):
+    """Return the first camera in `indices` that opens, or None."""
+    for camera_index in indices:
+        cap = None
+        try:
+            cap = cv2.VideoCapture(camera_index)
+            if cap.isOpened():
+                print(f"Successfully connected to camera {camera_index}")
+                return cap
+            cap.release()
+        except Exception as e:
+            print(f"Failed to open camera {camera_index}: {e}")
+            if cap:
+                cap.release()
+    return None
+
+
+class FrameGrabber:
+    """
+    Single producer for the camera.
+
+    One capture thread is the only code that calls capture.read(). Every frame is
+    written straight into the next slot of a preallocated ring buffer and stamped
+    with a sequence number and time.monotonic(). Readers (preview, detection) get
+    views into the ring, so nothing is copied. A slot is only rewritten after the
+    capture thread has gone round the whole ring, so ring_size must be larger than
+    the number of frames readers hold on to at the same time.
+    """
+
+    def __init__(self, capture, ring_size=4, max_read_failures=10):
+        self.capture = capture
+        self.ring_size = ring_size
+        self.max_read_failures = max_read_failures
+
+        self._ring = None  # allocated from the first frame's shape
+        self._seqs = [-1] * ring_size
+        self._stamps = [0.0] * ring_size
+        self._latest_slot = -1
+        self._seq = -1
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+        self.frames_captured = 0
+        self.read_failures = 0
+        self.consecutive_failures = 0
+        self._reader_last_seq = {}
+        self._reader_dropped = {}
+        self._reader_read = {}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Call listener(frame) from the capture thread for every new frame. Keep it cheap."""
+        self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener):
+        # ==, not `is`: every obj.method lookup builds a new bound method, but they compare equal
+        self._listeners = [l for l in self._listeners if l != listener]
+
+    @property
+    def is_running(self):
+        return self._running and self._thread is not None and self._thread.is_alive()
+
+    @property
+    def healthy(self):
+        return self.is_running and self.consecutive_failures < self.max_read_failures
+
+    def start(self):
+        if self.is_running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, name="frame-grabber", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def release(self):
+        self.stop()
+        if self.capture is not None:
+            self.capture.release()
+
+    def _allocate(self, frame):
+        self._ring = np.empty((self.ring_size,) + frame.shape, dtype=frame.dtype)
+        self._seqs = [-1] * self.ring_size
+
+    def _capture_loop(self):
+        slot = 0
+        while self._running:
+            started = time.monotonic()
+            try:
+                if self._ring is None:
+                    ret, frame = self.capture.read()
+                    if ret:
+                        with self._cond:
+                            self._allocate(frame)
+                            self._ring[slot][...] = frame
+                else:
+                    with self._cond:
+                        # Hide the slot from readers while the camera writes into it
+                        self._seqs[slot] = -1
+                    target = self._ring[slot]
+                    ret, frame = self.capture.read(target)
+                    if ret and frame is not None and not np.shares_memory(frame, target):
+                        # Resolution changed underneath us: rebuild the ring
+                        with self._cond:
+                            self._allocate(frame)
+                            self._ring[slot][...] = frame
+            except cv2.error as e:
+                print(f"OpenCV error in frame grabber: {e}")
+                ret = False
+
+            if not ret:
+                self.read_failures += 1
+                metrics.CAMERA_READ_FAILURES.inc()
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= self.max_read_failures:
+                    print("Frame grabber: camera stopped delivering frames.")
+                    self._running = False
+                    with self._cond:
+                        self._cond.notify_all()
+                    return
+                time.sleep(0.01)
+                continue
+
+            stamp = time.monotonic()
+            metrics.CAPTURE_SECONDS.observe(stamp - started)
+            metrics.FRAMES_CAPTURED.inc()
+            with self._cond:
+                self._seq += 1
+                self._seqs[slot] = self._seq
+                self._stamps[slot] = stamp
+                self._latest_slot = slot
+                self.frames_captured += 1
+                self.consecutive_failures = 0
+                self._cond.notify_all()
+            for listener in self._listeners:
+                listener(self._frame_at(slot))
+            slot = (slot + 1) % self.ring_size
+
+    def _frame_at(self, slot):
+        return Frame(self._seqs[slot], self._stamps[slot], self._ring[slot])
+
+    def latest(self):
+        """Newest frame, or None if nothing has been captured yet. Never blocks on the camera."""
+        with self._cond:
+            if self._latest_slot < 0 or self._seqs[self._latest_slot] < 0:
+                return None
+            return self._frame_at(self._latest_slot)
+
+    def read(self, reader, timeout=1.0):
+        """
+        Wait for a frame newer than the last one `reader` saw and return it.
+
+        Frames captured in between are counted as dropped for that reader.
+        Returns None on timeout or when the grabber stops.
+        """
+        deadline = time.monotonic() + timeout
+        last_seq = self._reader_last_seq.get(reader, -1)
+        with self._cond:
+            while True:
+                if self._latest_slot >= 0 and self._seqs[self._latest_slot] > last_seq:
+                    frame = self._frame_at(self._latest_slot)
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    return None
+                self._cond.wait(remaining)
+
+            if last_seq >= 0:
+                dropped = frame.seq - last_seq - 1
+                self._reader_dropped[reader] = self._reader_dropped.get(reader, 0) + dropped
+                if dropped:
+                    metrics.FRAMES_DROPPED.inc(dropped, reader=reader)
+            else:
+                self._reader_dropped.setdefault(reader, 0)
+            self._reader_last_seq[reader] = frame.seq
+            self._reader_read[reader] = self._reader_read.get(reader, 0) + 1
+        return frame
+
+    def stats(self):
+        with self._cond:
+            return {
+                "captured": self.frames_captured,
+                "read_failures": self.read_failures,
+                "readers": {
+                    name: {"read": self._reader_read.get(name, 0), "dropped": dropped}
+                    for name, dropped in self._reader_dropped.items()
+                },
+            }
+
+    def report(self):
+        stats = self.stats()
+        readers = ", ".join(f"{name}: read {s['read']}, dropped {s['dropped']}"
+                            for name, s in stats["readers"].items())
+        print(f"Frame grabber: captured {stats['captured']}, read failures {stats['read_failures']}"
+              + (f" | {readers}" if readers else ""))
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def iter_file_frames(source, loop=False):
+    """
+    Yield BGR frames from a video file or a directory of images (sorted by name).
+
+    Used to replay recorded footage through the detection code without a camera.
+    """
+    while True:
+        if os.path.isdir(source):
+            names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_EXTENSIONS))
+            if not names:
+                raise IOError(f"No images found in {source}")
+            for name in names:
+                frame = cv2.imread(os.path.join(source, name))
+                if frame is not None:
+                    yield frame
+        else:
+            cap = cv2.VideoCapture(source)
+            if not cap.isOpened():
+                raise IOError(f"Could not open video {source}")
+            try:
+                while True:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    yield frame
+            finally:
+                cap.release()
+        if not loop:
+            return
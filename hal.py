@@ -0,0 +1,485 @@
+"""
+Hardware abstraction layer.
+
+Everything that touches the robot's hardware goes through here: motor PWM (GPIO),
+the ultrasonic range sensor, the Arduino serial link and the camera. Each has a
+real Raspberry Pi backend and a simulated one, so the control code can run and be
+benchmarked on an ordinary Linux box.
+
+The backend comes from HAL_BACKEND in config.py ("auto", "pi" or "sim"); the
+SODA_HAL environment variable overrides it. "auto" uses the Pi backend when
+RPi.GPIO can be imported.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import clock
+import range_link
+from config import (ARDUINO_BAUDRATE, ARDUINO_PORT, HAL_BACKEND, SIM_AISLE_LENGTH_CM, SIM_CAMERA_FPS,
+                    SIM_CAMERA_SIZE, SIM_CAMERA_SOURCE, RANGE_PERIOD_MS, ULTRASONIC_TIMEOUT_S)
+
+_backend = None
+_gpio = None
+_world = None
+_lock = threading.Lock()
+
+
+def backend():
+    """'pi' or 'sim', decided once per process."""
+    global _backend
+    if _backend is None:
+        choice = os.environ.get("SODA_HAL", HAL_BACKEND)
+        if choice == "auto":
+            try:
+                import RPi.GPIO  # noqa: F401
+                choice = "pi"
+            except (ImportError, RuntimeError):
+                choice = "sim"
+        if choice not in ("pi", "sim"):
+            raise ValueError(f"Unknown HAL backend {choice!r}, expected 'auto', 'pi' or 'sim'")
+        _backend = choice
+        print(f"Hardware backend: {_backend}")
+    return _backend
+
+
+def is_simulated():
+    return backend() == "sim"
+
+
+# ---------------------------------------------------------------------------
+# GPIO / PWM
+# ---------------------------------------------------------------------------
+
+class FakePWM:
+    def __init__(self, gpio, pin, frequency):
+        self.gpio = gpio
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = 0.0
+        self.running = False
+
+    def start(self, duty_cycle):
+        self.running = True
+        self.ChangeDutyCycle(duty_cycle)
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = float(duty_cycle)
+        self.gpio.log.append((clock.monotonic(), "pwm", self.pin, self.duty_cycle))
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def stop(self):
+        self.running = False
+        self.duty_cycle = 0.0
+
+
+class FakeGPIO:
+    """
+    In-memory stand-in for the parts of RPi.GPIO this project uses.
+
+    Outputs and PWM duty cycles are kept in dicts (and the recent `log`) so tests and
+    the simulator can see what the motor code did. Inputs return whatever was last
+    set with set_input(), and edge callbacks fire when an input changes.
+    """
+
+    BCM = "BCM"
+    BOARD = "BOARD"
+    OUT = "OUT"
+    IN = "IN"
+    HIGH = 1
+    LOW = 0
+    RISING = "RISING"
+    FALLING = "FALLING"
+    BOTH = "BOTH"
+    PUD_UP = "PUD_UP"
+    PUD_DOWN = "PUD_DOWN"
+
+    def __init__(self):
+        self.mode = None
+        self.directions = {}
+        self.outputs = {}
+        self.inputs = {}
+        self.pwms = {}
+        self.callbacks = {}
+        self.log = deque(maxlen=10000)
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pins, direction, pull_up_down=None, initial=None):
+        for pin in pins if isinstance(pins, (list, tuple)) else [pins]:
+            self.directions[pin] = direction
+            if direction == self.OUT:
+                self.outputs[pin] = initial or self.LOW
+            else:
+                self.inputs.setdefault(pin, self.LOW)
+
+    def output(self, pins, value):
+        for pin in pins if isinstance(pins, (list, tuple)) else [pins]:
+            self.outputs[pin] = int(bool(value))
+            self.log.append((clock.monotonic(), "out", pin, int(bool(value))))
+
+    def input(self, pin):
+        return self.inputs.get(pin, self.LOW)
+
+    def set_input(self, pin, value):
+        """Simulator side: drive an input pin and fire any edge callbacks."""
+        value = int(bool(value))
+        previous = self.inputs.get(pin, self.LOW)
+        self.inputs[pin] = value
+        if value == previous:
+            return
+        edge, callback = self.callbacks.get(pin, (None, None))
+        if callback and (edge == self.BOTH or (edge == self.RISING) == bool(value)):
+            callback(pin)
+
+    def PWM(self, pin, frequency):
+        pwm = FakePWM(self, pin, frequency)
+        self.pwms[pin] = pwm
+        return pwm
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def cleanup(self, pins=None):
+        self.directions.clear()
+        self.outputs.clear()
+        self.callbacks.clear()
+
+
+def gpio():
+    """RPi.GPIO on the Pi, a process-wide FakeGPIO in simulation."""
+    global _gpio
+    with _lock:
+        if _gpio is None:
+            if is_simulated():
+                _gpio = FakeGPIO()
+            else:
+                import RPi.GPIO as GPIO
+                _gpio = GPIO
+        return _gpio
+
+
+# ---------------------------------------------------------------------------
+# Motors
+# ---------------------------------------------------------------------------
+
+class Motors:
+    """Differential drive: signed duty cycles (-100..100) for the left and right wheels."""
+
+    def drive(self, left, right):
+        raise NotImplementedError
+
+    def stop(self):
+        self.drive(0, 0)
+
+    def close(self):
+        self.stop()
+
+
+class GPIOMotors(Motors):
+    """
+    Two H-bridge drivers, one per side, each with an RPWM/LPWM pair and two enable pins.
+
+    The left motor is mounted mirrored, so its polarity is reversed: forward on the left
+    is the LPWM channel.
+    """
+
+    def __init__(self, gpio_module, right_pins, left_pins, frequency=1000):
+        self.gpio = gpio_module
+        self.rpwm_r, self.lpwm_r, self.r_en_r, self.l_en_r = right_pins
+        self.rpwm_l, self.lpwm_l, self.r_en_l, self.l_en_l = left_pins
+        self.enable_pins = [self.r_en_r, self.l_en_r, self.r_en_l, self.l_en_l]
+
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(list(right_pins) + list(left_pins), self.gpio.OUT)
+        self.pwm_r_r = self.gpio.PWM(self.rpwm_r, frequency)
+        self.pwm_l_r = self.gpio.PWM(self.lpwm_r, frequency)
+        self.pwm_r_l = self.gpio.PWM(self.rpwm_l, frequency)
+        self.pwm_l_l = self.gpio.PWM(self.lpwm_l, frequency)
+        self.pwms = [self.pwm_r_r, self.pwm_l_r, self.pwm_r_l, self.pwm_l_l]
+        for pwm in self.pwms:
+            pwm.start(0)
+        self.left = 0.0
+        self.right = 0.0
+
+    def drive(self, left, right):
+        if left == 0 and right == 0:
+            for pin in self.enable_pins:
+                self.gpio.output(pin, self.gpio.LOW)
+            for pwm in self.pwms:
+                pwm.ChangeDutyCycle(0)
+        else:
+            for pin in self.enable_pins:
+                self.gpio.output(pin, self.gpio.HIGH)
+            self.pwm_r_r.ChangeDutyCycle(max(right, 0))
+            self.pwm_l_r.ChangeDutyCycle(max(-right, 0))
+            # REVERSE LEFT MOTOR POLARITY
+            self.pwm_r_l.ChangeDutyCycle(max(-left, 0))
+            self.pwm_l_l.ChangeDutyCycle(max(left, 0))
+        self.left, self.right = left, right
+        if _world is not None:
+            _world.set_wheels(left, right)
+
+    def close(self):
+        self.stop()
+        for pwm in self.pwms:
+            pwm.stop()
+        self.gpio.cleanup()
+
+
+def create_motors(right_pins, left_pins, frequency=1000):
+    """Motors on the real GPIO, or on FakeGPIO driving the simulated world."""
+    if is_simulated():
+        sim_world()
+    return GPIOMotors(gpio(), right_pins, left_pins, frequency)
+
+
+# ---------------------------------------------------------------------------
+# Simulated world
+# ---------------------------------------------------------------------------
+
+class SimWorld:
+    """
+    Very small model of the robot in a straight aisle, enough to exercise navigation.
+
+    Wheel duty cycles move the robot along the aisle; spinning in place accumulates
+    heading, and once it has turned round (150 degrees or more) it is at the start of
+    the next aisle.
+    """
+
+    # Calibrated so that the current turn_left()/turn_right() (0.85 s at duty 40) is about 90 degrees
+    CM_PER_DUTY_SECOND = 0.75
+    DEG_PER_DUTY_SECOND = 2.65
+
+    def __init__(self, aisle_length_cm=SIM_AISLE_LENGTH_CM):
+        self.aisle_length_cm = aisle_length_cm
+        self.position_cm = 0.0
+        self.heading_deg = 0.0
+        self.aisle = 1
+        self.left = 0.0
+        self.right = 0.0
+        self._last = clock.monotonic()
+        self._lock = threading.Lock()
+
+    def _advance(self):
+        now = clock.monotonic()
+        dt = now - self._last
+        self._last = now
+        linear = (self.left + self.right) / 2.0
+        spin = (self.right - self.left) / 2.0
+        self.position_cm = min(self.position_cm + linear * self.CM_PER_DUTY_SECOND * dt, self.aisle_length_cm)
+        self.position_cm = max(self.position_cm, 0.0)
+        self.heading_deg += spin * self.DEG_PER_DUTY_SECOND * dt
+        if abs(self.heading_deg) >= 150.0:
+            self.heading_deg = 0.0
+            self.position_cm = 0.0
+            self.aisle += 1
+
+    def set_wheels(self, left, right):
+        with self._lock:
+            self._advance()
+            self.left, self.right = left, right
+
+    def distance_to_wall_cm(self):
+        with self._lock:
+            self._advance()
+            return self.aisle_length_cm - self.position_cm
+
+
+def sim_world():
+    global _world
+    with _lock:
+        if _world is None:
+            _world = SimWorld()
+        return _world
+
+
+# ---------------------------------------------------------------------------
+# Range sensor
+# ---------------------------------------------------------------------------
+
+class RangeSensor:
+    def distance_cm(self):
+        """One measurement in cm, or None if no echo came back."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class GPIOUltrasonic(RangeSensor):
+    """
+    HC-SR04 style sensor on two GPIO pins (trigger out, echo in).
+
+    The echo pulse is timed from edge callbacks with time.monotonic_ns() rather than
+    by polling the pin, and a measurement gives up after `timeout` seconds.
+    """
+
+    def __init__(self, gpio_module, trig_pin, echo_pin, timeout=ULTRASONIC_TIMEOUT_S):
+        self.gpio = gpio_module
+        self.trig_pin = trig_pin
+        self.echo_pin = echo_pin
+        self.timeout = timeout
+        self._rise_ns = None
+        self._pulse_ns = None
+        self._echo = threading.Event()
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(trig_pin, self.gpio.OUT)
+        self.gpio.setup(echo_pin, self.gpio.IN)
+        self.gpio.output(trig_pin, False)
+        self.gpio.add_event_detect(echo_pin, self.gpio.BOTH, callback=self._on_edge)
+
+    def _on_edge(self, channel):
+        now = time.monotonic_ns()
+        if self.gpio.input(self.echo_pin):
+            self._rise_ns = now
+        elif self._rise_ns is not None:
+            # Falling edges without a rising one since the trigger belong to an old echo
+            self._pulse_ns = now - self._rise_ns
+            self._echo.set()
+
+    def distance_cm(self):
+        self._rise_ns = None
+        self._echo.clear()
+        # Send a short pulse to trigger the ultrasonic sensor
+        self.gpio.output(self.trig_pin, True)
+        time.sleep(0.00001)  # 10 microseconds pulse
+        self.gpio.output(self.trig_pin, False)
+        if not self._echo.wait(self.timeout):
+            return None
+        # Speed of sound = 34300 cm/s, halved for the round trip
+        return self._pulse_ns * 34300 / 2 / 1e9
+
+    def close(self):
+        self.gpio.remove_event_detect(self.echo_pin)
+
+
+class SimRangeSensor(RangeSensor):
+    def __init__(self, world):
+        self.world = world
+
+    def distance_cm(self):
+        return self.world.distance_to_wall_cm()
+
+
+def create_range_sensor(trig_pin, echo_pin):
+    if is_simulated():
+        return SimRangeSensor(sim_world())
+    return GPIOUltrasonic(gpio(), trig_pin, echo_pin)
+
+
+# ---------------------------------------------------------------------------
+# Arduino serial link
+# ---------------------------------------------------------------------------
+
+class PseudoSerial:
+    """
+    Stand-in for the Arduino on /dev/ttyACM0. Like UltraSonicToRobot.cpp it sends one
+    range_link frame with the simulated distance to the wall every RANGE_PERIOD_MS.
+    """
+
+    def __init__(self, world, timeout=1.0, period=RANGE_PERIOD_MS / 1000.0):
+        self.world = world
+        self.timeout = timeout
+        self.period = period
+        self._seq = 0
+        self._buffer = bytearray()
+
+    @property
+    def in_waiting(self):
+        return len(self._buffer)
+
+    def reset_input_buffer(self):
+        self._buffer.clear()
+
+    def read(self, size=1):
+        if not self._buffer:
+            if clock.time_scale() == 0:
+                time.sleep(self.period)  # Nothing paces a fast replay; don't spin
+            clock.sleep(self.period)
+            self._buffer.extend(range_link.encode_frame(self._seq, self.world.distance_to_wall_cm() * 10))
+            self._seq += 1
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        pass
+
+
+def open_serial(port=ARDUINO_PORT, baudrate=ARDUINO_BAUDRATE, timeout=1):
+    """The Arduino connection, a PseudoSerial in simulation, or None if the port can't be opened."""
+    if is_simulated():
+        return PseudoSerial(sim_world(), timeout=timeout)
+    import serial
+    try:
+        return serial.Serial(port=port, baudrate=baudrate, timeout=timeout)
+    except serial.SerialException as e:
+        print(f"Serial connection failed: {e}")
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Camera
+# ---------------------------------------------------------------------------
+
+class FileCamera:
+    """
+    cv2.VideoCapture look-alike that plays a video file or image directory in a loop,
+    paced to `fps` and resized to a fixed `size` so it behaves like a webcam.
+    """
+
+    def __init__(self, source=SIM_CAMERA_SOURCE, fps=SIM_CAMERA_FPS, size=SIM_CAMERA_SIZE):
+        from frame_grabber import iter_file_frames
+        self.source = source
+        self.fps = fps
+        self.size = size
+        self._frames = iter_file_frames(source, loop=True)
+        self._next_time = time.monotonic()
+        self._opened = True
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self, image=None):
+        import cv2
+        if not self._opened:
+            return False, None
+        delay = self._next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_time = max(self._next_time + 1.0 / self.fps, time.monotonic())
+        try:
+            frame = next(self._frames)
+        except (StopIteration, IOError) as e:
+            print(f"File camera error: {e}")
+            return False, None
+        if image is not None and image.shape[:2] == (self.size[1], self.size[0]):
+            cv2.resize(frame, self.size, dst=image)
+            return True, image
+        return True, cv2.resize(frame, self.size)
+
+    def release(self):
+        self._opened = False
+
+
+def open_camera(indices=(0, 1)):
+    """First working camera, or the file camera in simulation."""
+    if is_simulated():
+        print(f"Using file camera: {SIM_CAMERA_SOURCE}")
+        return FileCamera()
+    from frame_grabber import open_camera as open_video_device
+    return open_video_device(indices)
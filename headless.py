@@ -0,0 +1,123 @@
+"""
+Run a mission without the GUI: no Tk objects are created.
+
+Progress is written as JSON lines ({"t", "event", ...}) to stdout or --events FILE.
+When the events go to stdout, the mission's log output goes to stderr instead.
+The cart comes from --cart labels or a JSON file holding a list of labels
+(or {"cart": [...]}).
+
+    python headless.py --cart Coke Sprite
+    python headless.py --cart-file cart.json --events runs/mission.jsonl --record sessions/run1
+    python headless.py --replay sessions/run1 --fast
+    python headless.py --cart Coke Sprite --fleet 127.0.0.1:8765 --robot robot1
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+
+def load_cart(path):
+    with open(path) as f:
+        cart = json.load(f)
+    if isinstance(cart, dict):
+        cart = cart.get("cart", [])
+    return [str(item) for item in cart]
+
+
+class EventWriter:
+    """Mission listener that writes one JSON object per event."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def __call__(self, event, data):
+        record = {"t": round(time.time(), 3), "event": event}
+        record.update(data)
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Autonomous Soda Selector without the GUI")
+    parser.add_argument("--cart", nargs="*", default=[], help="labels to look for")
+    parser.add_argument("--cart-file", help="JSON file with the labels to look for")
+    parser.add_argument("--events", help="write JSON-lines progress events here instead of stdout")
+    parser.add_argument("--record", metavar="DIR", help="record the mission (frames, sensor lines, motor commands)")
+    parser.add_argument("--replay", metavar="DIR", help="replay a recorded mission instead of using the hardware")
+    parser.add_argument("--fast", action="store_true", help="replay as fast as possible instead of in real time")
+    parser.add_argument("--conf", type=float, default=0.60)
+    parser.add_argument("--timeout", type=float, default=None, help="give up after this many seconds")
+    parser.add_argument("--fleet", metavar="HOST:PORT", help="take aisle assignments from a fleet coordinator")
+    parser.add_argument("--robot", default="robot", help="this robot's name in the fleet")
+    args = parser.parse_args()
+
+    cart = list(args.cart)
+    if args.cart_file:
+        cart += load_cart(args.cart_file)
+    if not cart and not args.replay:
+        parser.error("nothing to look for: pass --cart or --cart-file")
+
+    if args.events:
+        stream = open(args.events, "w")
+    else:
+        # Keep stdout to the events alone: everything else prints its log there
+        stream, sys.stdout = sys.stdout, sys.stderr
+    # Imported only now: setting up the hardware already logs
+    from fleet import FleetClient
+    from mission import Mission
+    from session_recorder import SessionReplay
+
+    replay = SessionReplay(args.replay, realtime=not args.fast) if args.replay else None
+    mission = Mission(record_dir=args.record, replay=replay, confidence_threshold=args.conf)
+    mission.add_listener(EventWriter(stream))
+    outcome = {}
+    mission.add_listener(lambda event, data: outcome.update(event=event)
+                         if event in ("complete", "search_ended", "stopped") else None)
+
+    mission.load()
+    mission.ready.wait()
+    if mission.detector_error is not None:
+        mission.close()
+        return 1
+    fleet = None
+    # A replay restores its own cart and starts itself once ready
+    if replay is None:
+        for item in cart:
+            mission.add_item(item)
+        if args.fleet:
+            host, _, port = args.fleet.rpartition(":")
+            try:
+                fleet = FleetClient(mission, (host or "127.0.0.1", int(port)), args.robot).start()
+            except (OSError, ValueError) as e:
+                print(f"Could not join the fleet at {args.fleet}: {e}", file=sys.stderr)
+                mission.close()
+                return 1
+            # The coordinator assigns work once every robot has joined
+            fleet.assigned.wait(args.timeout)
+        try:
+            mission.start()
+        except Exception:
+            mission.close()
+            return 1
+
+    try:
+        if not mission.finished.wait(args.timeout):
+            mission.emit("status", message=f"Timed out after {args.timeout} s")
+    except KeyboardInterrupt:
+        mission.emit("status", message="Interrupted")
+    finally:
+        mission.close()
+        if fleet is not None:
+            fleet.close()
+        if args.events:
+            stream.close()
+    return 0 if outcome.get("event") == "complete" else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import threading
+
+
+class InferenceScheduler:
+    """
+    Decides which frames are worth running the detector on.
+
+    The target rate follows what the robot is doing (Wheel_funcs reports "forward",
+    "backward", "turning" or "stopped") and what is left in the cart: no inference
+    during turns, when the camera is sweeping past nothing useful, or once the cart is
+    empty; a reduced rate while standing still; and the full rate for a short while after
+    something tentative shows up, so its track gets confirmed quickly.
+
+    due() works on frame timestamps, so a replay makes the same decisions as the recorded
+    run. It only says whether a frame may be inferred; the caller reports the frames that
+    actually were with mark_run(), so a frame skipped by a later check (the scene gate)
+    doesn't count as a run or hold back the next one.
+    """
+
+    def __init__(self, rates, boost_rate=None, boost_seconds=1.0, motion="stopped", on_change=None):
+        self.rates = dict(rates)
+        self.boost_rate = boost_rate
+        self.boost_seconds = boost_seconds
+        self.on_change = on_change
+        self.motion = motion
+        self.cart_size = 0
+        self.ran = 0
+        self.skipped = 0
+        self._boost_until = None
+        self._last_run = None
+        self._last_rate = None
+        self._lock = threading.Lock()
+
+    def set_motion(self, motion):
+        self.motion = motion
+        self._changed()
+
+    def set_cart_size(self, size):
+        self.cart_size = size
+        self._changed()
+
+    def boost(self, timestamp):
+        """Run at boost_rate until boost_seconds after `timestamp`."""
+        self._boost_until = timestamp + self.boost_seconds
+
+    def rate_at(self, timestamp):
+        """Target inferences per second at `timestamp`; 0 means paused, None means every frame."""
+        if self.cart_size == 0:
+            return 0.0
+        rate = self.rates.get(self.motion)
+        if rate == 0:
+            return 0.0  # Never boosted: a turn shows nothing worth confirming
+        if self._boost_until is not None and timestamp < self._boost_until:
+            return self.boost_rate
+        return rate
+
+    @property
+    def rate(self):
+        return self._last_rate
+
+    def due(self, timestamp):
+        with self._lock:
+            rate = self.rate_at(timestamp)
+            if rate != self._last_rate:
+                self._last_rate = rate
+                self._notify(rate)
+            if rate == 0 or (rate is not None and self._last_run is not None
+                             and timestamp - self._last_run < 1.0 / rate - 1e-3):
+                self.skipped += 1
+                return False
+            return True
+
+    def mark_run(self, timestamp):
+        """The detector is being run on the frame at `timestamp`."""
+        with self._lock:
+            self._last_run = timestamp
+            self.ran += 1
+
+    def _changed(self):
+        # The first frame after a change (e.g. coming out of a turn) is always inferred
+        self._last_run = None
+
+    def _notify(self, rate):
+        if self.on_change is not None:
+            self.on_change(rate, self.motion)
+
+    def stats(self):
+        return {"motion": self.motion, "rate": self._last_rate, "ran": self.ran, "skipped": self.skipped}
@@ -0,0 +1,110 @@
+"""
+Where each product has been seen, kept across missions.
+
+ITEM_INDEX_FILE is append-only, one JSON event per line:
+
+    {"t": 1760000000.0, "item": "Coke", "aisle": 2, "event": "seen", "confidence": 0.83}
+    {"t": 1760000500.0, "item": "Coke", "aisle": 2, "event": "missed"}
+
+A sighting counts for its detection confidence, halved every half_life_days. A "missed"
+event (the aisle was searched and the item wasn't found) cancels every earlier
+sighting of that item in that aisle. likely_aisles() ranks aisles by the decayed total,
+so a mission can go straight to where an item was last seen.
+"""
+import json
+import os
+import threading
+import time
+
+from config import ITEM_INDEX_FILE, ITEM_INDEX_HALF_LIFE_DAYS, ITEM_INDEX_MIN_SCORE
+
+SEEN = "seen"
+MISSED = "missed"
+
+
+class ItemIndex:
+    def __init__(self, path=ITEM_INDEX_FILE, half_life_days=ITEM_INDEX_HALF_LIFE_DAYS,
+                 min_score=ITEM_INDEX_MIN_SCORE, events=None):
+        self.path = path  # None keeps the index in memory only
+        self.half_life = half_life_days * 24 * 3600.0
+        self.min_score = min_score
+        self.now = time.time  # Replaced by a fixed time when replaying a recording
+        self._sightings = {}  # (item, aisle) -> [(t, confidence)], oldest first
+        self._lock = threading.Lock()
+        for event in events or ():
+            self._apply(event)
+        if path is not None and events is None:
+            self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        bad = 0
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        bad += 1  # e.g. a line cut short by a crash
+        except OSError as e:
+            print(f"Could not load the item index from {self.path}: {e}")
+            return
+        print(f"Item index loaded from {self.path}: {len(self._sightings)} item locations"
+              + (f", {bad} unreadable lines skipped" if bad else ""))
+
+    def _apply(self, event):
+        key = (event["item"], int(event["aisle"]))
+        if event["event"] == SEEN:
+            self._sightings.setdefault(key, []).append((float(event["t"]), float(event["confidence"])))
+        elif event["event"] == MISSED:
+            kept = [sighting for sighting in self._sightings.get(key, ()) if sighting[0] > event["t"]]
+            if kept:
+                self._sightings[key] = kept
+            else:
+                self._sightings.pop(key, None)
+
+    def _record(self, event):
+        with self._lock:
+            self._apply(event)
+            if self.path is None:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(event) + "\n")
+            except OSError as e:
+                print(f"Could not write to the item index {self.path}: {e}")
+
+    def record_seen(self, item, aisle, confidence):
+        self._record({"t": self.now(), "item": item, "aisle": aisle, "event": SEEN,
+                      "confidence": round(float(confidence), 3)})
+
+    def record_missed(self, item, aisle):
+        """Forget that `item` was in `aisle`. False if there was nothing to forget."""
+        if (item, aisle) not in self._sightings:
+            return False
+        self._record({"t": self.now(), "item": item, "aisle": aisle, "event": MISSED})
+        return True
+
+    def score(self, item, aisle):
+        now = self.now()
+        return sum(confidence * 0.5 ** (max(now - t, 0.0) / self.half_life)
+                   for t, confidence in self._sightings.get((item, aisle), ()))
+
+    def likely_aisles(self, item):
+        """[(aisle, score)] where `item` has been seen, most likely first, above min_score."""
+        with self._lock:
+            aisles = [aisle for known, aisle in self._sightings if known == item]
+            ranked = [(aisle, self.score(item, aisle)) for aisle in aisles]
+        ranked = [(aisle, score) for aisle, score in ranked if score >= self.min_score]
+        return sorted(ranked, key=lambda entry: -entry[1])
+
+    def snapshot(self):
+        """The sightings still in force, as events; ItemIndex(None, events=...) rebuilds the index."""
+        with self._lock:
+            return [{"t": t, "item": item, "aisle": aisle, "event": SEEN, "confidence": confidence}
+                    for (item, aisle), sightings in self._sightings.items() for t, confidence in sightings]
+
+    def stats(self):
+        return {"locations": len(self._sightings), "items": len({item for item, _ in self._sightings})}
@@ -0,0 +1,299 @@
+"""
+Process-wide counters, gauges and histograms.
+
+The metrics the robot keeps are declared at the bottom of this module; code that
+measures something imports the module and calls e.g.
+
+    metrics.CAPTURE_SECONDS.observe(seconds)
+    metrics.FRAMES_DROPPED.inc(2, reader="preview")
+
+serve() publishes them in the Prometheus text format on http://METRICS_HOST:METRICS_PORT/metrics
+(only on the local machine by default), and report() prints a summary with mean, p50 and
+p95 per histogram; Mission calls it every METRICS_LOG_SECONDS while detecting. Quantiles
+in the summary are estimated from the histogram buckets.
+"""
+import bisect
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_HOST, METRICS_PORT
+
+PREFIX = "soda_"
+
+# Bucket upper bounds in seconds
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0)
+SLOW_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = PREFIX + name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}  # label values -> value
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines += self._samples()
+        return lines
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """A value that goes up and down. set_function() reads it when scraped instead."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """Take the (unlabelled) value from function() on every read; None goes back to set()."""
+        self._function = function
+
+    def value(self, **labels):
+        function = self._function
+        if function is not None:
+            return function()
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        function = self._function
+        if function is not None:
+            return [f"{self.name} {_format_value(function())}"]
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=FAST_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # [count per bucket (not cumulative), sum, count]
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def summary(self, **labels):
+        """{"count", "mean", "p50", "p95"} for one label set, or None before the first observation."""
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            if series is None:
+                return None
+            counts, total, count = list(series[0]), series[1], series[2]
+        return {"count": count, "mean": total / count,
+                "p50": self._quantile(counts, count, 0.5), "p95": self._quantile(counts, count, 0.95)}
+
+    def _quantile(self, counts, count, q):
+        """Interpolated within the bucket the quantile falls in, like Prometheus' histogram_quantile()."""
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                upper = self.buckets[index]
+                lower = self.buckets[index - 1] if index else 0.0
+                if upper == math.inf:
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-2]
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, [("le", _format_value(upper))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def _register(metric):
+    with _registry_lock:
+        if metric.name in _registry:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        _registry[metric.name] = metric
+    return metric
+
+
+def counter(name, help_text, labels=()):
+    return _register(Counter(name, help_text, labels))
+
+
+def gauge(name, help_text, labels=()):
+    return _register(Gauge(name, help_text, labels))
+
+
+def histogram(name, help_text, labels=(), buckets=FAST_BUCKETS):
+    return _register(Histogram(name, help_text, labels, buckets))
+
+
+def render():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def report():
+    """Print a summary of every histogram that has observations, and the non-zero counters."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    parts = []
+    for metric in metrics:
+        short = metric.name[len(PREFIX):]
+        with metric._lock:
+            keys = sorted(metric._values)
+        for key in keys:
+            labels = dict(zip(metric.label_names, key))
+            name = short + ("[" + ",".join(key) + "]" if key else "")
+            if isinstance(metric, Histogram):
+                s = metric.summary(**labels)
+                parts.append(f"{name} n={s['count']} mean {1000 * s['mean']:.1f} ms, "
+                             f"p50 {1000 * s['p50']:.1f} ms, p95 {1000 * s['p95']:.1f} ms")
+            elif isinstance(metric, Counter):
+                parts.append(f"{name} {metric.value(**labels)}")
+        if isinstance(metric, Gauge) and metric._function is not None:
+            parts.append(f"{short} {metric.value():.2f}")
+    if parts:
+        print("Metrics:\n  " + "\n  ".join(parts))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # A scrape every few seconds would drown out the mission log
+
+
+_server = None
+
+
+def serve(port=METRICS_PORT, host=METRICS_HOST):
+    """Start the /metrics endpoint on a daemon thread. Returns the server, or None if it is off or failed."""
+    global _server
+    if port is None:
+        return None
+    with _registry_lock:
+        if _server is not None:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+        except OSError as e:
+            print(f"Could not start the metrics endpoint on {host}:{port}: {e}")
+            return None
+        _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"Metrics at http://{host}:{_server.server_address[1]}/metrics")
+    return _server
+
+
+def shutdown():
+    global _server
+    with _registry_lock:
+        server, _server = _server, None
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+
+# --- what the robot measures ------------------------------------------------
+
+CAPTURE_SECONDS = histogram(
+    "capture_seconds", "Time capture.read() took to deliver a frame (includes waiting for the camera)")
+STAGE_SECONDS = histogram(
+    "detection_stage_seconds", "Time per frame in each detection pipeline stage "
+    "(preprocess is the ROI crop and resize)", labels=("stage",))
+GUI_UPDATE_SECONDS = histogram("gui_update_seconds", "Time to draw one preview frame in the GUI")
+FRAMES_CAPTURED = counter("frames_captured_total", "Frames delivered by the camera")
+CAMERA_READ_FAILURES = counter("camera_read_failures_total", "Failed camera reads")
+FRAMES_DROPPED = counter(
+    "frames_dropped_total", "Frames a grabber reader never saw because a newer one arrived first",
+    labels=("reader",))
+QUEUE_DROPPED = counter(
+    "pipeline_queue_dropped_total", "Items evicted from a full detection pipeline queue", labels=("queue",))
+INFERENCE_FPS = gauge("inference_fps", "Detector runs per second since detection started")
+CAPTURE_TO_CART_SECONDS = histogram(
+    "capture_to_cart_seconds", "From a frame's capture timestamp to the item it showed being taken off the cart",
+    buckets=SLOW_BUCKETS)
+WALL_BRAKE_DECISION_SECONDS = histogram(
+    "wall_brake_decision_seconds", "From the range reading that triggered braking to the brake command")
+WALL_TO_STOP_SECONDS = histogram(
+    "wall_to_stop_seconds", "From the range reading that triggered braking to the motors being at rest",
+    buckets=SLOW_BUCKETS)
+STOP_REQUEST_SECONDS = histogram(
+    "stop_request_seconds", "From a stop request (user or cart complete) to the motors being stopped")
@@ -0,0 +1,606 @@
+"""
+Mission core: cart, camera, detection and navigation, with no UI.
+
+Main.py (CustomTkinter) and headless.py both drive a Mission. Progress is reported
+as events to listeners registered with add_listener(); a listener is called as
+listener(event, data) from whichever worker thread produced the event, so a UI
+has to hand it over to its own thread.
+
+Events:
+    ready            detector loaded and camera probed (data: error, seconds)
+    status           human readable progress message (data: message)
+    cart             cart contents changed (data: cart)
+    started          detection and navigation threads are running
+    item_found       a cart item was detected (data: item, aisle, cart)
+    aisle            the robot moved to another aisle (data: aisle)
+    aisle_searched   the robot reached the end of an aisle (data: aisle)
+    idle             no assigned aisles left, waiting for more (wait_for_work; data: at, the
+                     (aisle, end) it stopped at or None for the start)
+    search_ended     navigation finished its sweep (data: remaining)
+    complete         every cart item has been found (data: found)
+    stopped          detection ended (data: reason)
+    inference_rate   the detector's target rate changed (data: rate in Hz, None = every frame; motion)
+"""
+import threading
+import time
+
+import metrics
+import Pathing
+from config import (DETECT_EVERY_N_FRAMES, INFERENCE_BOOST_RATE, INFERENCE_BOOST_SECONDS, INFERENCE_RATES,
+                    METRICS_LOG_SECONDS, MODEL_IMGSZ, SCENE_GATE_MAX_AGE, SCENE_GATE_SIZE,
+                    SCENE_GATE_THRESHOLD, SHELF_ROI, SHELF_ROI_FILE, SHELF_ROI_FULL_FRAME_EVERY,
+                    SHELF_ROI_LEARN, SHELF_ROI_MARGIN, TRACK_CONFIRM_HITS, TRACK_IOU_THRESHOLD,
+                    TRACK_MAX_MISSES)
+from detection_pipeline import DetectionPipeline
+from detectors import create_detector
+from frame_grabber import FrameGrabber
+from hal import open_camera
+from inference_scheduler import InferenceScheduler
+from item_index import ItemIndex
+from navigation import NavigationController
+from postprocess import CartIndex
+from preprocess import Letterbox, scale_boxes
+from roi import ShelfROI
+from scene_gate import SceneChangeGate
+from session_recorder import ReplayGrabber, ReplaySerial, SessionRecorder
+from store_map import SWEEP, StoreMap
+from tracker import Tracker
+try:
+    from Wheel_funcs import add_motion_listener, init_gpio, stop, cleanup
+    init_gpio()
+except Exception as e:
+    print(f"Error initializing GPIO: {e}")
+
+
+class Mission:
+    def __init__(self, record_dir=None, replay=None, confidence_threshold=0.60):
+        self.cart_lock = threading.Lock()
+        self.cart = []
+        # Same contents as self.cart, kept as model class ids for vectorized postprocessing.
+        # Built once the detector has loaded and knows its class names.
+        self.cart_index = None
+        self.found_items_locations = {}
+        self.current_aisle = 1
+        # Aisles driven to the end this mission; navigation plans its route around the rest
+        self.searched_aisles = set()
+        # Aisles a fleet coordinator gave this robot (see fleet.py), None for all of them
+        self.assigned_aisles = None
+        # Set by FleetClient: once the assigned aisles run out, report "idle" and wait for more
+        # instead of ending the search
+        self.wait_for_work = False
+        try:
+            self.store_map = StoreMap.load()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not load the store map: {e}; falling back to the three-aisle sweep")
+            self.store_map = StoreMap.from_data(SWEEP)
+        # Where items were seen on earlier missions. A replay uses the index as it was when
+        # the mission was recorded, and doesn't write to it.
+        if replay is None:
+            self.item_index = ItemIndex()
+        else:
+            self.item_index = ItemIndex(None, events=replay.meta.get("item_index", []))
+            recorded_at = replay.meta.get("item_index_time")
+            if recorded_at is not None:
+                self.item_index.now = lambda: recorded_at
+        self.confidence_threshold = confidence_threshold
+        self.started_at = time.monotonic()
+        self.first_frame_logged = False
+        self._listeners = []
+
+        # --record DIR saves each mission; --replay DIR runs a saved one instead of the hardware
+        self.record_dir = record_dir
+        self.recorder = None
+        self.replay = replay
+
+        # Backend (PyTorch / ONNX Runtime / OpenVINO / NCNN) is picked in config.py
+        self.detector = None
+        self.detector_error = None
+        self.detector_ready = threading.Event()
+        self.camera_probed = threading.Event()
+        self.ready = threading.Event()
+        # Inference input is always letterboxed to the model's own size, independent of any window
+        self.letterbox = Letterbox(MODEL_IMGSZ)
+        # Only the shelf band of each frame is letterboxed and inferred on
+        # (a replay starts from the configured band so it doesn't depend on what was learned since)
+        self.shelf_roi = ShelfROI(SHELF_ROI, SHELF_ROI_LEARN, SHELF_ROI_FILE if replay is None else None,
+                                  SHELF_ROI_MARGIN, full_frame_every=SHELF_ROI_FULL_FRAME_EVERY)
+        # Detections are linked across frames; an item only counts as found once its track
+        # is confirmed, which is what lets the detector skip frames.
+        self.tracker = Tracker(TRACK_CONFIRM_HITS, TRACK_MAX_MISSES, TRACK_IOU_THRESHOLD)
+        self.detect_every = max(1, DETECT_EVERY_N_FRAMES)
+        self.frames_seen = 0
+        self.frames_skipped = 0
+        # Inference rate follows the motion state reported by Wheel_funcs and the cart size
+        self.scheduler = InferenceScheduler(
+            INFERENCE_RATES, INFERENCE_BOOST_RATE, INFERENCE_BOOST_SECONDS,
+            on_change=lambda rate, motion: self.emit("inference_rate", rate=rate, motion=motion))
+        add_motion_listener(self.scheduler.set_motion)
+        # Frames that look like the last inferred one keep its result instead of being inferred again
+        self.scene_gate = SceneChangeGate(SCENE_GATE_THRESHOLD, SCENE_GATE_SIZE, SCENE_GATE_MAX_AGE)
+        # The grabber thread is the only reader of the camera; preview and detection read from its ring
+        self.grabber = None
+        self.cap = None
+        self.camera_reconnecting = False
+
+        self.is_detecting = False
+        self.navigation_active = False
+        self.detection_thread = None
+        self.navigation_thread = None
+        self.navigation = None
+        self.pipeline = None
+        self.detection_stopped = threading.Event()
+        self.detection_started_at = None
+        # Set when a mission run is over: all items found, sweep finished, error or stop
+        self.finished = threading.Event()
+
+    # --- events -------------------------------------------------------------
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def emit(self, event, **data):
+        for listener in list(self._listeners):
+            try:
+                listener(event, data)
+            except Exception as e:
+                print(f"Mission listener error on {event}: {e}")
+
+    def status(self, message):
+        self.emit("status", message=message)
+
+    # --- startup ------------------------------------------------------------
+
+    def load(self):
+        """Load the detector and probe the camera in parallel, in the background."""
+        metrics.serve()
+        threading.Thread(target=self._load_detector, name="detector-loader", daemon=True).start()
+        threading.Thread(target=self._probe_camera, name="camera-probe", daemon=True).start()
+        threading.Thread(target=self._wait_until_ready, name="mission-ready", daemon=True).start()
+
+    def _load_detector(self):
+        try:
+            start = time.monotonic()
+            detector = create_detector()
+            loaded = time.monotonic()
+            detector.warmup()
+            print(f"Detector loaded in {loaded - start:.2f} s, warm-up took {time.monotonic() - loaded:.2f} s")
+            with self.cart_lock:
+                self.detector = detector
+                self.cart_index = CartIndex(detector.names)
+                for item in self.cart:
+                    self.cart_index.add(item)
+        except Exception as e:
+            print(f"Error loading detector: {e}")
+            self.detector_error = e
+        finally:
+            self.detector_ready.set()
+
+    def _probe_camera(self):
+        try:
+            if self.replay is not None:
+                self.replay.start()
+                Pathing.set_serial(ReplaySerial(self.replay))
+                self.grabber = ReplayGrabber(self.replay)
+            else:
+                self.start_grabber()
+        finally:
+            self.camera_probed.set()
+
+    def _log_first_frame(self, frame):
+        if self.first_frame_logged:
+            return
+        self.first_frame_logged = True
+        self.grabber.remove_listener(self._log_first_frame)
+        print(f"Time to first frame: {frame.timestamp - self.started_at:.2f} s")
+
+    def _wait_until_ready(self):
+        self.detector_ready.wait()
+        self.camera_probed.wait()
+        seconds = time.monotonic() - self.started_at
+        if self.detector_error is None:
+            print(f"Ready after {seconds:.2f} s")
+        self.ready.set()
+        self.emit("ready", error=self.detector_error, seconds=seconds)
+        if self.replay is not None and self.detector_error is None:
+            # Restore the recorded mission and start it straight away
+            self.confidence_threshold = self.replay.meta.get("confidence_threshold", self.confidence_threshold)
+            self.current_aisle = self.replay.meta.get("aisle", self.current_aisle)
+            for item in self.replay.meta.get("cart", []):
+                self.add_item(item)
+            try:
+                self.start()
+            except Exception:
+                self.finished.set()
+
+    # --- camera -------------------------------------------------------------
+
+    def start_grabber(self):
+        if self.grabber:
+            self.grabber.release()
+            self.grabber = None
+        self.cap = open_camera()
+        if self.cap:
+            self.grabber = FrameGrabber(self.cap)
+            if not self.first_frame_logged:
+                self.grabber.add_listener(self._log_first_frame)
+            self.grabber.start()
+
+    def reconnect_camera(self):
+        print("Attempting to reconnect to camera...")
+        self.camera_reconnecting = True
+
+        if self.detection_thread and self.detection_thread.is_alive():
+            self.detection_stopped.set()
+            self.detection_thread.join()
+            self.detection_stopped.clear()
+
+        if self.grabber is not None:
+            self.grabber.release()
+            self.grabber = None
+            time.sleep(1)  # Give time for OS to release the camera resource
+
+        try:
+            self.cap = open_camera((0,))
+            if not self.cap or not self.cap.isOpened():
+                print("Failed to reconnect to camera.")
+                return False
+            self.grabber = FrameGrabber(self.cap)
+            self.grabber.start()
+            print("Camera reconnected successfully.")
+            return True
+        except Exception as e:
+            print(f"Error during camera reconnection: {e}")
+            self.status(f"Camera Reconnect Error: {e}")
+            return False
+        finally:
+            self.camera_reconnecting = False
+
+    # --- cart ---------------------------------------------------------------
+
+    def add_item(self, item):
+        with self.cart_lock:
+            if item in self.cart:
+                self.status(f"{item} already in cart.")
+                return False
+            self.cart.append(item)
+            if self.cart_index is not None:
+                self.cart_index.add(item)
+            cart = list(self.cart)
+        self.scheduler.set_cart_size(len(cart))
+        self.scene_gate.reset()  # The last result didn't look for this item
+        self.status(f"{item} added to cart.")
+        self.emit("cart", cart=cart)
+        return True
+
+    def remove_item(self, item):
+        with self.cart_lock:
+            if item not in self.cart:
+                return False
+            self.cart.remove(item)
+            if self.cart_index is not None:
+                self.cart_index.remove(item)
+            cart = list(self.cart)
+        self.scheduler.set_cart_size(len(cart))
+        self.emit("cart", cart=cart)
+        return True
+
+    # --- run ----------------------------------------------------------------
+
+    def start(self):
+        """Start detection and navigation. Raises IOError if the camera isn't delivering frames."""
+        try:
+            # Try to initialize camera if not already initialized
+            if not self.grabber or not self.grabber.healthy:
+                self.start_grabber()
+
+            if not self.grabber or not self.grabber.healthy:
+                raise IOError("Could not initialize any camera")
+
+            # Test camera by waiting for the grabber to deliver a frame
+            if self.replay is None and self.grabber.read("detection", timeout=2.0) is None:
+                raise IOError("Camera initialized but cannot read frames")
+
+            # If we get here, camera is working
+            self.is_detecting = True
+            self.navigation_active = True
+            self.finished.clear()
+            self.detection_stopped.clear()
+            self.searched_aisles.clear()  # Navigation starts over from the map's start
+            self.detection_started_at = time.monotonic()
+
+            # Start threads
+            self.detection_thread = threading.Thread(target=self.detect_objects, daemon=True)
+            self.detection_thread.start()
+
+            self._start_recording()
+            self.navigation_thread = threading.Thread(target=self._navigation_worker, daemon=True)
+            self.navigation_thread.start()
+            self.emit("started")
+        except Exception as e:
+            print(f"Error starting detection: {e}")
+            self.status(f"Error starting detection: {e}")
+            self.is_detecting = False
+            self.navigation_active = False
+            stop()  # Ensure motors are stopped if there's an error
+            raise
+
+    def stop(self):
+        self.is_detecting = False
+        self.navigation_active = False  # Stop navigation
+        if self.navigation is not None:
+            self.navigation.stop()
+        self.detection_stopped.set()
+        if self.replay is not None:
+            # Wake detection if it is waiting for its next replayed frame
+            for consumer in self.replay.CONSUMERS.values():
+                self.replay.finish(consumer)
+        if self.detection_thread and self.detection_thread.is_alive() \
+                and self.detection_thread is not threading.current_thread():
+            self.detection_thread.join()
+        self.detection_thread = None
+        if self.replay is not None:
+            self.replay.stop()
+        # Stop the motors when detection is stopped
+        stop()
+
+    def close(self):
+        self.stop()
+        self._stop_recording()
+        self.shelf_roi.save()
+        if self.grabber is not None:
+            self.grabber.report()
+            self.grabber.release()
+        cleanup()
+
+    def _navigation_worker(self):
+        try:
+            self.navigation = NavigationController(self)
+            self.navigation.run()
+        finally:
+            if self.replay is not None:
+                self.replay.finish("navigation")
+
+    def aisles_to_search(self):
+        """
+        Aisles navigation should cover next.
+
+        The most likely unsearched aisle of each cart item the item index knows about;
+        once those have all been searched, every unsearched aisle that may stock
+        something still in the cart.
+        """
+        with self.cart_lock:
+            items = list(self.cart)
+        if not items:
+            return set()
+        unsearched = [aisle for aisle in self.store_map.aisles if aisle not in self.searched_aisles
+                      and (self.assigned_aisles is None or aisle in self.assigned_aisles)]
+        likely = set()
+        for item in items:
+            known = [aisle for aisle, _ in self.item_index.likely_aisles(item) if aisle in unsearched]
+            if known:
+                likely.add(known[0])
+        if likely:
+            return likely
+        return {aisle for aisle in unsearched if self.store_map.may_stock(aisle, items)}
+
+    def assign_aisles(self, aisles):
+        """Only search these aisles from the next wall on (None for all of them)."""
+        self.assigned_aisles = None if aisles is None else set(aisles)
+        if self.navigation is not None:
+            self.navigation.replan()  # Sets off again if it was waiting for work
+
+    def stop_waiting_for_work(self):
+        """End the search next time navigation runs out of aisles, or now if it already has."""
+        self.wait_for_work = False
+        if self.navigation is not None:
+            self.navigation.replan()
+
+    def aisle_searched(self, aisle):
+        self.searched_aisles.add(aisle)
+        self.emit("aisle_searched", aisle=aisle)
+        # Items the index placed here that are still in the cart aren't here any more
+        with self.cart_lock:
+            items = list(self.cart)
+        for item in items:
+            if self.item_index.record_missed(item, aisle):
+                print(f"{item} was not found in Aisle {aisle} - forgetting that location.")
+
+    def update_aisle(self, aisle=None):
+        """Move to `aisle`, or to the next one when navigation doesn't say which."""
+        self.current_aisle = self.current_aisle + 1 if aisle is None else aisle
+        print(f"Now in Aisle {self.current_aisle}")
+        self.emit("aisle", aisle=self.current_aisle)
+
+    def search_idle(self, at_wall):
+        self.status("Assigned aisles searched - waiting for more.")
+        self.emit("idle", at=None if at_wall is None else list(at_wall))
+
+    def end_search(self):
+        with self.cart_lock:
+            remaining = list(self.cart)
+        self.emit("search_ended", remaining=remaining)
+        self.finished.set()
+
+    def _start_recording(self):
+        if self.record_dir is None or self.replay is not None:
+            return
+        self.recorder = SessionRecorder(self.record_dir)
+        self.recorder.start(cart=list(self.cart), confidence_threshold=self.confidence_threshold,
+                            aisle=self.current_aisle, item_index=self.item_index.snapshot(),
+                            item_index_time=self.item_index.now())
+        self.grabber.add_listener(self.recorder.record_frame)
+
+    def _stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder is None:
+            return
+        if self.grabber is not None:
+            self.grabber.remove_listener(recorder.record_frame)
+        recorder.stop()
+
+    # --- detection stages ---------------------------------------------------
+
+    def _preprocess_frame(self, grabbed):
+        if not self.cart_index.classes:
+            return None  # Nothing left to look for: skip the frame entirely
+        self.frames_seen += 1
+        if ((self.frames_seen - 1) % self.detect_every
+                or not self.scheduler.due(grabbed.timestamp)
+                or not self.scene_gate.should_infer(grabbed.image, grabbed.timestamp)):
+            # The tracker extrapolates boxes over frames the detector doesn't see
+            self.frames_skipped += 1
+            return None
+        self.scheduler.mark_run(grabbed.timestamp)
+        height, width = grabbed.image.shape[:2]
+        model_input, letterbox_info = self.letterbox(grabbed.image, self.shelf_roi.region(width, height))
+        return grabbed, model_input, letterbox_info
+
+    def _release_preprocessed(self, item):
+        self.letterbox.release(item[1])
+
+    def _run_inference(self, item):
+        grabbed, model_input, letterbox_info = item
+        # The live cart is the class filter, so NMS and postprocessing only see wanted classes
+        classes = self.cart_index.classes
+        try:
+            if not classes:
+                return None
+            detections = self.detector.predict(model_input, classes=classes)
+        finally:
+            self.letterbox.release(model_input)
+        return grabbed, letterbox_info, detections
+
+    def _handle_detections(self, item):
+        grabbed, letterbox_info, detections = item
+        if self.detection_started_at is not None:
+            print(f"Time to first detection: {time.monotonic() - self.detection_started_at:.2f} s")
+            self.detection_started_at = None
+        conf, cls = detections.conf, detections.cls
+        boxes = scale_boxes(detections.xyxy, letterbox_info)
+        confident = conf > self.confidence_threshold
+        confirmed = self.tracker.update(boxes[confident], conf[confident], cls[confident], grabbed.timestamp)
+        height, width = grabbed.image.shape[:2]
+        self.shelf_roi.observe(boxes[confident], width, height)
+        if any(not track.confirmed and track.cls in self.cart_index.ids for track in self.tracker.tracks):
+            self.scheduler.boost(grabbed.timestamp)
+
+        if self.camera_reconnecting:
+            return
+
+        with self.cart_lock:
+            found = {}
+            for track in confirmed:
+                if track.cls in self.cart_index.ids:
+                    label = self.detector.names[track.cls]
+                    found[label] = max(found.get(label, 0.0), track.conf)
+            for label in found:
+                print(f"Detected: {label}, Cart before removal: {self.cart}")
+                print(f"Removing {label} from cart.")
+                self.found_items_locations[label] = f"Aisle {self.current_aisle}"
+                self.item_index.record_seen(label, self.current_aisle, found[label])
+                self.cart_index.remove(label)
+                try:
+                    self.cart.remove(label)
+                except ValueError as e:
+                    print(f"Error removing {label} from cart: {e}, Current cart: {self.cart}")
+                    self.status(f"Error removing item: {e}")
+            cart = list(self.cart)
+        if found and self.replay is None:
+            # Glass to decision: from the frame leaving the camera to the cart being updated.
+            # Replayed frames keep their recorded timestamps, so there is nothing to measure.
+            latency = time.monotonic() - grabbed.timestamp
+            for _ in found:
+                metrics.CAPTURE_TO_CART_SECONDS.observe(latency)
+            print(f"Cart updated {1000 * latency:.0f} ms after the frame was captured")
+        if found:
+            self.scheduler.set_cart_size(len(cart))
+        for label in found:
+            self.emit("item_found", item=label, aisle=self.current_aisle, cart=cart)
+            if self.navigation is not None:
+                self.navigation.post_detection("item_found", item=label)
+        if found:
+            self.emit("cart", cart=cart)
+
+    def tracked_detections(self, timestamp):
+        """(label, conf, xyxy) for every live track, with boxes extrapolated to `timestamp`."""
+        if self.detector is None:
+            return []
+        return [(self.detector.names[track.cls], track.conf, box)
+                for track, box in self.tracker.boxes_at(timestamp)]
+
+    def _end_detection(self, reason, message):
+        self.is_detecting = False
+        self.status(message)
+        self.emit("stopped", reason=reason)
+        self.finished.set()
+
+    def detect_objects(self):
+        # Capture, preprocess, inference and postprocessing each run on their own worker;
+        # this thread only supervises the pipeline and handles mission state.
+        pipeline = DetectionPipeline(self.grabber, self._preprocess_frame, self._run_inference,
+                                     self._handle_detections, release=self._release_preprocessed)
+        self.pipeline = pipeline
+        metrics.INFERENCE_FPS.set_function(pipeline.stats["infer"].fps)
+        # A replay is stepped one frame at a time on this thread so every run sees the same frames
+        lockstep = self.replay is not None
+        if not lockstep:
+            pipeline.start()
+        self.tracker.clear()
+        last_report = last_summary = time.monotonic()
+        try:
+            while self.is_detecting and not self.detection_stopped.is_set():
+                # Check if cart is empty - if it is, stop everything
+                if not self.cart:
+                    print("Cart is empty - all items found!")
+                    self.is_detecting = False
+                    self.navigation_active = False
+                    if self.navigation is not None:
+                        self.navigation.post_detection("complete")
+                    stop()  # Stop motors
+                    self.status(f"All items found! Mission complete!\n{self.found_items_locations}")
+                    self.emit("complete", found=dict(self.found_items_locations))
+                    self.finished.set()
+                    return
+
+                if pipeline.error:
+                    stage, e = pipeline.error
+                    if stage == "infer":
+                        self._end_detection("error", f"Model error during detection: {e}")
+                    else:
+                        self._end_detection("error", "Error during detection process")
+                    return
+
+                if lockstep:
+                    if not pipeline.step():
+                        self._end_detection("replay_finished", "Replay finished.")
+                        return
+                elif not self.grabber.healthy:
+                    self._end_detection("camera_lost", "Error: Camera feed lost in detection.")
+                    return
+
+                if time.monotonic() - last_report >= 10.0:
+                    pipeline.report()
+                    print(f"Tracker: {len(self.tracker.tracks)} tracks, "
+                          f"{self.frames_skipped}/{self.frames_seen} frames left to the tracker, "
+                          f"scheduler {self.scheduler.stats()}, shelf ROI {self.shelf_roi.stats()}, "
+                          f"scene gate {self.scene_gate.stats()}")
+                    last_report = time.monotonic()
+                if METRICS_LOG_SECONDS is not None and time.monotonic() - last_summary >= METRICS_LOG_SECONDS:
+                    metrics.report()
+                    last_summary = time.monotonic()
+                if not lockstep:
+                    self.detection_stopped.wait(0.05)
+            self.emit("stopped", reason="user")
+            self.finished.set()
+        finally:
+            pipeline.stop()
+            self._stop_recording()
+            if self.replay is not None:
+                self.replay.finish("detection")
+                self.replay.report()
+            print("Detection loop ended")
+            pipeline.report()
+            if self.grabber:
+                self.grabber.report()
+            metrics.INFERENCE_FPS.set_function(None)
+            metrics.report()
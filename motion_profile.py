@@ -0,0 +1,99 @@
+"""
+Speed profiles: ramped duty-cycle changes instead of jumps.
+
+A SpeedProfile is a top speed (duty cycle, 0-100) and the rates, in duty per second, at
+which the wheels speed up to it and slow back down. A MotorStep that carries a profile
+is ramped by the motor scheduler one PWM tick (MOTION_TICK_HZ) at a time, from whatever
+the wheels were doing to the step's target.
+
+Ramping changes how far a timed move goes, so timed_move() works out the peak speed and
+step length that cover the same duty-seconds (the same distance, or the same angle when
+turning on the spot) as the old jump from 0 to a speed and back.
+
+Run this file to drive the simulated motors through a cruise/approach/stop aisle and a
+turn, and compare them with the fixed-speed commands.
+"""
+import math
+from collections import namedtuple
+
+from config import MOTION_PROFILES
+
+SpeedProfile = namedtuple("SpeedProfile", ["speed", "accel", "decel"])
+
+
+def get_profile(profile):
+    """A SpeedProfile from a name in config.MOTION_PROFILES (or one passed through)."""
+    if profile is None or isinstance(profile, SpeedProfile):
+        return profile
+    return SpeedProfile(**MOTION_PROFILES[profile])
+
+
+def ramp_seconds(start, target, rate):
+    """Seconds to go from one duty cycle to another at `rate` duty per second."""
+    if not rate:
+        return 0.0
+    return abs(target - start) / rate
+
+
+def ramp_area(speed, rate):
+    """Duty-seconds covered while ramping between rest and `speed`."""
+    return speed * speed / (2.0 * rate) if rate else 0.0
+
+
+def timed_move(area, profile):
+    """
+    (peak duty, step seconds) for a move covering `area` duty-seconds.
+
+    The step ramps up at profile.accel and holds the peak; the ramp back down at
+    profile.decel happens in the stop step after it and is included in the area. Moves
+    too short to reach profile.speed get a lower peak instead.
+    """
+    speed, accel, decel = profile
+    ramps = ramp_area(speed, accel) + ramp_area(speed, decel)
+    if area >= ramps:
+        return speed, (area - ramps) / speed + speed / accel
+    # Triangular: v^2/2a + v^2/2d = area
+    peak = math.sqrt(2.0 * area / (1.0 / accel + 1.0 / decel))
+    return peak, peak / accel
+
+
+def stopping_seconds(profile, speed=None):
+    """Seconds to ramp down to rest from `speed` (default the profile's top speed)."""
+    return ramp_seconds(profile.speed if speed is None else speed, 0, profile.decel)
+
+
+if __name__ == "__main__":
+    import os
+    import time
+
+    os.environ["SODA_HAL"] = "sim"
+    import clock
+    import hal
+    import Wheel_funcs
+    from config import APPROACH_DISTANCE_CM, WALL_DISTANCE_CM
+
+    Wheel_funcs.init_gpio()
+    world = hal.sim_world()
+    try:
+        for use_profiles in (False, True):
+            Wheel_funcs.use_profiles = use_profiles
+            label = "profiled" if use_profiles else "fixed speed"
+            world.position_cm = world.heading_deg = 0.0
+            start = clock.monotonic()
+            Wheel_funcs.forward()
+            approaching = not use_profiles
+            while world.distance_to_wall_cm() > WALL_DISTANCE_CM:
+                if not approaching and world.distance_to_wall_cm() <= APPROACH_DISTANCE_CM:
+                    approaching = True
+                    Wheel_funcs.scheduler.submit(Wheel_funcs.command_steps("forward", profile="approach"))
+                time.sleep(0.005)
+            at_wall = clock.monotonic() - start
+            Wheel_funcs.scheduler.run(Wheel_funcs.command_steps("stop", profile="approach"))
+            print(f"{label}: reached the wall after {at_wall:.2f}s, "
+                  f"overran it by {WALL_DISTANCE_CM - world.distance_to_wall_cm():.1f} cm")
+
+            world.heading_deg = 0.0
+            Wheel_funcs.turn_left()
+            print(f"{label}: turn_left turned {world.heading_deg:.1f} degrees")
+    finally:
+        Wheel_funcs.cleanup()
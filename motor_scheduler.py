@@ -0,0 +1,224 @@
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+import clock
+import session_recorder
+from config import MOTION_TICK_HZ
+
+# One timed motor setting. duration None holds it until the next sequence arrives.
+# quiet steps are part of a larger command (e.g. the stop at the end of a turn) and are
+# not logged as commands of their own. With a profile (motion_profile.SpeedProfile) the
+# wheels ramp to left/right at its accel or decel rate, within the step's duration,
+# instead of jumping there.
+MotorStep = namedtuple("MotorStep", ["name", "left", "right", "duration", "quiet", "profile"],
+                       defaults=(False, None))
+
+# What actually happened to one step: seconds from the start of its sequence, and how long it ran
+ExecutedStep = namedtuple("ExecutedStep", ["name", "requested", "started", "actual"])
+
+
+class MotorPreempted(Exception):
+    """Set on a sequence's future when an emergency stop cut it short."""
+
+    def __init__(self, executed):
+        super().__init__("Motor sequence preempted by an emergency stop")
+        self.executed = executed
+
+
+class MotorScheduler:
+    """
+    Owns the motors: every duty-cycle change is made on this scheduler's thread.
+
+    submit() queues a sequence of MotorSteps and returns a Future right away; the
+    future's result is the list of ExecutedSteps. Sequences run one after another, and a
+    held step (duration None, e.g. driving forward) ends as soon as the next sequence is
+    submitted; after shutdown() a submitted sequence fails with MotorPreempted straight
+    away. emergency_stop() stops the motors at once, cuts the running sequence short
+    (its future raises MotorPreempted) and cancels everything queued behind it.
+
+    Step timing goes through clock, so a fast replay runs sequences instantly. Each step
+    is reported to session_recorder like a Wheel_funcs command, and to `on_step`. Ramped
+    steps update the duty cycle every 1/tick_hz seconds; an emergency stop never ramps.
+    """
+
+    def __init__(self, motors, on_step=None, history=200, tick_hz=MOTION_TICK_HZ):
+        self.motors = motors
+        self.on_step = on_step
+        self.tick = 1.0 / tick_hz
+        # Duty cycles last sent to the wheels (or that would have been, during a replay)
+        self.left = 0.0
+        self.right = 0.0
+        self.history = deque(maxlen=history)  # (submitted sequence, executed steps)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._estop = False
+        self._estop_done = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="motor-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def submit(self, steps):
+        future = Future()
+        with self._cond:
+            if self._running:
+                self._queue.append((list(steps), future))
+                self._cond.notify_all()
+                return future
+        # Not running (e.g. after shutdown()): nothing would ever run the sequence, so stop the
+        # motors here and fail it at once, the way an emergency stop would have
+        if session_recorder.active_replay() is None:
+            self.motors.stop()
+        future.set_exception(MotorPreempted([]))
+        return future
+
+    def run(self, steps):
+        """submit() and wait for the sequence to finish."""
+        return self.submit(steps).result()
+
+    def emergency_stop(self, timeout=0.5):
+        """
+        Stop now, preempting the running sequence and dropping queued ones.
+
+        Returns the seconds it took the scheduler thread to stop the motors, or None if it
+        didn't within `timeout` (or isn't running, in which case the motors are stopped here).
+        """
+        requested = time.monotonic()
+        with self._cond:
+            if not self._running:
+                self.motors.stop()
+                return None
+            self._estop = True
+            self._estop_done.clear()
+            self._cond.notify_all()
+        if not self._estop_done.wait(timeout):
+            return None
+        return time.monotonic() - requested
+
+    def _drive(self, left, right, skip):
+        self.left, self.right = left, right
+        if not skip:
+            self.motors.drive(left, right)
+
+    def _apply(self, step):
+        """Start a step: ramp to its duty cycles if it has a profile. False if cut short."""
+        if self.on_step is not None:
+            self.on_step(step)
+        # During a replay the hardware is left alone, but commands are still logged
+        if step.quiet:
+            skip = session_recorder.active_replay() is not None
+        else:
+            skip = session_recorder.motor_command(step.name)
+        if step.profile is not None and not self._ramp(step, skip):
+            return False
+        self._drive(step.left, step.right, skip)
+        return True
+
+    def _ramp(self, step, skip):
+        # Called with self._cond held. Speeding up uses the profile's accel, slowing down its decel.
+        start_left, start_right = self.left, self.right
+        speeding_up = max(abs(step.left), abs(step.right)) > max(abs(start_left), abs(start_right))
+        rate = step.profile.accel if speeding_up else step.profile.decel
+        change = max(abs(step.left - start_left), abs(step.right - start_right))
+        seconds = change / rate * clock.time_scale() if rate else 0.0
+        limit = seconds if step.duration is None else min(seconds, step.duration * clock.time_scale())
+        ramp_start = time.monotonic()
+        while True:
+            elapsed = time.monotonic() - ramp_start
+            if elapsed >= seconds:
+                return True
+            if elapsed >= limit or self._estop or not self._running or (step.duration is None and self._queue):
+                return False
+            fraction = elapsed / seconds
+            self._drive(start_left + fraction * (step.left - start_left),
+                        start_right + fraction * (step.right - start_right), skip)
+            self._cond.wait(min(self.tick, limit - elapsed))
+
+    def _handle_estop(self, current=None, executed=None):
+        # Called with self._cond held
+        self._estop = False
+        self.left = self.right = 0.0
+        if session_recorder.active_replay() is None:
+            self.motors.stop()
+        self._estop_done.set()
+        if self.on_step is not None:
+            self.on_step(MotorStep("stop", 0, 0, 0, quiet=True))
+        if current is not None and not current.done():
+            current.set_exception(MotorPreempted(executed))
+        while self._queue:
+            _, future = self._queue.popleft()
+            future.cancel()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue and not self._estop:
+                    self._cond.wait()
+                if not self._running:
+                    break
+                if self._estop:
+                    self._handle_estop()
+                    continue
+                steps, future = self._queue.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+            self._run_sequence(steps, future)
+        with self._cond:
+            while self._queue:
+                _, future = self._queue.popleft()
+                future.set_exception(MotorPreempted([]))
+        if session_recorder.active_replay() is None:
+            self.motors.stop()
+
+    def _run_sequence(self, steps, future):
+        executed = []
+        start = time.monotonic()
+        for step in steps:
+            step_start = time.monotonic()
+            with self._cond:
+                if self._estop:
+                    self._handle_estop(future, executed)
+                    return
+                # A ramp can be cut short by a stop, a new sequence or the end of the step
+                applied = self._apply(step)
+                if applied and step.duration is None:
+                    # Hold until there is something else to do
+                    while self._running and not self._queue and not self._estop:
+                        self._cond.wait()
+                elif applied:
+                    deadline = step_start + step.duration * clock.time_scale()
+                    while self._running and not self._estop:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                executed.append(ExecutedStep(step.name, step.duration, round(step_start - start, 4),
+                                             round(time.monotonic() - step_start, 4)))
+                if self._estop:
+                    self._handle_estop(future, executed)
+                    self._log(steps, executed, preempted=True)
+                    return
+        self._log(steps, executed)
+        future.set_result(executed)
+
+    def _log(self, steps, executed, preempted=False):
+        self.history.append((steps, executed))
+        timed = [step for step in executed if step.requested is not None]
+        if not timed:
+            return
+        summary = ", ".join(f"{step.name} {step.requested:.2f}/{step.actual:.3f}s" for step in timed)
+        print(f"Motor sequence{' (preempted)' if preempted else ''}: {summary}")
@@ -0,0 +1,362 @@
+"""
+Event-driven aisle navigation on an asyncio loop.
+
+NavigationController replaces the polling loop in Pathing.navigate_aisles with a state
+machine fed from one queue of events:
+
+    range       a new reading from the range sensor (Pathing.get_sensor_data)
+    detection   mission results, e.g. "complete" once the cart is empty
+    command     user commands, e.g. "stop"
+
+States go drive -> wall -> turn -> next_aisle -> drive ... -> done. The route comes
+from the store map (store_map.py): at the start and again at every wall, the planner
+finds the cheapest way through the aisles that may still hold cart items, and the
+robot takes its next leg; once nothing is left to search it stops, or in a fleet
+(mission.wait_for_work) waits in the idle state until replan() brings more aisles.
+
+Aisles are driven with the "cruise" motion profile. A WallEstimator follows the
+distance and closing speed, and the robot starts ramping down as soon as that would
+bring it to rest WALL_STANDOFF_CM from the wall; once stopped, the next reading shows
+how far off the prediction was (see `braking`), and the time from the reading that
+triggered braking to the motors being at rest goes to metrics.py. Without
+PREDICTIVE_BRAKING it slows to "approach" within APPROACH_DISTANCE_CM and brakes at
+WALL_DISTANCE_CM. Turns use the "turn" profile (see motion_profile.py). Each turn is
+submitted to the motor scheduler as one timed sequence; a stop command or a completed
+cart cancels it with an emergency stop, which reaches the motors straight away instead
+of after the manoeuvre.
+
+The loop runs on the caller's thread (Mission's navigation thread); the post_*()
+methods, stop() and replan() can be called from any thread.
+"""
+import asyncio
+import threading
+import time
+
+import clock
+import metrics
+import Pathing
+import Wheel_funcs
+from config import PREDICTIVE_BRAKING, RANGE_PERIOD_MS, WALL_STANDOFF_CM
+from motion_profile import get_profile, stopping_seconds
+from motor_scheduler import MotorPreempted
+from wall_estimator import WallEstimator
+
+DRIVE = "drive"
+WALL = "wall"
+TURN = "turn"
+NEXT_AISLE = "next_aisle"
+IDLE = "idle"
+DONE = "done"
+
+# How late a braking decision can be: the next reading arrives one frame period later
+BRAKE_LATENCY = RANGE_PERIOD_MS / 1000.0
+
+
+class NavigationController:
+    def __init__(self, mission, max_turns=None, predictive=PREDICTIVE_BRAKING, standoff_cm=WALL_STANDOFF_CM):
+        self.mission = mission
+        self.store_map = mission.store_map
+        self.max_turns = max_turns  # Optional cap on top of the route
+        self.route = None
+        self.leg = None
+        self.at_wall = None  # (aisle, end) of the last wall stopped at, None while at the start
+        self.predictive = predictive
+        self.standoff_cm = standoff_cm
+        self.estimator = WallEstimator()
+        self.turn_count = 0
+        self.state = None
+        # Seconds from a stop being requested to the motors being stopped
+        self.stop_latency = None
+        # One dict per stop at a wall: where braking started, where the robot was predicted
+        # to come to rest and where it did
+        self.braking = []
+        self._brake = None
+        self._wall_seen_at = None  # timestamp of the reading that triggered braking
+        self._rest = None
+        self._rest_since = None
+        self._profile = "cruise"
+        self._loop = None
+        self._events = None
+        self._running = False
+        self._halted = False
+        self._drive_since = None
+        self._approaching = False
+        self._manoeuvre = None
+        self._want_range = threading.Event()
+
+    # --- posting, from any thread -------------------------------------------
+
+    def _post(self, kind, payload=None):
+        loop = self._loop
+        if loop is None:
+            return False
+        try:
+            loop.call_soon_threadsafe(self._events.put_nowait, (kind, payload))
+        except RuntimeError:
+            return False  # Loop already closed
+        return True
+
+    def post_detection(self, event, **data):
+        self._post("detection", (event, data))
+
+    def command(self, name):
+        self._post("command", (name, time.monotonic()))
+
+    def stop(self):
+        self.command("stop")
+
+    def replan(self):
+        """The aisles to search changed; if waiting for work (IDLE), plan again and set off."""
+        self.command("replan")
+
+    # --- loop ---------------------------------------------------------------
+
+    def run(self):
+        """Navigate until done or stopped. Blocks the calling thread."""
+        if Pathing.range_source() is None:
+            print("No Arduino connection - navigation disabled.")
+            return
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._events = asyncio.Queue()
+        self._running = True
+        threading.Thread(target=self._range_pump, name="range-pump", daemon=True).start()
+        try:
+            await self._next_leg()
+            while self.state != DONE:
+                kind, payload = await self._events.get()
+                await self._handle(kind, payload)
+        finally:
+            self._running = False
+            self._want_range.set()  # Let the pump notice
+            if self._manoeuvre is not None:
+                self._manoeuvre.cancel()
+            try:
+                await self._motors(Wheel_funcs.command_steps("stop"))
+            except MotorPreempted:
+                pass  # Already stopped: an emergency stop or the scheduler shutting down
+            self._loop = None
+
+    async def _handle(self, kind, payload):
+        if kind == "command":
+            name, requested_at = payload
+            if name == "stop":
+                print("Navigation stop requested.")
+                await self._halt(requested_at)
+            elif name == "replan" and self.state == IDLE:
+                self._set_state(NEXT_AISLE)
+                self._manoeuvre = asyncio.create_task(self._resume())
+        elif kind == "detection":
+            event, _ = payload
+            if event == "complete":
+                print("Cart complete - stopping navigation.")
+                await self._halt(time.monotonic())
+        elif kind == "range_eof":
+            self._finish_search("Range sensor stream ended.")
+        elif kind == "range":
+            if self._rest is not None:
+                # Braked for the wall; the first reading at rest shows where we ended up
+                if payload.timestamp >= self._rest_since and not self._rest.done():
+                    self._rest.set_result(payload)
+                return
+            if self.state != DRIVE or payload.timestamp < self._drive_since:
+                return
+            self.estimator.update(payload)
+            ramp = self._braking_seconds()
+            if self.predictive and self.estimator.should_brake(self.standoff_cm, ramp, BRAKE_LATENCY):
+                self._brake_for_wall(payload, ramp)
+            elif Pathing.is_wall(payload):
+                self._brake_for_wall(payload, ramp)
+            elif not self.predictive and not self._approaching and Pathing.is_approaching_wall(payload):
+                print("Approaching the wall - slowing down.")
+                self._approaching = True
+                self._profile = "approach"
+                # Replaces the cruise hold, ramping down to approach speed
+                Wheel_funcs.scheduler.submit(Wheel_funcs.command_steps("forward", profile="approach"))
+        elif kind == "manoeuvre_failed":
+            print(f"Error: {payload}")
+            await self._halt(time.monotonic())
+
+    def _set_state(self, state):
+        self.state = state
+
+    def _braking_seconds(self):
+        """How long the ramp down to rest takes from the current wheel speed."""
+        if not Wheel_funcs.use_profiles:
+            return 0.0
+        scheduler = Wheel_funcs.scheduler
+        return stopping_seconds(get_profile(self._profile), max(abs(scheduler.left), abs(scheduler.right)))
+
+    def _brake_for_wall(self, reading, ramp):
+        estimator = self.estimator
+        self._brake = {"distance_cm": round(reading.distance_mm / 10.0, 1),
+                       "closing_cm_s": round(estimator.closing_speed, 1),
+                       "time_to_standoff_s": round(estimator.time_to(self.standoff_cm), 3),
+                       # Braking starts now, so only the ramp counts towards where it stops
+                       "predicted_rest_cm": (round(estimator.predicted_rest(ramp, 0.0), 1)
+                                             if estimator.distance is not None else None)}
+        self._wall_seen_at = reading.timestamp
+        self._set_state(WALL)
+        self._manoeuvre = asyncio.create_task(self._u_turn())
+
+    def _plan(self, at_wall):
+        """Plan from here and make the route's first leg the next one. False if there is none."""
+        aisles = self.mission.aisles_to_search()
+        self.route = self.store_map.plan(aisles, at_wall)
+        if self.route is None:
+            print(f"No route reaches aisles {sorted(aisles)}.")
+        if not self.route:
+            return False
+        self.leg = self.route[0]
+        print(f"Route: aisles {[leg.aisle for leg in self.route]} "
+              f"({sum(leg.cost_cm for leg in self.route)} cm) to search {sorted(aisles)}")
+        return True
+
+    def _out_of_aisles(self):
+        if not self.mission.wait_for_work:
+            self._finish_search()
+            return
+        print("No assigned aisles left - waiting for more.")
+        self._set_state(IDLE)
+        self.mission.search_idle(self.at_wall)
+
+    def _finish_search(self, reason="No aisles left to search."):
+        print(f"{reason} Stopping navigation.")
+        self._set_state(DONE)
+        self.mission.end_search()
+        self._post("manoeuvre_done")  # Wakes the loop so it sees DONE
+
+    async def _drive(self):
+        if self.leg.aisle != self.mission.current_aisle:
+            self.mission.update_aisle(self.leg.aisle)
+        print(f"Driving along aisle {self.leg.aisle}...")
+        # Held by the scheduler until the next sequence, so it isn't awaited
+        Wheel_funcs.scheduler.submit(Wheel_funcs.command_steps("forward", profile="cruise"))
+        self._approaching = False
+        self._profile = "cruise"
+        self.estimator.reset()
+        self._set_state(DRIVE)
+        # Readings taken before this point (e.g. during the turn) are stale
+        self._drive_since = clock.monotonic()
+        self._want_range.set()
+
+    async def _u_turn(self):
+        try:
+            print("Wall detected! Braking...")
+            # Reading timestamps follow the recording in a replay, which a scaled clock
+            # (--fast) runs ahead of, so latencies only mean something in real time
+            timed = clock.time_scale() == 1.0
+            if timed:
+                metrics.WALL_BRAKE_DECISION_SECONDS.observe(clock.monotonic() - self._wall_seen_at)
+            await self._motors(Wheel_funcs.command_steps("stop", profile=self._profile))
+            if timed:
+                wall_to_stop = clock.monotonic() - self._wall_seen_at
+                metrics.WALL_TO_STOP_SECONDS.observe(wall_to_stop)
+                if self._brake is not None:
+                    self._brake["wall_to_stop_s"] = round(wall_to_stop, 3)
+            await self._measure_stop()
+            self.at_wall = (self.leg.aisle, self.leg.end)
+            self.mission.aisle_searched(self.leg.aisle)
+
+            self._set_state(NEXT_AISLE)
+            if self.max_turns is not None and self.turn_count >= self.max_turns:
+                self._finish_search(f"{self.turn_count} turns completed.")
+                return
+            await self._next_leg()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Including MotorPreempted, when another thread's stop() cut the turn short
+            self._post("manoeuvre_failed", e)
+
+    async def _resume(self):
+        """Set off again after waiting for work."""
+        try:
+            await self._next_leg()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._post("manoeuvre_failed", e)
+
+    async def _next_leg(self):
+        """Plan from where the robot is, turn into the route's first leg and drive it."""
+        if not self._plan(self.at_wall):
+            self._out_of_aisles()
+            return
+        if self.leg.turn is not None:
+            self.turn_count += 1
+            print(f"Turn {self.turn_count}: {self.leg.turn} into aisle {self.leg.aisle}")
+            self._set_state(TURN)
+            steps = []
+            for command, pause in self.leg.commands:
+                steps += Wheel_funcs.command_steps(command, pause, profile="turn")
+            await self._motors(steps)
+        await self._drive()
+
+    async def _measure_stop(self):
+        """Take one reading at rest and compare it with where braking was predicted to stop."""
+        self._rest_since = clock.monotonic()
+        self._rest = self._loop.create_future()
+        self._want_range.set()
+        try:
+            reading = await asyncio.wait_for(self._rest, 3 * RANGE_PERIOD_MS / 1000.0)
+        except asyncio.TimeoutError:
+            reading = None
+        finally:
+            self._rest = None
+            self._want_range.clear()
+        brake, self._brake = self._brake, None
+        if brake is None or reading is None or reading.distance_mm is None:
+            print("Braking: no range reading at rest.")
+            return
+        rest = reading.distance_mm / 10.0
+        brake["rest_cm"] = round(rest, 1)
+        brake["standoff_error_cm"] = round(rest - self.standoff_cm, 1)
+        if brake["predicted_rest_cm"] is not None:
+            brake["prediction_error_cm"] = round(rest - brake["predicted_rest_cm"], 1)
+        brake.update(self.estimator.stats())
+        self.braking.append(brake)
+        after = f" {brake['wall_to_stop_s']} s after that reading" if "wall_to_stop_s" in brake else ""
+        print(f"Braking: started {brake['distance_cm']:.1f} cm from the wall at {brake['closing_cm_s']:.1f} cm/s, "
+              f"predicted to stop at {brake['predicted_rest_cm']} cm, stopped at {rest:.1f} cm{after} "
+              f"(prediction error {brake.get('prediction_error_cm')} cm, "
+              f"filter residual RMS {brake['residual_rms_cm']} cm)")
+
+    async def _halt(self, requested_at):
+        """Cancel any manoeuvre and stop the motors now."""
+        self._halted = True
+        self._want_range.clear()
+        if self._manoeuvre is not None:
+            self._manoeuvre.cancel()
+        await self._loop.run_in_executor(None, Wheel_funcs.scheduler.emergency_stop)
+        self.stop_latency = time.monotonic() - requested_at
+        metrics.STOP_REQUEST_SECONDS.observe(self.stop_latency)
+        print(f"Motors stopped {1000 * self.stop_latency:.1f} ms after the request")
+        self._set_state(DONE)
+
+    # --- motors and sensors -------------------------------------------------
+
+    async def _motors(self, steps):
+        """Run a motor sequence on the scheduler without blocking the loop."""
+        if self._halted and any(step.name != "stop" for step in steps):
+            return
+        try:
+            await asyncio.wrap_future(Wheel_funcs.scheduler.submit(steps))
+        except MotorPreempted:
+            if not self._halted:
+                raise
+
+    def _range_pump(self):
+        # Only reads while driving, so a replay consumes readings exactly as the recording did
+        while self._running:
+            if not self._want_range.wait(0.1) or not self._running:
+                continue
+            try:
+                reading = Pathing.get_sensor_data()
+            except EOFError:
+                self._post("range_eof")
+                return
+            if reading is not None:
+                self._post("range", reading)
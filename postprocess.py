@@ -0,0 +1,46 @@
+class CartIndex:
+    """
+    The cart as a set of model class ids.
+
+    add()/remove() update it incrementally, so postprocessing never has to rebuild
+    anything or compare label strings per box. `classes` is the same set as a sorted
+    list, ready to hand to the detector so NMS only runs on wanted classes.
+    """
+
+    def __init__(self, names):
+        # names: the model's {class_id: label} mapping
+        self.names = dict(names)
+        self.ids_by_label = {label: class_id for class_id, label in self.names.items()}
+        self.ids = set()
+        self.classes = []
+
+    def class_id(self, label):
+        return self.ids_by_label.get(label)
+
+    def add(self, label):
+        class_id = self.class_id(label)
+        if class_id is None:
+            print(f"Warning: model has no class named {label}")
+            return False
+        self.ids.add(class_id)
+        self.classes = sorted(self.ids)
+        return True
+
+    def remove(self, label):
+        class_id = self.class_id(label)
+        if class_id is None or class_id not in self.ids:
+            return False
+        self.ids.discard(class_id)
+        self.classes = sorted(self.ids)
+        return True
+
+    def clear(self):
+        self.ids.clear()
+        self.classes = []
+
+    def __contains__(self, label):
+        return self.class_id(label) in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
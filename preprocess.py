@@ -0,0 +1,120 @@
+from collections import deque, namedtuple
+
+import cv2
+import numpy as np
+
+from config import LETTERBOX_PAD_VALUE, MODEL_IMGSZ
+
+# How a source frame (or the crop of it at offset_x, offset_y) was placed inside the letterboxed model input
+LetterboxInfo = namedtuple("LetterboxInfo", ["scale", "pad_x", "pad_y", "src_width", "src_height",
+                                             "offset_x", "offset_y"], defaults=(0, 0))
+
+# Rectangular model inputs are padded to a multiple of the YOLO stride
+STRIDE = 32
+
+
+class Letterbox:
+    """
+    Resize a camera frame straight to the model's square input size, keeping aspect ratio.
+
+    The output does not depend on the window size, so YOLO gets an image that is already
+    imgsz x imgsz and does not resize it a second time. Output and scratch buffers are
+    allocated once and reused. Each call takes a buffer out of the pool; hand it back with
+    release() once inference is done with it, so a frame still being inferred on is never
+    overwritten by the next one.
+
+    With a region of interest only that crop is resized, and the output is the smallest
+    stride-aligned rectangle holding it rather than a full square, so a PyTorch model
+    runs on fewer pixels. (Fixed-shape exports pad it back to a square themselves.)
+    """
+
+    def __init__(self, size=MODEL_IMGSZ, pad_value=LETTERBOX_PAD_VALUE, pool_size=3):
+        self.size = size
+        self.pad_value = pad_value
+        self.pool_size = pool_size
+        # Free buffers per output shape: the square one, preallocated, and the current ROI's
+        self._free = {(size, size): deque((self._new_output((size, size)) for _ in range(pool_size)),
+                                          maxlen=pool_size)}
+        self._scratch = None
+
+    def _new_output(self, shape):
+        return np.full(shape + (3,), self.pad_value, dtype=np.uint8)
+
+    def release(self, out):
+        # Buffers of a shape no longer in use are left to the garbage collector
+        free = self._free.get(out.shape[:2])
+        if free is not None:
+            free.append(out)
+
+    def geometry(self, src_width, src_height, rect=False):
+        """(info, new_width, new_height, out_width, out_height) for a source of this size."""
+        scale = min(self.size / src_width, self.size / src_height)
+        new_width = int(round(src_width * scale))
+        new_height = int(round(src_height * scale))
+        if rect:
+            out_width = min(-(-new_width // STRIDE) * STRIDE, self.size)
+            out_height = min(-(-new_height // STRIDE) * STRIDE, self.size)
+        else:
+            out_width = out_height = self.size
+        pad_x = (out_width - new_width) // 2
+        pad_y = (out_height - new_height) // 2
+        info = LetterboxInfo(scale, pad_x, pad_y, src_width, src_height)
+        return info, new_width, new_height, out_width, out_height
+
+    def __call__(self, frame, roi=None):
+        """
+        Return (model_input, info). model_input is one of the reused output buffers.
+
+        roi is an optional (x1, y1, x2, y2) pixel crop of the frame; scale_boxes() maps
+        boxes found in it back to full-frame coordinates.
+        """
+        offset_x = offset_y = 0
+        if roi is not None:
+            offset_x, offset_y, x2, y2 = roi
+            frame = frame[offset_y:y2, offset_x:x2]
+        src_height, src_width = frame.shape[:2]
+        info, new_width, new_height, out_width, out_height = self.geometry(src_width, src_height,
+                                                                           rect=roi is not None)
+        info = info._replace(offset_x=offset_x, offset_y=offset_y)
+
+        if self._scratch is None or self._scratch.shape[:2] != (new_height, new_width):
+            self._scratch = np.empty((new_height, new_width, 3), dtype=np.uint8)
+        cv2.resize(frame, (new_width, new_height), dst=self._scratch, interpolation=cv2.INTER_LINEAR)
+
+        shape = (out_height, out_width)
+        free = self._free.get(shape)
+        if free is None:
+            # The ROI changed size; buffers of its old shape won't be asked for again
+            square = (self.size, self.size)
+            self._free = {square: self._free[square], shape: deque(maxlen=self.pool_size)}
+            free = self._free[shape]
+        # Allocates past pool_size only while more than that many buffers are out
+        out = free.popleft() if free else self._new_output(shape)
+        cv2.copyMakeBorder(self._scratch,
+                           info.pad_y, out_height - new_height - info.pad_y,
+                           info.pad_x, out_width - new_width - info.pad_x,
+                           cv2.BORDER_CONSTANT, dst=out,
+                           value=(self.pad_value, self.pad_value, self.pad_value))
+        return out, info
+
+
+def scale_boxes(xyxy, info):
+    """Map (N, 4) xyxy boxes from letterboxed model coordinates back to the full source frame."""
+    boxes = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4).copy()
+    boxes[:, [0, 2]] -= info.pad_x
+    boxes[:, [1, 3]] -= info.pad_y
+    boxes /= info.scale
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, info.src_width) + info.offset_x
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, info.src_height) + info.offset_y
+    return boxes
+
+
+def preview_size(frame_width, frame_height, target_width, target_height):
+    """Largest (width, height) that fits the target area while keeping the frame's aspect ratio."""
+    if frame_width / frame_height > target_width / target_height:
+        new_width = target_width
+        new_height = int(new_width * frame_height / frame_width)
+    else:
+        new_height = target_height
+        new_width = int(new_height * frame_width / frame_height)
+    return max(new_width, 1), max(new_height, 1)
@@ -0,0 +1,161 @@
+"""
+Framed binary protocol for the ultrasonic Arduino (UltraSonicToRobot.cpp).
+
+Every PERIOD the Arduino sends one 7 byte frame:
+
+    0xA5 0x5A | seq (uint8) | distance in mm (uint16 LE) | flags (uint8) | CRC-8
+
+The CRC (polynomial 0x07) covers seq, distance and flags. Flag bit 0 means no echo
+came back before the timeout. RangeReader parses the stream on a background thread
+into a latest-value slot, so navigation always sees the newest distance without
+waiting on the serial port.
+"""
+import struct
+import threading
+import time
+from collections import namedtuple
+
+SYNC = b"\xa5\x5a"
+FRAME_SIZE = 7
+FLAG_NO_ECHO = 0x01
+NO_DISTANCE_MM = 0xFFFF
+
+# distance_mm is None when there was no echo; timestamp is time.monotonic() on arrival
+RangeReading = namedtuple("RangeReading", ["seq", "distance_mm", "flags", "timestamp"])
+
+
+def crc8(data):
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def encode_frame(seq, distance_mm=None, flags=0):
+    if distance_mm is None:
+        distance_mm = NO_DISTANCE_MM
+        flags |= FLAG_NO_ECHO
+    body = struct.pack("<BHB", seq & 0xFF, min(int(distance_mm), NO_DISTANCE_MM), flags)
+    return SYNC + body + bytes([crc8(body)])
+
+
+class FrameParser:
+    """Incremental parser: feed() it whatever bytes arrived, get complete readings back."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.frames = 0
+        self.bad_checksums = 0
+        self.skipped_bytes = 0
+        self.lost_frames = 0
+        self._last_seq = None
+
+    def feed(self, data, timestamp=None):
+        self._buffer.extend(data)
+        readings = []
+        while True:
+            start = self._buffer.find(SYNC)
+            if start < 0:
+                # Keep a trailing first sync byte, it may be the start of the next frame
+                keep = 1 if self._buffer[-1:] == SYNC[:1] else 0
+                self.skipped_bytes += len(self._buffer) - keep
+                del self._buffer[:len(self._buffer) - keep]
+                break
+            if start:
+                self.skipped_bytes += start
+                del self._buffer[:start]
+            if len(self._buffer) < FRAME_SIZE:
+                break
+            body = bytes(self._buffer[2:6])
+            if crc8(body) != self._buffer[6]:
+                # Not a real frame (or a corrupted one): resync from the next byte
+                self.bad_checksums += 1
+                self.skipped_bytes += 1
+                del self._buffer[:1]
+                continue
+            del self._buffer[:FRAME_SIZE]
+            seq, distance_mm, flags = struct.unpack("<BHB", body)
+            if self._last_seq is not None:
+                self.lost_frames += (seq - self._last_seq - 1) % 256
+            self._last_seq = seq
+            self.frames += 1
+            if flags & FLAG_NO_ECHO:
+                distance_mm = None
+            readings.append(RangeReading(seq, distance_mm, flags,
+                                         time.monotonic() if timestamp is None else timestamp))
+        return readings
+
+
+class RangeReader:
+    """
+    Reads frames from a serial port on its own thread and keeps the newest reading.
+
+    latest() never blocks. next_reading() waits (up to a timeout) for a reading newer
+    than the last one it returned, which is what a polling loop wants.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.parser = FrameParser()
+        self._latest = None
+        self._consumed = None
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._reader, name="range-reader", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+        with self._cond:
+            self._cond.notify_all()
+
+    def _reader(self):
+        if hasattr(self.port, "reset_input_buffer"):
+            self.port.reset_input_buffer()  # Drop anything queued up before we started
+        while self._running:
+            try:
+                data = self.port.read(max(1, getattr(self.port, "in_waiting", 0)))
+            except Exception as e:
+                print(f"Range reader error: {e}")
+                time.sleep(0.1)
+                continue
+            if not data:
+                continue
+            readings = self.parser.feed(data)
+            if readings:
+                with self._cond:
+                    self._latest = readings[-1]
+                    self._cond.notify_all()
+
+    def latest(self):
+        return self._latest
+
+    def next_reading(self, timeout=0.5):
+        """The newest reading not returned before, or None if none arrived within `timeout`."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._running:
+                reading = self._latest
+                if reading is not None and (reading.seq, reading.timestamp) != self._consumed:
+                    self._consumed = (reading.seq, reading.timestamp)
+                    return reading
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+        return None
+
+    def stats(self):
+        parser = self.parser
+        return {"frames": parser.frames, "lost": parser.lost_frames, "bad_checksums": parser.bad_checksums,
+                "skipped_bytes": parser.skipped_bytes}
@@ -0,0 +1,109 @@
+"""
+Fixed-rate sampling of a GPIO ultrasonic sensor on its own thread.
+
+hal.GPIOUltrasonic times the echo from edge callbacks and gives up after an echo
+timeout, so one measurement never blocks for long. RangeSampler triggers it every
+1/rate_hz seconds and keeps the last `window` samples in a ring buffer. What it
+publishes is the mean of the samples within outlier_cm of the window's median, so a
+stray echo or a missed one doesn't move the result, while a real change still comes
+through once it makes up most of the window. latest() and distance_cm() return the
+published value without waiting.
+"""
+import statistics
+import threading
+import time
+from collections import deque
+
+from config import ULTRASONIC_OUTLIER_CM, ULTRASONIC_RATE_HZ, ULTRASONIC_VALID_CM, ULTRASONIC_WINDOW
+from range_link import FLAG_NO_ECHO, RangeReading
+
+
+class RangeSampler:
+    def __init__(self, sensor, rate_hz=ULTRASONIC_RATE_HZ, window=ULTRASONIC_WINDOW,
+                 valid_cm=ULTRASONIC_VALID_CM, outlier_cm=ULTRASONIC_OUTLIER_CM):
+        self.sensor = sensor
+        self.period_ns = int(1e9 / rate_hz)
+        self.valid_cm = valid_cm
+        self.outlier_cm = outlier_cm
+        self._samples = deque(maxlen=window)  # cm, or None for no echo
+        self._latest = None
+        self._seq = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples = 0
+        self.timeouts = 0
+        self.invalid = 0
+        self.outliers = 0
+        self.overruns = 0
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="range-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def _run(self):
+        next_ns = time.monotonic_ns()
+        while not self._stop.is_set():
+            try:
+                distance = self.sensor.distance_cm()
+            except Exception as e:
+                print(f"Ultrasonic sensor error: {e}")
+                distance = None
+            self.add_sample(distance)
+            next_ns += self.period_ns
+            delay = next_ns - time.monotonic_ns()
+            if delay < 0:
+                # A slow measurement: start again from now rather than trying to catch up
+                self.overruns += 1
+                next_ns = time.monotonic_ns()
+                delay = 0
+            self._stop.wait(delay / 1e9)
+
+    def add_sample(self, distance_cm, timestamp=None):
+        """Add one raw measurement (None for no echo) and publish the filtered value."""
+        self.samples += 1
+        if distance_cm is None:
+            self.timeouts += 1
+        elif not self.valid_cm[0] <= distance_cm <= self.valid_cm[1]:
+            self.invalid += 1
+            distance_cm = None
+        self._samples.append(distance_cm)
+
+        valid = [sample for sample in self._samples if sample is not None]
+        filtered = None
+        if valid:
+            median = statistics.median(valid)
+            inliers = [sample for sample in valid if abs(sample - median) <= self.outlier_cm]
+            if distance_cm is not None and abs(distance_cm - median) > self.outlier_cm:
+                self.outliers += 1
+            filtered = sum(inliers) / len(inliers)
+        self._seq = (self._seq + 1) & 0xFF
+        # Replaced in one assignment, so readers never see a half-updated value
+        self._latest = RangeReading(self._seq, None if filtered is None else int(round(filtered * 10)),
+                                    FLAG_NO_ECHO if filtered is None else 0,
+                                    time.monotonic() if timestamp is None else timestamp)
+        return self._latest
+
+    def latest(self):
+        """The newest filtered RangeReading, or None before the first sample."""
+        return self._latest
+
+    def distance_cm(self, max_age=None):
+        """Newest filtered distance, or None if there is none (or it's older than max_age seconds)."""
+        reading = self._latest
+        if reading is None or reading.distance_mm is None:
+            return None
+        if max_age is not None and time.monotonic() - reading.timestamp > max_age:
+            return None
+        return reading.distance_mm / 10.0
+
+    def stats(self):
+        return {"samples": self.samples, "timeouts": self.timeouts, "invalid": self.invalid,
+                "outliers": self.outliers, "overruns": self.overruns}
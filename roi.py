@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class ShelfROI:
+    """
+    The band of the camera image where cans actually show up.
+
+    Inference only sees this crop (see Letterbox), so the floor, ceiling and aisle
+    walls cost the detector nothing. The band starts out as `band`, given as
+    (x0, y0, x1, y1) fractions of the frame (None for the whole frame). With learn=True
+    it is then fitted to the vertical extent of recent detections: the `quantile` and
+    1 - `quantile` of box tops and bottoms, plus `margin`. Because a cropped frame can
+    only find boxes inside the band, every `full_frame_every`-th inference still looks
+    at the whole frame so the band can grow again.
+
+    Learned samples are kept in `path` across missions.
+    """
+
+    def __init__(self, band=None, learn=True, path=None, margin=0.05, min_samples=30,
+                 full_frame_every=10, quantile=0.02, max_samples=500):
+        self.configured = tuple(band) if band is not None else None
+        self.band = self.configured
+        self.learn = learn
+        self.path = path
+        self.margin = margin
+        self.min_samples = min_samples
+        self.full_frame_every = full_frame_every
+        self.quantile = quantile
+        # (top, bottom) of each detected box as fractions of the frame height
+        self.samples = deque(maxlen=max_samples)
+        self.calls = 0
+        self.cropped = 0
+        self._lock = threading.Lock()
+        if path and learn:
+            self.load()
+
+    def region(self, width, height):
+        """Pixel (x1, y1, x2, y2) crop for the next inference, or None for the whole frame."""
+        self.calls += 1
+        band = self.band
+        if band is None:
+            return None
+        if self.learn and self.full_frame_every and self.calls % self.full_frame_every == 0:
+            return None
+        x0, y0, x1, y1 = band
+        roi = (int(x0 * width), int(y0 * height), int(np.ceil(x1 * width)), int(np.ceil(y1 * height)))
+        if roi == (0, 0, width, height) or roi[2] <= roi[0] or roi[3] <= roi[1]:
+            return None
+        self.cropped += 1
+        return roi
+
+    def observe(self, boxes, width, height):
+        """Learn from one frame's confident boxes, in full-frame pixel coordinates."""
+        if not self.learn:
+            return
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        if not len(boxes):
+            return
+        with self._lock:
+            for _, y1, _, y2 in boxes.tolist():
+                self.samples.append((y1 / height, y2 / height))
+            if len(self.samples) >= self.min_samples:
+                self.band = self._fit()
+
+    def _fit(self):
+        samples = np.asarray(self.samples)
+        top = float(np.quantile(samples[:, 0], self.quantile)) - self.margin
+        bottom = float(np.quantile(samples[:, 1], 1.0 - self.quantile)) + self.margin
+        x0, x1 = (self.configured[0], self.configured[2]) if self.configured else (0.0, 1.0)
+        return (x0, max(top, 0.0), x1, min(bottom, 1.0))
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.samples.extend(tuple(sample) for sample in data.get("samples", []))
+        except (OSError, ValueError) as e:
+            print(f"Could not load shelf ROI from {self.path}: {e}")
+            return
+        if len(self.samples) >= self.min_samples:
+            self.band = self._fit()
+            print(f"Shelf ROI loaded from {self.path}: y {self.band[1]:.2f}-{self.band[3]:.2f}")
+
+    def save(self):
+        if not (self.path and self.learn and self.samples):
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            data = {"band": self.band, "samples": [list(sample) for sample in self.samples]}
+        with open(self.path, "w") as f:
+            json.dump(data, f)
+
+    def stats(self):
+        band = None if self.band is None else [round(v, 3) for v in self.band]
+        return {"band": band, "cropped": self.cropped, "inferences": self.calls, "samples": len(self.samples)}
@@ -0,0 +1,64 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class SceneChangeGate:
+    """
+    Skips inference on frames that look the same as the last one the detector saw.
+
+    Each frame is shrunk to a small greyscale thumbnail and compared with the thumbnail
+    of the last inferred frame by mean absolute difference (0-255). Below `threshold`
+    the previous detection result still stands, so the frame is skipped; comparing
+    against the last inferred frame rather than the previous one means a slow drift
+    still adds up to a change. At most `max_age` seconds pass between inferences, so
+    nothing stays stale for long.
+    """
+
+    def __init__(self, threshold=4.0, size=(64, 48), max_age=1.0):
+        self.threshold = threshold
+        self.size = size
+        self.max_age = max_age
+        self.checked = 0
+        self.skipped = 0
+        self.last_score = None
+        self._reference = None
+        self._reference_time = None
+        # reset() comes from other threads (e.g. the GUI adding an item) while the
+        # preprocess thread is comparing against the reference
+        self._lock = threading.Lock()
+        self._thumb = np.empty((size[1], size[0]), dtype=np.uint8)
+        self._small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+
+    def _thumbnail(self, image):
+        cv2.resize(image, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._thumb)
+        return self._thumb
+
+    def should_infer(self, image, timestamp):
+        if self.threshold is None:
+            return True
+        self.checked += 1
+        thumb = self._thumbnail(image)
+        with self._lock:
+            if self._reference is not None and timestamp - self._reference_time < self.max_age:
+                self.last_score = float(cv2.absdiff(thumb, self._reference).mean())
+                if self.last_score < self.threshold:
+                    self.skipped += 1
+                    return False
+            if self._reference is None:
+                self._reference = thumb.copy()
+            else:
+                self._reference[:] = thumb
+            self._reference_time = timestamp
+            return True
+
+    def reset(self):
+        """Forget the reference frame, e.g. when what the detector looks for changes."""
+        with self._lock:
+            self._reference = None
+
+    def stats(self):
+        return {"checked": self.checked, "skipped": self.skipped,
+                "last_score": None if self.last_score is None else round(self.last_score, 2)}
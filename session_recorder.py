@@ -0,0 +1,359 @@
+"""
+Record a mission to disk and replay it later without the robot.
+
+A recording directory holds:
+    session.json   cart, confidence threshold and start time of the mission
+    frames.mp4     camera frames (compressed)
+    frames.jsonl   one {"seq", "t"} line per frame in frames.mp4
+    events.jsonl   every range reading taken by Pathing.get_sensor_data (distance in mm
+                   as a string, "" for none) and every Wheel_funcs command, as {"t", "kind", ...}
+All "t" values are time.monotonic() at the moment the hook fired.
+
+    python Main.py --record sessions/run1
+    python Main.py --replay sessions/run1 [--fast]
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+import clock
+from frame_grabber import Frame
+from range_link import RangeReading
+
+SESSION_META = "session.json"
+FRAMES_VIDEO = "frames.mp4"
+FRAMES_INDEX = "frames.jsonl"
+EVENTS = "events.jsonl"
+
+_recorder = None
+_replay = None
+
+
+def active_recorder():
+    return _recorder
+
+
+def active_replay():
+    return _replay
+
+
+def record_sensor_line(line):
+    if _recorder is not None:
+        _recorder.record_event("sensor", line=line)
+
+
+def motor_command(name):
+    """
+    Called by the motor scheduler before a command reaches the motors.
+
+    Returns True when a replay is running, in which case the caller must not touch
+    the hardware. Steps that are part of a bigger command (turn_left()'s own stop)
+    are not reported, so they don't show up as separate commands.
+    """
+    if _recorder is not None:
+        _recorder.record_event("motor", command=name)
+    if _replay is not None:
+        _replay.motor_commands.append(name)
+        return True
+    return False
+
+
+class SessionRecorder:
+    """
+    Streams frames and events to a recording directory from a background writer thread.
+
+    The record_* methods only copy data into a bounded queue, so the capture, sensor and
+    motor code never waits on the disk. If the writer falls behind, items are dropped and
+    counted rather than blocking.
+    """
+
+    def __init__(self, path, fps=30.0, max_queue=256):
+        self.path = path
+        self.fps = fps
+        self.dropped = 0
+        self.frames_written = 0
+        self.events_written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+
+    def start(self, **meta):
+        global _recorder
+        os.makedirs(self.path, exist_ok=True)
+        meta.setdefault("started_at", time.monotonic())
+        with open(os.path.join(self.path, SESSION_META), "w") as f:
+            json.dump(meta, f, indent=2)
+        self._thread = threading.Thread(target=self._writer, name="session-recorder", daemon=True)
+        self._thread.start()
+        _recorder = self
+        print(f"Recording session to {self.path}")
+
+    def stop(self):
+        global _recorder
+        if _recorder is self:
+            _recorder = None
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=10.0)
+            self._thread = None
+        print(f"Recording stopped: {self.frames_written} frames, {self.events_written} events, "
+              f"{self.dropped} dropped")
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def record_frame(self, frame):
+        # The grabber reuses its ring slots, so the image has to be copied here
+        self._put(("frame", frame.seq, frame.timestamp, frame.image.copy()))
+
+    def record_event(self, kind, **fields):
+        fields["t"] = time.monotonic()
+        fields["kind"] = kind
+        self._put(("event", fields))
+
+    def _writer(self):
+        video = None
+        with open(os.path.join(self.path, FRAMES_INDEX), "w") as index, \
+                open(os.path.join(self.path, EVENTS), "w") as events:
+            try:
+                while True:
+                    item = self._queue.get()
+                    if item is None:
+                        break
+                    if item[0] == "frame":
+                        _, seq, stamp, image = item
+                        if video is None:
+                            height, width = image.shape[:2]
+                            video = cv2.VideoWriter(os.path.join(self.path, FRAMES_VIDEO),
+                                                    cv2.VideoWriter_fourcc(*"mp4v"), self.fps, (width, height))
+                        video.write(image)
+                        index.write(json.dumps({"seq": seq, "t": stamp}) + "\n")
+                        self.frames_written += 1
+                    else:
+                        events.write(json.dumps(item[1]) + "\n")
+                        self.events_written += 1
+            finally:
+                if video is not None:
+                    video.release()
+
+
+class SessionReplay:
+    """
+    Feeds a recording back through detection and navigation deterministically.
+
+    Frames and sensor lines are merged into one timeline ordered by their recorded
+    timestamps. Detection takes frames and navigation takes sensor lines, and an event
+    is only handed out once the other consumer is idle (waiting for its next event, or
+    finished), so both see exactly the recorded interleaving no matter how long each
+    takes. With realtime=True events are also paced to the recorded timing; otherwise
+    the replay runs as fast as possible and clock.sleep() becomes a no-op.
+    """
+
+    CONSUMERS = {"frame": "detection", "sensor": "navigation"}
+
+    def __init__(self, path, realtime=True):
+        self.path = path
+        self.realtime = realtime
+        with open(os.path.join(path, SESSION_META)) as f:
+            self.meta = json.load(f)
+
+        timeline = []
+        with open(os.path.join(path, FRAMES_INDEX)) as f:
+            for line in f:
+                entry = json.loads(line)
+                timeline.append((entry["t"], "frame", entry["seq"]))
+        self.recorded_motor_commands = []
+        with open(os.path.join(path, EVENTS)) as f:
+            for line in f:
+                event = json.loads(line)
+                if event["kind"] == "sensor":
+                    timeline.append((event["t"], "sensor", event["line"]))
+                elif event["kind"] == "motor":
+                    self.recorded_motor_commands.append(event["command"])
+        # Stable sort keeps frames in video order when timestamps tie
+        timeline.sort(key=lambda event: event[0])
+        self.timeline = timeline
+
+        self.motor_commands = []
+        self.latest_frame = None
+        self._video = None
+        self._cursor = 0
+        self._waiting = set()
+        self._finished = set()
+        self._cond = threading.Condition()
+        self._wall_start = None
+
+    def start(self):
+        global _replay
+        self._video = cv2.VideoCapture(os.path.join(self.path, FRAMES_VIDEO))
+        if not self._video.isOpened():
+            raise IOError(f"Could not open {FRAMES_VIDEO} in {self.path}")
+        clock.set_time_scale(1.0 if self.realtime else 0.0)
+        self._wall_start = time.monotonic()
+        _replay = self
+        print(f"Replaying {self.path}: {len(self.timeline)} events, "
+              f"{'real time' if self.realtime else 'as fast as possible'}")
+
+    def stop(self):
+        global _replay
+        if _replay is self:
+            _replay = None
+        clock.set_time_scale(1.0)
+        # Under the lock, so a consumer can't be inside _take() reading from the capture
+        with self._cond:
+            self._finished.update(self.CONSUMERS.values())
+            self._cond.notify_all()
+            if self._video is not None:
+                self._video.release()
+                self._video = None
+
+    @property
+    def finished(self):
+        return self._cursor >= len(self.timeline)
+
+    def finish(self, consumer):
+        """Mark a consumer as done; its remaining events are skipped."""
+        with self._cond:
+            self._finished.add(consumer)
+            self._cond.notify_all()
+
+    def _take(self, kind):
+        consumer = self.CONSUMERS[kind]
+        with self._cond:
+            self._waiting.add(consumer)
+            self._cond.notify_all()
+            while True:
+                # Skip events nobody is left to consume
+                while (self._cursor < len(self.timeline)
+                       and self.CONSUMERS[self.timeline[self._cursor][1]] in self._finished
+                       and self.timeline[self._cursor][1] != kind):
+                    if self.timeline[self._cursor][1] == "frame" and self._video is not None:
+                        self._video.grab()
+                    self._cursor += 1
+                if self._cursor >= len(self.timeline) or consumer in self._finished:
+                    self._waiting.discard(consumer)
+                    self._finished.add(consumer)
+                    self._cond.notify_all()
+                    return None
+                stamp, event_kind, payload = self.timeline[self._cursor]
+                others_idle = all(other in self._waiting or other in self._finished
+                                  for other in self.CONSUMERS.values() if other != consumer)
+                if event_kind == kind and others_idle:
+                    break
+                self._cond.wait(0.05)
+            self._cursor += 1
+            self._waiting.discard(consumer)
+            image = None
+            if kind == "frame":
+                ret, image = self._video.read() if self._video is not None else (False, None)
+                if not ret:
+                    self._finished.add(consumer)
+                    self._cond.notify_all()
+                    return None
+            self._cond.notify_all()
+
+        if self.realtime:
+            delay = (stamp - self.timeline[0][0]) - (time.monotonic() - self._wall_start)
+            if delay > 0:
+                time.sleep(delay)
+        if kind == "frame":
+            self.latest_frame = Frame(payload, stamp, image)
+            return self.latest_frame
+        return stamp, payload
+
+    def next_frame(self):
+        """Next recorded frame for detection, or None when the recording is exhausted."""
+        return self._take("frame")
+
+    def next_sensor_line(self):
+        """
+        Next recorded Arduino line for navigation, or None when the recording is exhausted.
+
+        Returns (timestamp, line), with the recorded timestamp moved onto this replay's clock.
+        """
+        event = self._take("sensor")
+        if event is None:
+            return None
+        stamp, line = event
+        return self._wall_start + (stamp - self.timeline[0][0]), line
+
+    def report(self):
+        recorded, replayed = self.recorded_motor_commands, self.motor_commands
+        mismatch = next((i for i, (a, b) in enumerate(zip(recorded, replayed)) if a != b), None)
+        print(f"Replay: {len(replayed)} motor commands issued, {len(recorded)} recorded"
+              + (f", first difference at command {mismatch}: recorded {recorded[mismatch]},"
+                 f" replayed {replayed[mismatch]}" if mismatch is not None else ""))
+
+
+class ReplaySerial:
+    """Stand-in for the Arduino range reader that returns the recorded readings."""
+
+    def __init__(self, replay):
+        self.replay = replay
+        self._seq = 0
+
+    def next_reading(self, timeout=None):
+        event = self.replay.next_sensor_line()
+        if event is None:
+            raise EOFError("Replay finished")
+        timestamp, line = event
+        self._seq += 1
+        if not line:
+            return None
+        # "1" is what recordings made before the framed protocol hold for "wall in range"
+        distance_mm = 0 if line == "1" else int(line)
+        # The recorded timing, so speeds estimated from the readings match the recording
+        return RangeReading(self._seq, distance_mm, 0, timestamp)
+
+
+class ReplayGrabber:
+    """FrameGrabber stand-in: detection reads the replay timeline, preview sees the latest frame."""
+
+    def __init__(self, replay):
+        self.replay = replay
+        self._preview_seq = -1
+        self.frames_read = 0
+
+    @property
+    def healthy(self):
+        return not self.replay.finished
+
+    def read(self, reader, timeout=1.0):
+        if reader == "detection":
+            frame = self.replay.next_frame()
+            if frame is not None:
+                self.frames_read += 1
+            return frame
+        frame = self.replay.latest_frame
+        if frame is None or frame.seq == self._preview_seq:
+            return None
+        self._preview_seq = frame.seq
+        return frame
+
+    def latest(self):
+        return self.replay.latest_frame
+
+    def add_listener(self, listener):
+        pass
+
+    def remove_listener(self, listener):
+        pass
+
+    def stats(self):
+        return {"captured": self.frames_read, "read_failures": 0,
+                "readers": {"detection": {"read": self.frames_read, "dropped": 0}}}
+
+    def report(self):
+        print(f"Replay grabber: {self.frames_read} frames replayed")
+
+    def stop(self):
+        pass
+
+    def release(self):
+        pass
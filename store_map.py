@@ -0,0 +1,180 @@
+"""
+Store map and route planner.
+
+The store is a graph loaded from STORE_MAP_FILE (JSON). Every aisle has two ends,
+"front" and "back", and the robot drives an aisle from one end to the wall at the
+other. Connections join the ends of neighbouring aisles with a U-turn to the right or
+left and a crossing of `crossing_s` seconds; a connection works both ways, with the
+turns mirrored. With `turn_around_cost_cm` set, the robot may also spin round at an
+aisle end and drive the same aisle back.
+
+plan() finds the cheapest route (in cm) from where the robot is that drives through
+every aisle still to be searched, and route_commands() turns a route into the
+(command, pause) sequence Wheel_funcs runs, with ("drive", aisle) standing for driving
+forward to the wall.
+
+    {"start": [1, "front"],
+     "turn_around_cost_cm": 60,
+     "aisles": [{"id": 1, "length_cm": 300, "items": ["Coke", "Pepsi"]}, ...],
+     "connections": [{"from": [1, "back"], "to": [2, "back"], "turn": "right",
+                      "crossing_s": 1.5, "cost_cm": 60}, ...]}
+
+An aisle's "items" lists what it stocks; leave it out when that isn't known and the
+aisle is searched for anything. When the file can't be loaded, SWEEP (the fixed
+three-aisle serpentine the robot drove before there was a map) is used instead.
+"""
+import heapq
+import json
+from collections import namedtuple
+
+from config import STORE_MAP_FILE
+
+FRONT = "front"
+BACK = "back"
+OPPOSITE = {FRONT: BACK, BACK: FRONT}
+MIRROR = {"right": "left", "left": "right"}
+
+# Turning round on the spot: two quarter turns
+TURN_AROUND = (("turn_left", 0.5), ("turn_left", 0.5), ("stop", 0.5))
+
+# One turn out of the last aisle and the drive along the next one, which ends at the wall
+# at `end`. turn is "right", "left" or "around", or None for the first leg of a route
+# from the start, where the robot already faces along the aisle. commands are the turn's
+# (Wheel_funcs command, pause) pairs. search is True when the aisle still needed searching.
+RouteLeg = namedtuple("RouteLeg", ["aisle", "end", "turn", "commands", "cost_cm", "search"])
+
+# The serpentine from before store maps, in the map file's format
+SWEEP = {
+    "start": [1, FRONT],
+    "turn_around_cost_cm": 60,
+    "aisles": [{"id": aisle, "length_cm": 300} for aisle in (1, 2, 3)],
+    "connections": [
+        {"from": [1, BACK], "to": [2, BACK], "turn": "right", "crossing_s": 1.5, "cost_cm": 60},
+        {"from": [2, FRONT], "to": [3, FRONT], "turn": "left", "crossing_s": 2.0, "cost_cm": 75},
+    ],
+}
+
+
+def u_turn_commands(side, crossing_s):
+    command = f"turn_{side}"
+    return ((command, 0.5), ("forward", crossing_s), (command, 0.5), ("stop", 0.5))
+
+
+class StoreMap:
+    def __init__(self, aisles, connections=(), start=(1, FRONT), turn_around_cost_cm=None):
+        self.aisles = {aisle["id"]: aisle for aisle in aisles}
+        self.start = (start[0], start[1])
+        self.turn_around_cost_cm = turn_around_cost_cm
+        self._check_end(self.start)
+        # (aisle, end) -> [(side, commands, cost, next aisle, the end it is entered from)]
+        self._turns = {}
+        for connection in connections:
+            a, b = tuple(connection["from"]), tuple(connection["to"])
+            self._check_end(a)
+            self._check_end(b)
+            side, cost = connection["turn"], connection["cost_cm"]
+            if side not in MIRROR:
+                raise ValueError(f"Connection turn must be 'right' or 'left', not {side!r}")
+            self._turns.setdefault(a, []).append(
+                (side, u_turn_commands(side, connection["crossing_s"]), cost) + b)
+            self._turns.setdefault(b, []).append(
+                (MIRROR[side], u_turn_commands(MIRROR[side], connection["crossing_s"]), cost) + a)
+
+    def _check_end(self, end):
+        aisle, side = end
+        if aisle not in self.aisles or side not in OPPOSITE:
+            raise ValueError(f"Unknown aisle end {end!r} in the store map")
+
+    @classmethod
+    def load(cls, path=STORE_MAP_FILE):
+        with open(path) as f:
+            return cls.from_data(json.load(f))
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(data["aisles"], data.get("connections", ()), data.get("start", (1, FRONT)),
+                   data.get("turn_around_cost_cm"))
+
+    def may_stock(self, aisle, items):
+        """Whether any of `items` could be in the aisle."""
+        stock = self.aisles[aisle].get("items")
+        return stock is None or any(item in stock for item in items)
+
+    def turns_from(self, aisle, end):
+        """Ways on from the wall at one end of an aisle, as (side, commands, cost, aisle, end)."""
+        options = list(self._turns.get((aisle, end), ()))
+        if self.turn_around_cost_cm is not None:
+            options.append(("around", TURN_AROUND, self.turn_around_cost_cm, aisle, end))
+        return options
+
+    def plan(self, required, at_wall=None):
+        """
+        Cheapest route covering every aisle in `required`, as a list of RouteLegs.
+
+        at_wall is the (aisle, end) the robot has stopped at, facing the wall; None means
+        it is at the start, facing along the start aisle. Returns [] when there is nothing
+        left to search, and None when the required aisles can't all be reached.
+        """
+        required = [aisle for aisle in self.aisles if aisle in set(required)]
+        bits = {aisle: 1 << i for i, aisle in enumerate(required)}
+        goal = (1 << len(required)) - 1
+        if at_wall is None:
+            aisle, entry = self.start
+            length = self.aisles[aisle]["length_cm"]
+            first = RouteLeg(aisle, OPPOSITE[entry], None, (), length, aisle in bits)
+            start_state, start_cost, start_legs = (aisle, OPPOSITE[entry], bits.get(aisle, 0)), length, (first,)
+            if not required:
+                return []
+        else:
+            self._check_end(at_wall)
+            start_state, start_cost, start_legs = (at_wall[0], at_wall[1], 0), 0, ()
+
+        # Dijkstra over (aisle, end reached, aisles covered so far)
+        best = {start_state: start_cost}
+        queue = [(start_cost, 0, start_state, start_legs)]
+        pushed = 1
+        while queue:
+            cost, _, state, legs = heapq.heappop(queue)
+            aisle, end, covered = state
+            if covered == goal:
+                return list(legs)
+            if cost > best.get(state, float("inf")):
+                continue
+            for side, commands, turn_cost, next_aisle, entry in self.turns_from(aisle, end):
+                length = self.aisles[next_aisle]["length_cm"]
+                bit = bits.get(next_aisle, 0)
+                next_state = (next_aisle, OPPOSITE[entry], covered | bit)
+                next_cost = cost + turn_cost + length
+                if next_cost >= best.get(next_state, float("inf")):
+                    continue
+                best[next_state] = next_cost
+                leg = RouteLeg(next_aisle, OPPOSITE[entry], side, commands, turn_cost + length,
+                               bool(bit and not covered & bit))
+                heapq.heappush(queue, (next_cost, pushed, next_state, legs + (leg,)))
+                pushed += 1
+        return None
+
+
+def route_commands(route):
+    """The whole route as Wheel_funcs (command, pause) pairs, ("drive", aisle) for each aisle."""
+    commands = []
+    for leg in route:
+        commands.extend(leg.commands)
+        commands.append(("drive", leg.aisle))
+    return commands
+
+
+if __name__ == "__main__":
+    import sys
+
+    store = StoreMap.load(sys.argv[1] if len(sys.argv) > 1 else STORE_MAP_FILE)
+    wanted = [int(aisle) for aisle in sys.argv[2:]] or list(store.aisles)
+    route = store.plan(wanted)
+    if route is None:
+        print(f"No route covers aisles {wanted}")
+    else:
+        print(f"Route for aisles {wanted}: {sum(leg.cost_cm for leg in route)} cm")
+        for leg in route:
+            print(f"  {leg.turn or 'start'} -> aisle {leg.aisle} to the {leg.end}"
+                  f"{' (search)' if leg.search else ''}, {leg.cost_cm} cm")
+        print(route_commands(route))
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from fleet import FleetClient, FleetCoordinator
+from store_map import StoreMap
+
+AISLES = [{"id": aisle, "length_cm": 300} for aisle in (1, 2, 3, 4)]
+CONNECTIONS = [
+    {"from": [1, "back"], "to": [2, "back"], "turn": "right", "crossing_s": 1.5, "cost_cm": 60},
+    {"from": [2, "front"], "to": [3, "front"], "turn": "left", "crossing_s": 2.0, "cost_cm": 75},
+    {"from": [3, "back"], "to": [4, "back"], "turn": "right", "crossing_s": 1.5, "cost_cm": 60},
+]
+
+
+class FakeMission:
+    """
+    The parts of Mission that FleetClient uses, with navigation reduced to searching
+    the assigned aisles in order, `seconds` each. Like Mission it reports "idle" and
+    waits when its aisles run out while wait_for_work is set, and ends otherwise.
+    """
+
+    def __init__(self, cart, seconds):
+        self.cart = list(cart)
+        self.seconds = seconds
+        self.assigned_aisles = set()
+        self.first_assignment = None
+        self.searched = []
+        self.wait_for_work = False
+        self.finished = threading.Event()
+        self.events = []
+        self._listeners = []
+        self._wake = threading.Event()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def emit(self, event, **data):
+        self.events.append(event)
+        for listener in self._listeners:
+            listener(event, data)
+
+    def assign_aisles(self, aisles):
+        self.assigned_aisles = set(aisles)
+        if self.first_assignment is None:
+            self.first_assignment = set(aisles)
+        self._wake.set()
+
+    def remove_item(self, item):
+        self.cart.remove(item)
+
+    def stop_waiting_for_work(self):
+        self.wait_for_work = False
+        self._wake.set()
+
+    def run(self):
+        at = None
+        while True:
+            self._wake.clear()
+            todo = sorted(self.assigned_aisles - set(self.searched)) if self.cart else []
+            if not todo:
+                if not self.wait_for_work:
+                    self.emit("search_ended", remaining=list(self.cart))
+                    self.finished.set()
+                    return
+                self.emit("idle", at=at)
+                self._wake.wait(5.0)
+                continue
+            aisle = todo[0]
+            self.emit("aisle", aisle=aisle)
+            time.sleep(self.seconds)
+            self.searched.append(aisle)
+            at = [aisle, "back"]
+            self.emit("aisle_searched", aisle=aisle)
+
+
+class FleetClientTest(unittest.TestCase):
+    def test_idle_client_gets_reassigned_work(self):
+        store_map = StoreMap(AISLES, CONNECTIONS)
+        # Nothing is ever found, so every aisle has to be searched
+        fast, slow = FakeMission(["Coke"], 0.01), FakeMission(["Coke"], 0.4)
+        results = {}
+        started = threading.Event()
+
+        def coordinate():
+            async def main():
+                coordinator = await FleetCoordinator(store_map, ["Coke"], 2).start()
+                results["coordinator"] = coordinator
+                started.set()
+                results.update(await coordinator.run(timeout=10))
+            asyncio.run(main())
+
+        server = threading.Thread(target=coordinate, daemon=True)
+        server.start()
+        self.assertTrue(started.wait(5))
+        coordinator = results["coordinator"]
+        address = (coordinator.host, coordinator.port)
+        clients = [FleetClient(fast, address, "fast").start()]
+        # The first robot to say hello gets the first block, the shorter one on this map
+        deadline = time.monotonic() + 5
+        while not coordinator.robots and time.monotonic() < deadline:
+            time.sleep(0.01)
+        clients.append(FleetClient(slow, address, "slow").start())
+        for client in clients:
+            self.assertTrue(client.assigned.wait(5))
+        workers = [threading.Thread(target=mission.run, daemon=True) for mission in (fast, slow)]
+        for worker in workers:
+            worker.start()
+
+        server.join(15)
+        for worker in workers:
+            worker.join(5)
+        for client in clients:
+            client.close()
+
+        self.assertFalse(server.is_alive())
+        self.assertEqual(results["unsearched"], [])
+        self.assertEqual(sorted(fast.searched + slow.searched), [1, 2, 3, 4])
+        # The fast robot ran out, went idle and was handed aisles first given to the slow one
+        self.assertIn("idle", fast.events)
+        self.assertTrue(set(fast.searched) - fast.first_assignment)
+        self.assertTrue(set(fast.searched) - fast.first_assignment <= slow.first_assignment)
+        self.assertEqual(results["robots"]["fast"]["searched"], fast.searched)
+        # Both missions only ended once the coordinator said so
+        self.assertTrue(fast.finished.is_set() and slow.finished.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import time
+import unittest
+
+import numpy as np
+
+from frame_grabber import FrameGrabber
+
+
+class FakeCapture:
+    """Delivers a small black frame every few milliseconds, written into the caller's buffer."""
+
+    def read(self, image=None):
+        time.sleep(0.005)
+        if image is None:
+            return True, np.zeros((8, 8, 3), dtype=np.uint8)
+        image[...] = 0
+        return True, image
+
+    def release(self):
+        pass
+
+
+class FrameCounter:
+    def __init__(self):
+        self.frames = 0
+
+    def on_frame(self, frame):
+        self.frames += 1
+
+
+class ListenerTest(unittest.TestCase):
+    def setUp(self):
+        self.grabber = FrameGrabber(FakeCapture())
+
+    def tearDown(self):
+        self.grabber.release()
+
+    def wait_for_frames(self, count):
+        seq = self.grabber.frames_captured
+        deadline = time.monotonic() + 2.0
+        while self.grabber.frames_captured < seq + count and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def test_removed_bound_method_is_no_longer_called(self):
+        counter = FrameCounter()
+        self.grabber.add_listener(counter.on_frame)
+        self.grabber.start()
+        self.wait_for_frames(3)
+        self.assertGreater(counter.frames, 0)
+
+        # A fresh bound method object, as callers get from attribute access
+        self.grabber.remove_listener(counter.on_frame)
+        self.assertEqual(self.grabber._listeners, [])
+        seen = counter.frames
+        self.wait_for_frames(3)
+        self.assertEqual(counter.frames, seen)
+
+    def test_remove_keeps_other_listeners(self):
+        first, second = FrameCounter(), FrameCounter()
+        self.grabber.add_listener(first.on_frame)
+        self.grabber.add_listener(second.on_frame)
+        self.grabber.remove_listener(first.on_frame)
+        self.grabber.start()
+        self.wait_for_frames(3)
+        self.assertEqual(first.frames, 0)
+        self.assertGreater(second.frames, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import itertools
+import threading
+
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU of two (N, 4) / (M, 4) xyxy box arrays."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def _to_cxcywh(box):
+    x1, y1, x2, y2 = box
+    return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=np.float64)
+
+
+def _to_xyxy(state):
+    cx, cy, w, h = state
+    return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], dtype=np.float32)
+
+
+class Track:
+    """
+    One object followed across frames.
+
+    Each of cx, cy, w, h is an independent constant-velocity Kalman filter, so the
+    state is a (4,) position, a (4,) velocity in pixels per second and a (4, 2, 2)
+    covariance. Cheap enough to predict on every frame the detector skips.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, box, conf, cls, timestamp, position_var=10.0 ** 2, velocity_var=100.0 ** 2):
+        self.id = next(Track._ids)
+        self.cls = int(cls)
+        self.conf = float(conf)
+        self.hits = 1
+        self.misses = 0
+        self.confirmed = False
+        self.timestamp = timestamp
+        self.pos = _to_cxcywh(box)
+        self.vel = np.zeros(4)
+        self.cov = np.zeros((4, 2, 2))
+        self.cov[:, 0, 0] = position_var
+        self.cov[:, 1, 1] = velocity_var
+
+    def box_at(self, timestamp):
+        """Box extrapolated to `timestamp` without changing the track."""
+        dt = max(timestamp - self.timestamp, 0.0)
+        return _to_xyxy(self.pos + self.vel * dt)
+
+    @property
+    def box(self):
+        return _to_xyxy(self.pos)
+
+    def predict(self, timestamp, process_var):
+        dt = timestamp - self.timestamp
+        if dt <= 0:
+            return
+        self.pos = self.pos + self.vel * dt
+        p00, p01, p11 = self.cov[:, 0, 0], self.cov[:, 0, 1], self.cov[:, 1, 1]
+        # P = F P F^T + Q for F = [[1, dt], [0, 1]] and a white-noise acceleration Q
+        self.cov[:, 0, 0] = p00 + 2 * dt * p01 + dt * dt * p11 + process_var * dt ** 3 / 3
+        self.cov[:, 0, 1] = self.cov[:, 1, 0] = p01 + dt * p11 + process_var * dt ** 2 / 2
+        self.cov[:, 1, 1] = p11 + process_var * dt
+        self.timestamp = timestamp
+
+    def correct(self, box, conf, measurement_var):
+        innovation = _to_cxcywh(box) - self.pos
+        s = self.cov[:, 0, 0] + measurement_var
+        k0 = self.cov[:, 0, 0] / s
+        k1 = self.cov[:, 1, 0] / s
+        self.pos = self.pos + k0 * innovation
+        self.vel = self.vel + k1 * innovation
+        p00, p01, p11 = self.cov[:, 0, 0].copy(), self.cov[:, 0, 1].copy(), self.cov[:, 1, 1].copy()
+        self.cov[:, 0, 0] = (1 - k0) * p00
+        self.cov[:, 0, 1] = self.cov[:, 1, 0] = (1 - k0) * p01
+        self.cov[:, 1, 1] = p11 - k1 * p01
+        self.conf = float(conf)
+        self.hits += 1
+        self.misses = 0
+
+
+class Tracker:
+    """
+    Links per-frame detections into tracks by class and IoU.
+
+    A track is confirmed once it has been matched on `confirm_hits` detector frames,
+    and dropped after `max_misses` detector frames in a row without a match. Frames the
+    detector skips don't count either way: boxes are extrapolated by time instead, so
+    the detector can run on every Nth frame without one noisy frame counting as a find.
+
+    update() is meant to be called from one thread (the postprocess stage); boxes_at()
+    only reads a snapshot of the track list and is safe to call from the preview.
+    """
+
+    def __init__(self, confirm_hits=3, max_misses=3, iou_threshold=0.3,
+                 measurement_var=5.0 ** 2, process_var=200.0 ** 2):
+        self.confirm_hits = confirm_hits
+        self.max_misses = max_misses
+        self.iou_threshold = iou_threshold
+        self.measurement_var = measurement_var
+        self.process_var = process_var
+        self.tracks = []
+        self._lock = threading.Lock()
+
+    def update(self, xyxy, conf, cls, timestamp):
+        """
+        Feed one detector frame's boxes (already thresholded) taken at `timestamp`.
+
+        Returns the tracks confirmed so far.
+        """
+        xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+        cls = np.asarray(cls).reshape(-1).astype(np.intp)
+        tracks = list(self.tracks)
+        for track in tracks:
+            track.predict(timestamp, self.process_var)
+
+        unmatched = set(range(len(xyxy)))
+        matched_tracks = set()
+        if tracks and len(xyxy):
+            predicted = np.stack([track.box for track in tracks])
+            iou = iou_matrix(predicted, xyxy)
+            # Boxes of different classes never match
+            track_cls = np.array([track.cls for track in tracks])
+            iou[track_cls[:, None] != cls[None, :]] = 0.0
+            # Greedy assignment, best overlap first
+            for flat in np.argsort(iou, axis=None)[::-1]:
+                t, d = np.unravel_index(flat, iou.shape)
+                if iou[t, d] < self.iou_threshold:
+                    break
+                if t in matched_tracks or d not in unmatched:
+                    continue
+                tracks[t].correct(xyxy[d], conf[d], self.measurement_var)
+                matched_tracks.add(t)
+                unmatched.discard(d)
+
+        alive = []
+        for index, track in enumerate(tracks):
+            if index not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+            if track.hits >= self.confirm_hits:
+                track.confirmed = True
+            alive.append(track)
+        for d in sorted(unmatched):
+            track = Track(xyxy[d], conf[d], cls[d], timestamp)
+            track.confirmed = track.hits >= self.confirm_hits
+            alive.append(track)
+
+        with self._lock:
+            self.tracks = alive
+        return [track for track in alive if track.confirmed]
+
+    def boxes_at(self, timestamp):
+        """(track, xyxy) for every live track, extrapolated to `timestamp`."""
+        with self._lock:
+            tracks = list(self.tracks)
+        return [(track, track.box_at(timestamp)) for track in tracks]
+
+    def clear(self):
+        with self._lock:
+            self.tracks = []
@@ -0,0 +1,95 @@
+"""
+Distance-to-wall and closing-speed estimate from timestamped range readings.
+
+An alpha-beta filter: each reading is compared with the distance predicted from the
+last estimate and speed, and the difference (the residual) corrects both. From the
+estimate, navigation works out how far the robot would still travel if it started
+braking now, and brakes once that would bring it to rest at the standoff distance.
+
+The residuals are the filter's one-step prediction error, kept as an RMS for tuning
+alpha and beta; the braking error itself is measured by navigation once it has
+stopped.
+"""
+import math
+
+from config import WALL_ESTIMATOR_ALPHA, WALL_ESTIMATOR_BETA
+
+
+class WallEstimator:
+    def __init__(self, alpha=WALL_ESTIMATOR_ALPHA, beta=WALL_ESTIMATOR_BETA, max_gap=0.5):
+        self.alpha = alpha
+        self.beta = beta
+        self.max_gap = max_gap  # seconds; a longer gap between readings starts over
+        self.distance = None  # cm
+        self.velocity = 0.0  # cm/s, negative while approaching the wall
+        self.timestamp = None
+        self.updates = 0
+        self.residuals = 0
+        self._residual_sq = 0.0
+        self.max_residual = 0.0
+
+    def reset(self):
+        self.distance = None
+        self.velocity = 0.0
+        self.timestamp = None
+        self.updates = 0
+
+    def update(self, reading):
+        """Add a range_link.RangeReading. Readings without a distance are ignored."""
+        if reading is None or reading.distance_mm is None:
+            return
+        measured = reading.distance_mm / 10.0
+        dt = None if self.timestamp is None else reading.timestamp - self.timestamp
+        if dt is None or dt > self.max_gap:
+            self.distance = measured
+            self.velocity = 0.0
+            self.timestamp = reading.timestamp
+            self.updates = 1
+            return
+        if dt <= 0:
+            return
+        predicted = self.distance + self.velocity * dt
+        residual = measured - predicted
+        self.distance = predicted + self.alpha * residual
+        self.velocity += self.beta * residual / dt
+        self.timestamp = reading.timestamp
+        self.updates += 1
+        self.residuals += 1
+        self._residual_sq += residual * residual
+        self.max_residual = max(self.max_residual, abs(residual))
+
+    @property
+    def ready(self):
+        """True once there are enough readings for the speed to mean something."""
+        return self.updates >= 3
+
+    @property
+    def closing_speed(self):
+        """cm/s towards the wall (0 when moving away or not moving)."""
+        return max(-self.velocity, 0.0)
+
+    def time_to(self, standoff_cm):
+        """Seconds until the robot is `standoff_cm` from the wall at the current speed."""
+        if self.distance is None or self.closing_speed == 0:
+            return math.inf
+        return max(self.distance - standoff_cm, 0.0) / self.closing_speed
+
+    def stopping_distance(self, ramp_seconds, latency):
+        """cm travelled while a command takes effect (`latency`) and a linear ramp down to rest."""
+        return self.closing_speed * (latency + ramp_seconds / 2.0)
+
+    def should_brake(self, standoff_cm, ramp_seconds, latency):
+        if not self.ready:
+            return False
+        return self.distance - standoff_cm <= self.stopping_distance(ramp_seconds, latency)
+
+    def predicted_rest(self, ramp_seconds, latency):
+        """Where the robot will come to rest (cm from the wall) if it brakes now."""
+        return self.distance - self.stopping_distance(ramp_seconds, latency)
+
+    def stats(self):
+        rms = math.sqrt(self._residual_sq / self.residuals) if self.residuals else None
+        return {"distance_cm": None if self.distance is None else round(self.distance, 1),
+                "closing_cm_s": round(self.closing_speed, 1),
+                "residual_rms_cm": None if rms is None else round(rms, 2),
+                "residual_max_cm": round(self.max_residual, 2)}